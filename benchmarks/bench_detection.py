@@ -0,0 +1,217 @@
+"""偵測效能基準測試
+
+以固定的圖片集合（dataset/images/val 加上合成影格）量測各階段延遲與吞吐量，
+結果寫成 JSON，可用 benchmarks/compare.py 比較兩次 commit 的差異。
+
+    python benchmarks/bench_detection.py --batch-sizes 1 4 8 --imgsz 640 480 --threads 4
+    python benchmarks/bench_detection.py --detector hog
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT_DIR)
+
+from recognition.frame_source import SyntheticSource, list_images, read_image
+
+DEFAULT_IMAGES = os.path.join(ROOT_DIR, 'dataset', 'images', 'val')
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+PERCENTILES = (50, 95, 99)
+
+
+def current_rss_mb():
+    """目前程序的常駐記憶體（MB）
+
+    不用 ru_maxrss：那是整個程序的最高值，多個設定依序執行時後面的設定只會看到前面留下的峰值。
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(samples_ms):
+    """把一串毫秒數整理成 mean 與 p50/p95/p99"""
+    if not samples_ms:
+        return {}
+    arr = np.asarray(samples_ms)
+    summary = {'mean_ms': round(float(arr.mean()), 3)}
+    for p, value in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        summary[f'p{p}_ms'] = round(float(value), 3)
+    return summary
+
+
+def load_frames(image_dir, max_images, synthetic, synthetic_size):
+    """先把測試影格全部載入記憶體，解碼時間另外記錄，不計入偵測階段"""
+    frames, decode_ms = [], []
+    paths = list_images(image_dir, recursive=True)[:max_images] if os.path.isdir(image_dir) else []
+    for path in paths:
+        start = time.perf_counter()
+        image = read_image(path)
+        decode_ms.append((time.perf_counter() - start) * 1000)
+        if image is not None:
+            frames.append(image)
+    if synthetic:
+        width, height = synthetic_size
+        source = SyntheticSource(width, height, count=synthetic, num_buffers=1)
+        frames.extend(f.image.copy() for f in source)
+    return frames, len(paths), decode_ms
+
+
+def bench_yolo(frames, weights, batch_size, imgsz, threads, warmup):
+    from recognition.detector import DetectionEngine
+
+    engine = DetectionEngine(weights, imgsz=imgsz, batch_size=batch_size, threads=threads)
+    return bench_engine(engine, frames, warmup)
+
+
+def bench_onnx(frames, weights, threads, warmup):
+    from recognition.detector import resolve_weights
+    from recognition.onnx_backend import OnnxDetectionEngine
+
+    weights = resolve_weights(weights)
+    if not weights.endswith('.onnx'):
+        weights = os.path.splitext(weights)[0] + '.onnx'
+    engine = OnnxDetectionEngine(weights, threads=threads)
+    return bench_engine(engine, frames, warmup)
+
+
+def bench_engine(engine, frames, warmup):
+    batch_size = engine.batch_size
+    stages = {'preprocess': [], 'infer': [], 'postprocess': []}
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    for batch in batches[:warmup]:
+        engine.detect(batch)
+
+    detections = 0
+    start = time.perf_counter()
+    for batch in batches:
+        t0 = time.perf_counter()
+        meta = engine.preprocess(batch)
+        t1 = time.perf_counter()
+        results = engine.infer(len(batch))
+        t2 = time.perf_counter()
+        outputs = engine.postprocess(results, meta)
+        t3 = time.perf_counter()
+        stages['preprocess'].append((t1 - t0) * 1000)
+        stages['infer'].append((t2 - t1) * 1000)
+        stages['postprocess'].append((t3 - t2) * 1000)
+        detections += sum(len(d) for d in outputs)
+    # 引擎還在的時候量記憶體
+    return time.perf_counter() - start, stages, detections, current_rss_mb()
+
+
+def bench_hog(frames, scale, warmup):
+    from recognition.deal_with import HogPersonDetector
+
+    detector = HogPersonDetector(scale=scale)
+    for image in frames[:warmup]:
+        detector.detect(image)
+    stages = {'infer': []}
+    detections = 0
+    start = time.perf_counter()
+    for image in frames:
+        t0 = time.perf_counter()
+        detections += len(detector.detect(image))
+        stages['infer'].append((time.perf_counter() - t0) * 1000)
+    return time.perf_counter() - start, stages, detections, current_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='偵測效能基準測試')
+    parser.add_argument('--detector', choices=['yolo', 'onnx', 'hog'], default='yolo')
+    parser.add_argument('--weights', default=None, help='模型權重，預設使用 detector.DEFAULT_WEIGHTS')
+    parser.add_argument('--images', default=DEFAULT_IMAGES)
+    parser.add_argument('--max-images', type=int, default=200)
+    parser.add_argument('--synthetic', type=int, default=64, help='額外加入的合成影格數')
+    parser.add_argument('--synthetic-size', type=int, nargs=2, default=(1920, 1080), metavar=('W', 'H'))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--imgsz', type=int, nargs='+', default=[640])
+    parser.add_argument('--threads', type=int, nargs='+', default=[os.cpu_count()])
+    parser.add_argument('--hog-scale', type=float, nargs='+', default=[1.0, 0.5])
+    parser.add_argument('--warmup', type=int, default=2, help='暖機批次數，不計入結果')
+    parser.add_argument('--output', default=None, help='結果 JSON 路徑，預設為 benchmarks/results/<commit>.json')
+    args = parser.parse_args()
+
+    frames, n_files, decode_ms = load_frames(args.images, args.max_images, args.synthetic, args.synthetic_size)
+    if not frames:
+        print("沒有可用的測試影格")
+        return 1
+    print(f"測試影格: {len(frames)} 張（圖片 {n_files}，合成 {len(frames) - n_files}）")
+
+    runs = []
+    if args.detector == 'yolo':
+        configs = [
+            {'batch_size': b, 'imgsz': s, 'threads': t}
+            for t in args.threads for s in args.imgsz for b in args.batch_sizes
+        ]
+    elif args.detector == 'onnx':
+        # 輸入尺寸與批次大小在匯出時已固定（python -m training.export）
+        configs = [{'threads': t} for t in args.threads]
+    else:
+        configs = [{'scale': s} for s in args.hog_scale]
+
+    for config in configs:
+        # 上一個設定的引擎釋放後才量基準，rss_delta_mb 是這個設定的引擎與緩衝區佔用的記憶體
+        gc.collect()
+        baseline = current_rss_mb()
+        if args.detector == 'yolo':
+            elapsed, stages, detections, rss = bench_yolo(frames, args.weights, warmup=args.warmup, **config)
+        elif args.detector == 'onnx':
+            elapsed, stages, detections, rss = bench_onnx(frames, args.weights, warmup=args.warmup, **config)
+        else:
+            elapsed, stages, detections, rss = bench_hog(frames, warmup=args.warmup, **config)
+        run = {
+            'config': config,
+            'frames': len(frames),
+            'fps': round(len(frames) / elapsed, 2),
+            'detections': detections,
+            'stages': {name: summarize(samples) for name, samples in stages.items()},
+            'rss_mb': None if rss is None else round(rss, 1),
+            'rss_delta_mb': None if rss is None or baseline is None else round(rss - baseline, 1),
+        }
+        runs.append(run)
+        print(f"{config}: {run['fps']} FPS, " + ', '.join(
+            f"{name} p50={s['p50_ms']}ms p99={s['p99_ms']}ms" for name, s in run['stages'].items()
+        ))
+
+    report = {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'detector': args.detector,
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'dataset': {'images': n_files, 'synthetic': len(frames) - n_files, 'decode': summarize(decode_ms)},
+        'runs': runs,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'] or 'local'}-{args.detector}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"結果已保存到 '{output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
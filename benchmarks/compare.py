@@ -0,0 +1,48 @@
+"""比較兩份 bench_detection.py 的結果
+
+    python benchmarks/compare.py benchmarks/results/abc123-yolo.json benchmarks/results/def456-yolo.json
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    return report, {json.dumps(r['config'], sort_keys=True): r for r in report['runs']}
+
+
+def change(old, new):
+    if not old:
+        return '   n/a'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較兩次基準測試結果')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    args = parser.parse_args()
+
+    old_report, old_runs = load(args.old)
+    new_report, new_runs = load(args.new)
+    print(f"{old_report.get('commit')} -> {new_report.get('commit')}")
+
+    for key, new in new_runs.items():
+        old = old_runs.get(key)
+        if old is None:
+            print(f"{key}: 新增的設定，{new['fps']} FPS")
+            continue
+        print(f"{key}: FPS {old['fps']} -> {new['fps']} ({change(old['fps'], new['fps'])})")
+        for stage, stats in new['stages'].items():
+            before = old['stages'].get(stage, {})
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if metric in stats:
+                    print(f"    {stage:<12} {metric:<7} {before.get(metric)} -> {stats[metric]} "
+                          f"({change(before.get(metric), stats[metric])})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,21 @@
+"""視窗截圖
+
+直接執行時輸入視窗標題，截圖存到 recognition/img/image.png，請在專案根目錄以模組方式執行：
+
+    python -m recognition.capture
+"""
 import win32gui
+import win32ui
 import win32con
-import pyautogui
 import numpy as np
 import cv2
 import time
 import os
 
+from recognition.metrics import metrics
+from recognition.roi import clip_rect
+from recognition.writer import unique_name
+
 def bring_window_to_foreground(hwnd):
     """將視窗恢復並置於前景"""
     try:
@@ -18,47 +28,127 @@ def bring_window_to_foreground(hwnd):
     except Exception as e:
         print(f"將視窗置於前景時發生錯誤：{e}")
 
-def capture_window(window_title):
-    try:
-        hwnd = win32gui.FindWindow(None, window_title)
-        if not hwnd:
-            print(f"找不到視窗 '{window_title}'")
-            return None
-
+def window_rect(window_title, foreground=True):
+    """視窗在螢幕上的 (left, top, width, height)，找不到視窗時回傳 None"""
+    hwnd = win32gui.FindWindow(None, window_title)
+    if not hwnd:
+        print(f"找不到視窗 '{window_title}'")
+        return None
+    if foreground:
         bring_window_to_foreground(hwnd)
+    left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+    return left, top, right - left, bottom - top
+
+def is_blank(image, grid=16):
+    """只抽樣 grid x grid 個像素判斷是否為全黑畫面，不掃描整張影像"""
+    if image is None or image.size == 0:
+        return True
+    h, w = image.shape[:2]
+    return not image[::max(h // grid, 1), ::max(w // grid, 1)].any()
 
-        left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-        width = right - left
-        height = bottom - top
+def grab_region(left, top, width, height, out=None):
+    """只擷取螢幕上的指定區域（BGR），給定 out 時直接寫入該緩衝區
 
-        print(f"窗口位置: {left}, {top}, {right}, {bottom}")
-        print(f"窗口大小: {width} x {height}")
+    以 BitBlt 從桌面 DC 只複製這個矩形（與 test/test.py 的 capture_window 相同做法）；
+    pyautogui.screenshot(region=...) 在 Windows 上其實是擷取整個桌面後再裁切。
+    """
+    desktop = win32gui.GetDesktopWindow()
+    desktop_dc = win32gui.GetWindowDC(desktop)
+    src_dc = win32ui.CreateDCFromHandle(desktop_dc)
+    mem_dc = src_dc.CreateCompatibleDC()
+    bitmap = win32ui.CreateBitmap()
+    try:
+        bitmap.CreateCompatibleBitmap(src_dc, width, height)
+        mem_dc.SelectObject(bitmap)
+        mem_dc.BitBlt((0, 0), (width, height), src_dc, (left, top), win32con.SRCCOPY)
+        bgra = np.frombuffer(bitmap.GetBitmapBits(True), dtype=np.uint8).reshape(height, width, 4)
+        if out is not None and out.shape == (height, width, 3):
+            return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=out)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+    finally:
+        mem_dc.DeleteDC()
+        src_dc.DeleteDC()
+        win32gui.ReleaseDC(desktop, desktop_dc)
+        win32gui.DeleteObject(bitmap.GetHandle())
+
+def capture_window(window_title, rect=None, out=None, verbose=True):
+    """擷取視窗畫面；rect 為相對於視窗的 (x, y, w, h)，只擷取該區域"""
+    with metrics.span('capture'):
+        return _capture_window(window_title, rect, out, verbose)
+
+def _capture_window(window_title, rect=None, out=None, verbose=True):
+    try:
+        window = window_rect(window_title)
+        if window is None:
+            return None
+        left, top, width, height = window
 
-        # 使用 pyautogui 擷取整個屏幕
-        screenshot = pyautogui.screenshot()
-        screenshot_np = np.array(screenshot)
+        if verbose:
+            print(f"窗口位置: {left}, {top}, {left + width}, {top + height}")
+            print(f"窗口大小: {width} x {height}")
 
-        # 裁剪指定區域
-        image = screenshot_np[top:top+height, left:left+width]
+        # 只以 BitBlt 複製視窗（或其中的 rect 區域）的像素，不擷取整個螢幕
+        if rect is not None:
+            rect = clip_rect(rect, width, height)
+            if rect is None:
+                print("擷取區域在視窗範圍之外")
+                return None
+            x, y, width, height = rect
+            left, top = left + x, top + y
+        image = grab_region(left, top, width, height, out)
 
-        if image.size == 0 or np.all(image == 0):
+        if is_blank(image):
             print("截圖結果為全黑圖像")
             return None
 
-        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return image
     except Exception as e:
         print(f"擷取視窗內容時發生錯誤：{e}")
         return None
 
-def save_screenshot(image, directory='recognition/img'):
-    """保存截圖到指定目錄"""
+def capture_rois(window_title, rois, outs=None):
+    """一次擷取視窗中的多個區域（相對於視窗的 (x, y, w, h) 列表），回傳影像列表
+
+    outs 為對應的緩衝區列表，可重複使用上一次回傳的影像；區域無效或全黑時該項為 None。
+    """
+    with metrics.span('capture'):
+        try:
+            window = window_rect(window_title)
+        except Exception as e:
+            print(f"擷取視窗內容時發生錯誤：{e}")
+            return [None] * len(rois)
+        if window is None:
+            return [None] * len(rois)
+        left, top, width, height = window
+        images = []
+        for i, roi in enumerate(rois):
+            rect = clip_rect(roi, width, height)
+            if rect is None:
+                images.append(None)
+                continue
+            x, y, w, h = rect
+            image = grab_region(left + x, top + y, w, h, outs[i] if outs else None)
+            images.append(None if is_blank(image) else image)
+        return images
+
+def save_screenshot(image, directory='recognition/img', filename=None, writer=None):
+    """保存截圖到指定目錄
+
+    filename 為 None 時使用不重複的檔名；給定 writer (AsyncWriter) 時改由背景執行緒存檔（仍存到 directory）。
+    """
     try:
         if image is not None:
+            filename = os.path.join(directory, filename or unique_name('image'))
+            if writer is not None:
+                os.makedirs(directory, exist_ok=True)
+                filename = writer.submit(image, os.path.abspath(filename))
+                print(f"截圖已排入背景存檔: {filename}")
+                return filename
             if not os.path.exists(directory):
                 os.makedirs(directory)
-            filename = os.path.join(directory, 'image.png')
             cv2.imwrite(filename, image)
             print(f"截圖已保存到: {filename}")
+            return filename
         else:
             print("沒有可保存的截圖。")
     except Exception as e:
@@ -70,7 +160,8 @@ def capture_screen(window_title):
     if image is None:
         print("無法擷取視窗截圖，請檢查視窗內容或位置。")
     else:
-        save_screenshot(image)
+        # deal_with.py 讀取固定的 image.png
+        save_screenshot(image, filename='image.png')
     return image
 
 if __name__ == "__main__":
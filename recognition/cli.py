@@ -0,0 +1,146 @@
+"""valorbot 命令列入口
+
+這個模組只在頂層匯入標準函式庫，cv2、numpy、torch、ultralytics、onnxruntime、win32*
+都在實際執行對應指令時才載入，`valorbot --help` 或列出視窗不需要等待這些套件。
+
+    valorbot windows
+    valorbot capture
+    valorbot detect dataset/images/val --out recognition/img
+    valorbot warm
+    valorbot vod match.mp4 --every 10
+    valorbot corpus run screenshots/ matches/ --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def cmd_windows(args):
+    from recognition.select_window import list_windows
+
+    list_windows()
+    return 0
+
+
+def cmd_capture(args):
+    from recognition.select_window import select_window
+
+    select_window()
+    return 0
+
+
+def cmd_detect(args):
+    from recognition.detections import draw_detections
+    from recognition.detector import load_engine
+    from recognition.frame_source import list_images, read_image
+    from recognition.writer import AsyncWriter
+
+    paths = []
+    for path in args.inputs:
+        paths.extend(list_images(path, recursive=True) if os.path.isdir(path) else [path])
+    try:
+        engine = load_engine(args.weights, backend=args.backend, batch_size=args.batch_size)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    if args.tile:
+        from recognition.tiling import TiledEngine
+        engine = TiledEngine(engine, args.tile)
+
+    writer = AsyncWriter(args.out) if args.out else None
+    try:
+        for start in range(0, len(paths), engine.batch_size):
+            chunk = paths[start:start + engine.batch_size]
+            loaded = [(p, read_image(p)) for p in chunk]
+            loaded = [(p, image) for p, image in loaded if image is not None]
+            results = engine.detect([image for _, image in loaded])
+            for (path, image), detections in zip(loaded, results):
+                print(f"{path}: {', '.join(detections.labels(engine.names)) or '無'}")
+                if writer is not None:
+                    draw_detections(image, detections, engine.names)
+                    writer.submit(image, os.path.splitext(os.path.basename(path))[0] + '.png', copy=False)
+    finally:
+        if writer is not None:
+            writer.close()
+    return 0
+
+
+def cmd_warm(args):
+    """預先建立模型快取，並回報冷啟動與快取後的載入時間"""
+    from recognition.detector import load_engine
+
+    for attempt in (1, 2):
+        start = time.perf_counter()
+        try:
+            engine = load_engine(args.weights, backend=args.backend)
+        except FileNotFoundError as e:
+            print(e)
+            return 1
+        source = '（來自快取）' if getattr(engine, 'from_cache', False) else ''
+        print(f"第 {attempt} 次載入 {type(engine).__name__}: {(time.perf_counter() - start) * 1000:.1f} ms{source}")
+    return 0
+
+
+def cmd_vod(argv):
+    import vod
+
+    return vod.main(argv)
+
+
+def cmd_corpus(argv):
+    from recognition.corpus import main as corpus_main
+
+    return corpus_main(argv)
+
+
+def cmd_serve(argv):
+    from recognition.server import main as server_main
+
+    return server_main(argv)
+
+
+# 這些指令的參數（包含 --help）原樣交給各自的 main()，不經過這裡的 argparse
+PASSTHROUGH = {'vod': cmd_vod, 'corpus': cmd_corpus, 'serve': cmd_serve}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='valorbot', description='畫面擷取與物件偵測工具')
+    sub = parser.add_subparsers(dest='command')
+
+    sub.add_parser('windows', help='列出目前開啟的視窗').set_defaults(func=cmd_windows)
+    sub.add_parser('capture', help='選擇視窗並截圖（預設指令）').set_defaults(func=cmd_capture)
+
+    detect = sub.add_parser('detect', help='偵測圖片或資料夾')
+    detect.add_argument('inputs', nargs='+')
+    detect.add_argument('--weights', default=None)
+    detect.add_argument('--backend', choices=['auto', 'torch', 'onnx'], default='auto')
+    detect.add_argument('--batch-size', type=int, default=8)
+    detect.add_argument('--out', default=None, help='輸出標註後圖片的資料夾')
+    detect.add_argument('--tile', type=int, default=None, metavar='SIZE', help='分塊推論的方塊邊長（原圖像素）')
+    detect.set_defaults(func=cmd_detect)
+
+    warm = sub.add_parser('warm', help='預先建立模型快取')
+    warm.add_argument('--weights', default=None)
+    warm.add_argument('--backend', choices=['auto', 'torch', 'onnx'], default='auto')
+    warm.set_defaults(func=cmd_warm)
+
+    # 只為了出現在說明中，實際由 main() 直接轉交（見 PASSTHROUGH）
+    sub.add_parser('vod', help='離線分析比賽錄影（參數同 vod.py）', add_help=False)
+    sub.add_parser('corpus', help='多程序處理大量截圖與影片（參數同 recognition.corpus）', add_help=False)
+    sub.add_parser('serve', help='本機偵測服務（參數同 recognition.server）', add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in PASSTHROUGH:
+        return PASSTHROUGH[argv[0]](argv[1:])
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        return cmd_capture(args)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
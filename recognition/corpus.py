@@ -0,0 +1,397 @@
+"""大量截圖與 VOD 的多程序偵測
+
+輸入（資料夾、圖片、影片）切成多個工作，分給多個工作程序處理。每個程序各自載入一個模型，
+執行緒數固定為 CPU 數 / 程序數，避免彼此搶核心。工作程序把偵測結果寫進共享記憶體
+（每列 item, frame, timestamp, x1, y1, x2, y2, score, class），只把區塊名稱回傳給主程序；
+主程序讀出後寫入單一 SQLite 結果庫，每完成一個工作就 commit 一次，中斷後重新執行同一個
+指令會跳過已完成的項目。某個工作失敗（例如影片損毀）時只把該工作的項目標為 failed，
+其他工作照常進行，重新執行時會再試一次。
+
+Windows 上具名的共享記憶體在最後一個 handle 關閉時就會消失，所以工作程序建立區塊後保持開啟，
+等主程序複製完畢、登記到共用的 released 字典後，才在處理下一個工作時關閉。
+
+    python -m recognition.corpus run dataset/images screenshots/ matches/*.mp4 --workers 4
+    python -m recognition.corpus run matches/ --detector hog --every 15
+    python -m recognition.corpus summary
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from recognition.frame_source import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_DB = os.path.join(ROOT_DIR, 'runs', 'corpus', 'corpus.sqlite')
+
+# 共享記憶體中每一列的欄位
+COLUMNS = ('item', 'frame', 'timestamp', 'x1', 'y1', 'x2', 'y2', 'score', 'class_id')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    frames INTEGER,
+    elapsed REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    item_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    timestamp REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    score REAL,
+    class_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS detections_item ON detections (item_id);
+CREATE TABLE IF NOT EXISTS names (
+    class_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+'''
+
+
+def connect(path=DEFAULT_DB):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def collect_inputs(inputs):
+    """展開輸入，回傳 [(絕對路徑, 'image' 或 'video')]，依路徑排序"""
+    found = {}
+    for spec in inputs:
+        if os.path.isdir(spec):
+            for dirpath, _, filenames in os.walk(spec):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    lower = name.lower()
+                    if lower.endswith(IMAGE_EXTENSIONS):
+                        found[os.path.abspath(path)] = 'image'
+                    elif lower.endswith(VIDEO_EXTENSIONS):
+                        found[os.path.abspath(path)] = 'video'
+        elif os.path.isfile(spec):
+            found[os.path.abspath(spec)] = 'video' if spec.lower().endswith(VIDEO_EXTENSIONS) else 'image'
+        else:
+            print(f"找不到輸入: {spec}")
+    return sorted(found.items())
+
+
+def register_items(db, inputs):
+    """把輸入登記到結果庫（已存在的保留原狀態），回傳尚未完成的 [(id, path, kind)]"""
+    db.executemany('INSERT OR IGNORE INTO items (path, kind) VALUES (?, ?)', inputs)
+    db.commit()
+    paths = {path for path, _ in inputs}
+    rows = db.execute("SELECT id, path, kind FROM items WHERE status != 'done' ORDER BY id").fetchall()
+    return [(row['id'], row['path'], row['kind']) for row in rows if row['path'] in paths]
+
+
+def make_tasks(items, chunk):
+    """圖片每 chunk 張一個工作，影片每部一個工作"""
+    tasks, images = [], []
+    for item in items:
+        if item[2] == 'video':
+            tasks.append([item])
+        else:
+            images.append(item)
+            if len(images) >= chunk:
+                tasks.append(images)
+                images = []
+    if images:
+        tasks.append(images)
+    return tasks
+
+
+# ---- 工作程序 ----
+
+_worker = {}
+
+
+def _init_worker(config, threads, released):
+    """每個工作程序載入一次模型，並限制各函式庫的執行緒數"""
+    _worker['released'] = released
+    _worker['segments'] = {}
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    import cv2
+    cv2.setNumThreads(1)
+
+    if config['detector'] == 'hog':
+        from recognition.deal_with import HogPersonDetector
+        detector = HogPersonDetector(scale=config.get('hog_scale', 0.5))
+        _worker['detect'] = lambda images, indices, times: [
+            detector.detect(image, i, t) for image, i, t in zip(images, indices, times)
+        ]
+        _worker['batch_size'] = 1
+        _worker['names'] = detector.names
+    else:
+        from recognition.detector import load_engine
+        engine = load_engine(
+            config.get('weights'), backend=config['detector'] if config['detector'] != 'yolo' else 'auto',
+            imgsz=config.get('imgsz'), batch_size=config.get('batch_size', 8), threads=threads,
+        )
+        _worker['detect'] = engine.detect
+        _worker['batch_size'] = engine.batch_size
+        _worker['names'] = dict(engine.names)
+    _worker['every'] = config.get('every', 30)
+
+
+def _rows(item_id, detections):
+    rows = np.empty((len(detections), len(COLUMNS)), dtype=np.float64)
+    rows[:, 0] = item_id
+    rows[:, 1] = detections.frame_index
+    rows[:, 2] = detections.timestamp
+    rows[:, 3:7] = detections.boxes
+    rows[:, 7] = detections.scores
+    rows[:, 8] = detections.class_ids
+    return rows
+
+
+def _run_images(items):
+    from recognition.frame_source import read_image
+
+    detect, batch_size = _worker['detect'], _worker['batch_size']
+    parts, status = [], {}
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        loaded = [(item_id, read_image(path)) for item_id, path, _ in chunk]
+        for item_id, image in loaded:
+            status[item_id] = ('done', 1) if image is not None else ('failed', 0)
+        loaded = [(item_id, image) for item_id, image in loaded if image is not None]
+        if not loaded:
+            continue
+        results = detect([image for _, image in loaded], [0] * len(loaded), [0.0] * len(loaded))
+        parts.extend(_rows(item_id, d) for (item_id, _), d in zip(loaded, results))
+    return parts, status
+
+
+def _run_video(item):
+    from recognition.frame_source import VideoSource
+
+    item_id, path, _ = item
+    detect, batch_size = _worker['detect'], _worker['batch_size']
+    try:
+        source = VideoSource(path, step=_worker['every'], num_buffers=batch_size)
+    except FileNotFoundError as e:
+        print(e)
+        return [], {item_id: ('failed', 0)}
+    parts, batch, frames = [], [], 0
+
+    def flush():
+        # 影格序號以影片中的實際位置記錄
+        results = detect([f.image for f in batch], [int(round(f.timestamp * source.fps)) for f in batch],
+                         [f.timestamp for f in batch])
+        parts.extend(_rows(item_id, d) for d in results)
+        batch.clear()
+
+    try:
+        for frame in source:
+            frames += 1
+            batch.append(frame)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        source.close()
+    return parts, {item_id: ('done', frames)}
+
+
+def _release_segments():
+    """關閉主程序已經讀完的共享記憶體"""
+    segments, released = _worker['segments'], _worker['released']
+    for name in list(segments):
+        if released.pop(name, None) is not None:
+            segments.pop(name).close()
+
+
+def _process(task):
+    """處理一個工作，結果放進共享記憶體，回傳 (共享記憶體名稱, 列數, 各項目狀態, 耗時, 類別名稱)"""
+    _release_segments()
+    start = time.perf_counter()
+    if task[0][2] == 'video':
+        parts, status = _run_video(task[0])
+    else:
+        parts, status = _run_images(task)
+    rows = np.concatenate(parts) if parts else np.zeros((0, len(COLUMNS)), dtype=np.float64)
+    name = None
+    if len(rows):
+        shm = shared_memory.SharedMemory(create=True, size=rows.nbytes)
+        np.ndarray(rows.shape, dtype=np.float64, buffer=shm.buf)[:] = rows
+        name = shm.name
+        # 主程序讀取後負責 unlink，讀完之前保持開啟（見 _release_segments）
+        _worker['segments'][name] = shm
+    return name, len(rows), status, time.perf_counter() - start, _worker['names']
+
+
+# ---- 主程序 ----
+
+def _collect(db, result, released):
+    """從共享記憶體讀出結果寫入結果庫，一個工作一個交易"""
+    name, n, status, elapsed, names = result
+    rows = np.zeros((0, len(COLUMNS)), dtype=np.float64)
+    if name is not None:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            rows = np.ndarray((n, len(COLUMNS)), dtype=np.float64, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+            # 通知工作程序可以關閉自己的 handle
+            released[name] = True
+    now = time.time()
+    with db:
+        db.executemany(
+            'INSERT INTO detections (item_id, frame, timestamp, x1, y1, x2, y2, score, class_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((int(r[0]), int(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5]), float(r[6]),
+              float(r[7]), int(r[8])) for r in rows),
+        )
+        # 重新執行時先前中斷的部分結果已在 _reset_partial() 清掉，這裡只需標記完成
+        db.executemany('INSERT OR REPLACE INTO names (class_id, name) VALUES (?, ?)', names.items())
+        db.executemany(
+            'UPDATE items SET status = ?, frames = ?, elapsed = ?, finished_at = ? WHERE id = ?',
+            [(s, frames, elapsed / max(len(status), 1), now, item_id) for item_id, (s, frames) in status.items()],
+        )
+    return len(status), len(rows)
+
+
+def _mark_failed(db, task, error):
+    """工作失敗時把其中的項目標為 failed，重新執行時會再處理"""
+    print(f"\n處理失敗（{len(task)} 項，第一項 {task[0][1]}）: {error}")
+    with db:
+        db.executemany("UPDATE items SET status = 'failed', finished_at = ? WHERE id = ?",
+                       [(time.time(), item_id) for item_id, _, _ in task])
+    return len(task)
+
+
+def _reset_partial(db, items):
+    """清掉未完成項目可能留下的結果（交易保證不會有半個工作，這裡是保險）"""
+    with db:
+        db.executemany('DELETE FROM detections WHERE item_id = ?', [(item_id,) for item_id, _, _ in items])
+
+
+def run(inputs, db_path=DEFAULT_DB, workers=None, chunk=64, **config):
+    """處理整個語料，回傳統計"""
+    workers = workers or max(1, os.cpu_count() // 2)
+    threads = max(1, os.cpu_count() // workers)
+    config.setdefault('detector', 'yolo')
+
+    db = connect(db_path)
+    try:
+        items = register_items(db, collect_inputs(inputs))
+        _reset_partial(db, items)
+        tasks = make_tasks(items, chunk)
+        total = len(items)
+        print(f"待處理 {total} 項（{len(tasks)} 個工作），{workers} 個程序 x {threads} 執行緒")
+
+        stats = {'items': 0, 'detections': 0, 'failed': 0, 'tasks': len(tasks)}
+        start = time.perf_counter()
+        # spawn：工作程序不繼承主程序已載入的模型與執行緒狀態
+        context = get_context('spawn')
+        with context.Manager() as manager:
+            released = manager.dict()
+            with ProcessPoolExecutor(workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(config, threads, released)) as pool:
+                pending, queue = {}, iter(tasks)
+                try:
+                    while True:
+                        # 同時送出的工作數有上限，結果不會在主程序堆積
+                        for task in queue:
+                            pending[pool.submit(_process, task)] = task
+                            if len(pending) >= workers * 2:
+                                break
+                        if not pending:
+                            break
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            task = pending.pop(future)
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                n_failed = _mark_failed(db, task, e)
+                                stats['items'] += n_failed
+                                stats['failed'] += n_failed
+                                continue
+                            n_items, n_rows = _collect(db, result, released)
+                            stats['items'] += n_items
+                            stats['detections'] += n_rows
+                        elapsed = time.perf_counter() - start
+                        print(f"\r{stats['items']}/{total} 項，{stats['items'] / max(elapsed, 1e-9):.1f} 項/秒",
+                              end='')
+                except KeyboardInterrupt:
+                    print("\n中斷，已完成的結果已保存，重新執行同一指令即可繼續")
+                    # Python 3.8 的 shutdown() 沒有 cancel_futures
+                    for future in pending:
+                        future.cancel()
+                    pool.shutdown(wait=True)
+                    raise
+        print()
+        stats['elapsed'] = round(time.perf_counter() - start, 2)
+        return stats
+    finally:
+        db.close()
+
+
+def summary(db):
+    """各狀態的項目數與各類別的偵測數"""
+    status = {row[0]: row[1] for row in db.execute('SELECT status, COUNT(*) FROM items GROUP BY status')}
+    classes = db.execute('''
+        SELECT d.class_id, COALESCE(n.name, CAST(d.class_id AS TEXT)), COUNT(*), COUNT(DISTINCT d.item_id)
+        FROM detections d LEFT JOIN names n ON n.class_id = d.class_id
+        GROUP BY d.class_id ORDER BY d.class_id
+    ''').fetchall()
+    return status, classes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='大量截圖與 VOD 的多程序偵測')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_cmd = sub.add_parser('run', help='處理輸入（可中斷後繼續）')
+    run_cmd.add_argument('inputs', nargs='+', help='資料夾、圖片或影片')
+    run_cmd.add_argument('--workers', type=int, default=None, help='程序數，預設為 CPU 數的一半')
+    run_cmd.add_argument('--chunk', type=int, default=64, help='每個工作的圖片數')
+    run_cmd.add_argument('--detector', choices=['yolo', 'onnx', 'torch', 'hog'], default='yolo')
+    run_cmd.add_argument('--weights', default=None)
+    run_cmd.add_argument('--imgsz', type=int, default=None, help='預設 640，或建議設定檔中的尺寸')
+    run_cmd.add_argument('--batch-size', type=int, default=8)
+    run_cmd.add_argument('--every', type=int, default=30, help='影片每幾張影格偵測一次')
+    sub.add_parser('summary', help='顯示結果庫統計')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        try:
+            stats = run(args.inputs, args.db, args.workers, args.chunk, detector=args.detector,
+                        weights=args.weights, imgsz=args.imgsz, batch_size=args.batch_size, every=args.every)
+        except KeyboardInterrupt:
+            return 130
+        print(f"完成 {stats['items']} 項（失敗 {stats['failed']}），{stats['detections']} 個偵測結果，"
+              f"耗時 {stats['elapsed']} 秒 -> '{args.db}'")
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"找不到結果庫: {args.db}")
+        return 1
+    db = connect(args.db)
+    try:
+        status, classes = summary(db)
+    finally:
+        db.close()
+    print('  '.join(f"{k}: {v}" for k, v in sorted(status.items())) or '沒有項目')
+    for class_id, name, count, items in classes:
+        print(f"  {name:<12} {count:>8} 個框  {items:>7} 項")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,150 @@
+"""HOG 人形偵測
+
+直接執行時讀取 recognition/img/image.png 並標出人形，請在專案根目錄以模組方式執行：
+
+    python -m recognition.deal_with
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
 
+from recognition.detections import Detections, draw_detections
+
+# HOG 只有一個類別
+HOG_NAMES = {0: 'person'}
+
+
+class HogPersonDetector:
+    """可重複使用的 HOG 人形偵測器
+
+    HOGDescriptor 只建立一次。scale < 1 時先縮小再掃描，rois 可限制只掃描部分區域
+    （xyxy 列表），結果一律換算回原圖座標並以 Detections 回傳。
+    用過 detect_batch 後要呼叫 close()（或以 with 使用）關閉程序池。
+    """
+
+    def __init__(self, scale=1.0, rois=None, win_stride=(8, 8), padding=(2, 2), pyramid_scale=1.05, min_score=0.0):
+        self.scale = scale
+        self.rois = rois
+        self.win_stride = win_stride
+        self.padding = padding
+        self.pyramid_scale = pyramid_scale
+        self.min_score = min_score
+        self.names = HOG_NAMES
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        self._pool = None
+
+    def _scan(self, gray, offset_x, offset_y):
+        if self.scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        # HOG 視窗為 64x128，區域太小時直接略過
+        if gray.shape[0] < 128 or gray.shape[1] < 64:
+            return Detections.empty()
+        rects, weights = self.hog.detectMultiScale(
+            gray, winStride=self.win_stride, padding=self.padding, scale=self.pyramid_scale,
+        )
+        if len(rects) == 0:
+            return Detections.empty()
+        rects = np.asarray(rects, dtype=np.float32)
+        boxes = np.concatenate([rects[:, :2], rects[:, :2] + rects[:, 2:]], axis=1)
+        detections = Detections(boxes, np.asarray(weights).reshape(-1), np.zeros(len(rects)))
+        return detections.rescale(1.0 / self.scale, offset_x=offset_x, offset_y=offset_y)
+
+    def detect(self, image, frame_index=0, timestamp=0.0):
+        """偵測單張 BGR 影像"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self.rois:
+            h, w = gray.shape
+            parts = []
+            for x1, y1, x2, y2 in self.rois:
+                x1, y1 = max(int(x1), 0), max(int(y1), 0)
+                x2, y2 = min(int(x2), w), min(int(y2), h)
+                if x2 <= x1 or y2 <= y1:
+                    # 區域完全在影像之外
+                    continue
+                parts.append(self._scan(gray[y1:y2, x1:x2], x1, y1))
+            detections = Detections.concat(parts).nms(0.5)
+        else:
+            detections = self._scan(gray, 0, 0)
+        detections.frame_index = frame_index
+        detections.timestamp = timestamp
+        return detections.filter(min_score=self.min_score)
+
+    def detect_batch(self, images, processes=None):
+        """以多個程序平行偵測一批影像，每個程序各自持有一個偵測器
+
+        程序池在第一次呼叫時建立並重複使用；processes 與目前的程序池不同時重新建立。
+        """
+        processes = processes or os.cpu_count()
+        if self._pool is not None and processes != self._processes:
+            self.close()
+        if self._pool is None:
+            self._processes = processes
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._processes,
+                initializer=_init_worker, initargs=(self._config(),),
+            )
+        chunksize = max(1, len(images) // (self._processes * 4))
+        results = list(self._pool.map(_detect_in_worker, images, chunksize=chunksize))
+        for i, detections in enumerate(results):
+            detections.frame_index = i
+        return results
+
+    def _config(self):
+        return dict(
+            scale=self.scale, rois=self.rois, win_stride=self.win_stride, padding=self.padding,
+            pyramid_scale=self.pyramid_scale, min_score=self.min_score,
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# 程序池中每個工作程序的偵測器
+_worker_detector = None
+
+
+def _init_worker(config):
+    global _worker_detector
+    cv2.setNumThreads(1)  # 平行度由程序池提供，避免 OpenCV 再開執行緒搶 CPU
+    _worker_detector = HogPersonDetector(**config)
+
+
+def _detect_in_worker(image):
+    return _worker_detector.detect(image)
+
+
+_default_detector = None
+
+
 def detect_and_save_person(image):
     """檢測圖像中的人形，並將結果儲存到新檔案"""
-    # 讀取預訓練的人形檢測模型
-    hog = cv2.HOGDescriptor()
-    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
-
-    # 使用 HOG 模型檢測圖像中的人形
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    boxes, weights = hog.detectMultiScale(gray_image, winStride=(8, 8), padding=(2, 2), scale=1.05)
+    global _default_detector
+    # 預訓練的人形檢測模型只建立一次
+    if _default_detector is None:
+        _default_detector = HogPersonDetector()
+    detections = _default_detector.detect(image)
 
     # 如果檢測到人形，將其框起來並儲存結果
-    if len(boxes) > 0:
-        for (x, y, w, h) in boxes:
-            cv2.rectangle(image, (x, y), (x+w, y+h), (0, 255, 0), 2)
+    if len(detections) > 0:
+        draw_detections(image, detections, HOG_NAMES)
         # 儲存帶有檢測結果的圖像
         output_file = 'recognition/img/deal.png'
         cv2.imwrite(output_file, image)
         print(f"檢測結果已保存為 '{output_file}'")
     else:
         print("未檢測到人形")
+    return detections
 
 if __name__ == "__main__":
     # 讀取截圖圖像
@@ -0,0 +1,142 @@
+import numpy as np
+import cv2
+
+
+def box_iou(a, b):
+    """計算兩組 xyxy 框的 IoU 矩陣，a 為 Nx4、b 為 Mx4，回傳 NxM"""
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold=0.45, classes=None):
+    """非極大值抑制，回傳保留下來的索引（依分數由高到低）
+
+    IoU 一次以矩陣算好；給定 classes 時會把不同類別的框平移開來，只在同類別內抑制。
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if classes is not None:
+        offset = classes.astype(np.float32)[:, None] * (boxes.max() + 1)
+        boxes = boxes + offset
+    order = np.argsort(-scores, kind='stable')
+    ious = box_iou(boxes[order], boxes[order])
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        suppressed[i + 1:] |= ious[i, i + 1:] > iou_threshold
+    return order[~suppressed]
+
+
+class Detections:
+    """單一影格的偵測結果，以陣列儲存
+
+    boxes:      Nx4 float32，原圖座標的 xyxy
+    scores:     N float32 信心值
+    class_ids:  N int32 類別編號
+    frame_index、timestamp 對應來源影格（見 frame_source.Frame）
+    carried_from: 沿用自哪一張影格的推論結果（見 gate.FrameGate），None 表示本影格實際推論
+    """
+
+    __slots__ = ('boxes', 'scores', 'class_ids', 'frame_index', 'timestamp', 'carried_from')
+
+    def __init__(self, boxes, scores, class_ids, frame_index=0, timestamp=0.0, carried_from=None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int32).reshape(-1)
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+        self.carried_from = carried_from
+
+    @classmethod
+    def empty(cls, frame_index=0, timestamp=0.0):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), frame_index, timestamp)
+
+    @classmethod
+    def concat(cls, items, frame_index=None, timestamp=None):
+        """合併多個 Detections（例如多個 ROI 或分塊的結果）"""
+        items = list(items)
+        if not items:
+            return cls.empty(frame_index or 0, timestamp or 0.0)
+        first = items[0]
+        return cls(
+            np.concatenate([d.boxes for d in items]),
+            np.concatenate([d.scores for d in items]),
+            np.concatenate([d.class_ids for d in items]),
+            first.frame_index if frame_index is None else frame_index,
+            first.timestamp if timestamp is None else timestamp,
+        )
+
+    def __len__(self):
+        return len(self.scores)
+
+    @property
+    def carried(self):
+        return self.carried_from is not None
+
+    def carry(self, frame_index, timestamp):
+        """沿用到另一張影格：共用陣列，只換影格序號與時間戳"""
+        source = self.frame_index if self.carried_from is None else self.carried_from
+        return Detections(self.boxes, self.scores, self.class_ids, frame_index, timestamp, source)
+
+    def __getitem__(self, index):
+        """以布林遮罩、索引陣列或 slice 取出子集合"""
+        return Detections(self.boxes[index], self.scores[index], self.class_ids[index],
+                          self.frame_index, self.timestamp, self.carried_from)
+
+    def __repr__(self):
+        return f"Detections(n={len(self)}, frame_index={self.frame_index}, timestamp={self.timestamp:.3f})"
+
+    def filter(self, classes=None, min_score=None):
+        """依類別與最低信心值篩選"""
+        mask = np.ones(len(self), dtype=bool)
+        if classes is not None:
+            mask &= np.isin(self.class_ids, np.asarray(classes))
+        if min_score is not None:
+            mask &= self.scores >= min_score
+        return self[mask]
+
+    def nms(self, iou_threshold=0.45, class_agnostic=False):
+        """在同一影格內做 NMS，去除重疊的重複框"""
+        keep = nms(self.boxes, self.scores, iou_threshold, None if class_agnostic else self.class_ids)
+        return self[keep]
+
+    def merge(self, others, iou_threshold=0.45, class_agnostic=False):
+        """與其他結果合併後做 NMS"""
+        return Detections.concat([self, *others], self.frame_index, self.timestamp).nms(iou_threshold, class_agnostic)
+
+    def rescale(self, scale_x, scale_y=None, offset_x=0.0, offset_y=0.0):
+        """座標換算：new = box * scale + offset，用於縮圖或裁切後的結果還原"""
+        scale_y = scale_x if scale_y is None else scale_y
+        boxes = self.boxes * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+        boxes += np.array([offset_x, offset_y, offset_x, offset_y], dtype=np.float32)
+        return Detections(boxes, self.scores, self.class_ids, self.frame_index, self.timestamp, self.carried_from)
+
+    def has_class(self, names, name):
+        """是否含有指定名稱的類別，names 為模型的 {id: name}"""
+        ids = [i for i, n in names.items() if n == name]
+        return bool(ids) and bool(np.isin(self.class_ids, ids).any())
+
+    def labels(self, names):
+        """產生每個框的標籤文字"""
+        return [
+            f'{names.get(int(c), f"Class {int(c)}")}: {s:.2f}'
+            for c, s in zip(self.class_ids, self.scores)
+        ]
+
+
+def draw_detections(image, detections, names, color=(0, 255, 0)):
+    """在 image 上就地畫出所有框與標籤，框線以單次 polylines 呼叫完成"""
+    if len(detections) == 0:
+        return image
+    b = detections.boxes.astype(np.int32)
+    polygons = np.stack([b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]], axis=1)
+    cv2.polylines(image, list(polygons), True, color, 2)
+    for (x1, y1), label in zip(b[:, :2], detections.labels(names)):
+        cv2.putText(image, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return image
@@ -0,0 +1,261 @@
+import json
+import os
+
+import numpy as np
+import cv2
+
+from recognition.detections import Detections
+from recognition.metrics import metrics
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_WEIGHTS = os.path.join(ROOT_DIR, 'yolov8', 'runs', 'detect', 'train', 'weights', 'best.pt')
+# training.sweep --apply 寫出的建議設定（模型檔、後端、輸入尺寸、執行緒數）
+DETECT_CONFIG = os.path.join(ROOT_DIR, 'runs', 'detect_config.json')
+
+
+def resolve_weights(weights=None):
+    """決定要載入的權重：明確指定 > 訓練登錄表中選定的模型 > DEFAULT_WEIGHTS"""
+    if weights:
+        return weights
+    try:
+        from training.registry import current_weights
+        weights = current_weights()
+    except ImportError:
+        weights = None
+    return weights or DEFAULT_WEIGHTS
+
+
+# letterbox 填充色，與 ultralytics 訓練時相同
+PAD_VALUE = 114
+
+
+def letterbox(image, size, out, interpolation=None):
+    """等比例縮放 image 並置中貼到 out（size x size x 3），回傳 (scale, pad_x, pad_y)
+
+    out 是預先配置好的緩衝區，不會另外配置整張輸出影像。
+    interpolation 預設縮小用 INTER_AREA、放大用 INTER_LINEAR。
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+
+    out[:pad_y] = PAD_VALUE
+    out[pad_y + new_h:] = PAD_VALUE
+    out[pad_y:pad_y + new_h, :pad_x] = PAD_VALUE
+    out[pad_y:pad_y + new_h, pad_x + new_w:] = PAD_VALUE
+    if (new_w, new_h) == (w, h):
+        out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    else:
+        if interpolation is None:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    return scale, pad_x, pad_y
+
+
+def unletterbox(boxes, scale, pad_x, pad_y, shape):
+    """把 letterbox 座標的 xyxy 框（就地）轉回原圖座標並裁切到圖片範圍內"""
+    boxes[:, [0, 2]] -= pad_x
+    boxes[:, [1, 3]] -= pad_y
+    boxes /= scale
+    np.clip(boxes[:, 0::2], 0, shape[1], out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, shape[0], out=boxes[:, 1::2])
+    return boxes
+
+
+class DetectionEngine:
+    """常駐的 YOLOv8 偵測引擎
+
+    模型、裝置與輸入緩衝區只在建立時準備一次，之後每次 detect() 都重複使用。
+    多張影格會以 batch_size 為單位合併成同一次前向運算。
+    """
+
+    def __init__(self, weights=None, imgsz=640, batch_size=8, conf=0.25, iou=0.45, device=None, threads=None):
+        import torch
+        from ultralytics import YOLO
+
+        self.torch = torch
+        self.weights = resolve_weights(weights)
+        if not os.path.exists(self.weights):
+            raise FileNotFoundError(f"模型權重檔案不存在: {self.weights}")
+        if threads:
+            torch.set_num_threads(threads)
+
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self.conf = conf
+        self.iou = iou
+
+        self.model = YOLO(self.weights)
+        self.names = self.model.names
+
+        # HWC uint8 暫存區給 letterbox 寫入，NCHW float 張量給模型；GPU 時使用 pinned memory 加速傳輸
+        self._staging = np.full((batch_size, imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+        pin = self.device.type == 'cuda'
+        self._input = torch.empty((batch_size, 3, imgsz, imgsz), dtype=torch.float32, pin_memory=pin)
+
+    def preprocess(self, images):
+        """把最多 batch_size 張影像 letterbox 到暫存區，回傳各張的還原參數"""
+        meta = []
+        with metrics.span('preprocess'):
+            for i, image in enumerate(images):
+                scale, pad_x, pad_y = letterbox(image, self.imgsz, self._staging[i])
+                meta.append((scale, pad_x, pad_y, image.shape[:2]))
+        return meta
+
+    def infer(self, n):
+        """對暫存區前 n 張影像執行一次前向運算"""
+        return self.infer_letterboxed(self._staging[:n])
+
+    def infer_letterboxed(self, images):
+        """對已 letterbox 的影像執行一次前向運算
+
+        images 可以是 NHWC 陣列，或是各自獨立的 HWC 緩衝區列表（管線中由前處理階段產生），
+        數量不可超過 batch_size。
+        """
+        torch = self.torch
+        batch = self._input[:len(images)]
+        with metrics.span('infer'):
+            # HWC BGR uint8 -> CHW RGB float，直接寫入預先配置的輸入張量
+            if isinstance(images, np.ndarray):
+                batch.copy_(torch.from_numpy(images).permute(0, 3, 1, 2).flip(1))
+            else:
+                for i, image in enumerate(images):
+                    batch[i].copy_(torch.from_numpy(image).permute(2, 0, 1).flip(0))
+            batch.div_(255.0)
+            with torch.inference_mode():
+                tensor = batch.to(self.device, non_blocking=True)
+                results = self.model.predict(tensor, conf=self.conf, iou=self.iou, imgsz=self.imgsz, verbose=False)
+        metrics.incr('frames_inferred', len(images))
+        metrics.set_gauge('batch_size', len(images))
+        return results
+
+    def postprocess(self, results, meta, frame_indices=None, timestamps=None):
+        """把模型輸出轉成原圖座標的 Detections"""
+        outputs = []
+        with metrics.span('postprocess'):
+            for i, (result, (scale, pad_x, pad_y, shape)) in enumerate(zip(results, meta)):
+                data = result.boxes.data.cpu().numpy()
+                boxes = np.ascontiguousarray(data[:, :4], dtype=np.float32)
+                unletterbox(boxes, scale, pad_x, pad_y, shape)
+                outputs.append(Detections(
+                    boxes, data[:, 4], data[:, 5],
+                    frame_indices[i] if frame_indices is not None else i,
+                    timestamps[i] if timestamps is not None else 0.0,
+                ))
+        return outputs
+
+    def detect(self, images, frame_indices=None, timestamps=None):
+        """偵測一串影像，每 batch_size 張合併成一次前向運算，回傳 Detections 列表"""
+        outputs = []
+        for start in range(0, len(images), self.batch_size):
+            end = start + self.batch_size
+            chunk = images[start:end]
+            meta = self.preprocess(chunk)
+            results = self.infer(len(chunk))
+            outputs.extend(self.postprocess(
+                results, meta,
+                range(start, start + len(chunk)) if frame_indices is None else frame_indices[start:end],
+                None if timestamps is None else timestamps[start:end],
+            ))
+        return outputs
+
+    def detect_frames(self, frames):
+        """偵測 frame_source.Frame 列表，結果帶有對應的序號與時間戳"""
+        return self.detect(
+            [f.image for f in frames],
+            [f.index for f in frames],
+            [f.timestamp for f in frames],
+        )
+
+    def detect_one(self, image):
+        """偵測單張影像"""
+        return self.detect([image])[0]
+
+
+def resolve_model(weights=None, backend='auto', imgsz=None):
+    """決定實際要載入的模型檔與後端，回傳 (path, 'onnx' | 'torch')
+
+    backend='auto'（或 None）時，若 best.pt 旁已有匯出的 best.onnx 且有安裝 onnxruntime，會優先使用 ONNX；
+    但指定的 imgsz 與匯出時固定的輸入尺寸不同時，仍使用 PyTorch。
+    """
+    weights = resolve_weights(weights)
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    backend = backend or 'auto'
+    if backend == 'auto' and not weights.endswith('.onnx') and os.path.exists(onnx_path):
+        try:
+            import onnxruntime  # noqa: F401
+            backend = 'onnx'
+        except ImportError:
+            backend = 'torch'
+        if backend == 'onnx' and imgsz is not None:
+            from recognition.onnx_backend import read_export_meta
+            try:
+                exported = read_export_meta(onnx_path)['imgsz']
+            except (OSError, KeyError, ValueError):
+                exported = imgsz
+            if exported != imgsz:
+                print(f"'{os.path.basename(onnx_path)}' 匯出時的輸入尺寸為 {exported}，與指定的 {imgsz} 不同，改用 PyTorch")
+                backend = 'torch'
+    if backend == 'onnx' or weights.endswith('.onnx'):
+        return (weights if weights.endswith('.onnx') else onnx_path), 'onnx'
+    return weights, 'torch'
+
+
+def load_config(path=DETECT_CONFIG):
+    """讀取建議的偵測設定，沒有設定檔時回傳 None"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def resolve_settings(weights=None, backend=None, imgsz=None, config=DETECT_CONFIG):
+    """決定要載入的模型檔、後端、輸入尺寸與建議執行緒數，回傳 (path, backend, imgsz, threads)，未指定的 imgsz 為 None
+
+    沒有指定 weights 時套用建議設定檔（見 training.sweep）中沒有被明確指定的項目：
+    backend 與 imgsz 為 None 表示未指定（backend='auto' 也接受設定檔的後端）。明確指定的後端或輸入尺寸
+    與設定檔的匯出模型不符時，改用設定檔記錄的原始權重。config=None 停用。
+    """
+    threads = None
+    settings = load_config(config) if weights is None else None
+    if settings:
+        weights = settings['weights']
+        if imgsz is None:
+            imgsz = settings['imgsz']
+        if backend in (None, 'auto'):
+            # ONNX 模型的輸入尺寸在匯出時已固定，指定了別的尺寸只能用 PyTorch
+            backend = 'torch' if settings['backend'] == 'onnx' and imgsz != settings['imgsz'] else settings['backend']
+        if settings['backend'] == 'onnx' and (backend != 'onnx' or imgsz != settings['imgsz']):
+            weights = settings.get('source') or weights
+        threads = settings.get('threads')
+        print(f"套用偵測設定 '{config}'：{os.path.basename(weights)}（{backend}，輸入 {imgsz}"
+              f"{f'，{threads} 執行緒' if threads else ''}）")
+    path, backend = resolve_model(weights, backend, imgsz)
+    return path, backend, imgsz, threads
+
+
+def load_engine(weights=None, backend=None, config=DETECT_CONFIG, imgsz=None, **kwargs):
+    """建立偵測引擎：.onnx 權重（或 backend='onnx'）使用 ONNX Runtime，否則使用 PyTorch
+
+    模型檔、後端與輸入尺寸的決定方式見 resolve_settings；設定檔的執行緒數只在呼叫端沒有指定時套用。
+    ONNX 模型的輸入尺寸與批次大小在匯出時已固定，指定的值不同時會印出提醒。
+    """
+    path, backend, imgsz, threads = resolve_settings(weights, backend, imgsz, config)
+    if threads and not kwargs.get('threads'):
+        kwargs['threads'] = threads
+    if backend == 'onnx':
+        from recognition.onnx_backend import OnnxDetectionEngine
+
+        batch_size = kwargs.pop('batch_size', None)
+        kwargs.pop('device', None)
+        engine = OnnxDetectionEngine(path, **kwargs)
+        for name, requested, exported in (('輸入尺寸', imgsz, engine.imgsz), ('批次大小', batch_size, engine.batch_size)):
+            if requested is not None and requested != exported:
+                print(f"注意：'{os.path.basename(path)}' 的{name}在匯出時固定為 {exported}，指定的 {requested} 不會生效"
+                      f"（python -m training.export 重新匯出，或用 --backend torch）")
+        return engine
+    if imgsz is not None:
+        kwargs['imgsz'] = imgsz
+    return DetectionEngine(path, **kwargs)
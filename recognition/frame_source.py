@@ -0,0 +1,272 @@
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import cv2
+
+from recognition.metrics import metrics
+
+# 單一影格：影像 (BGR, HxWx3 uint8)、序號與時間戳（秒）
+# region 為 (x, y, scale)：影像是從完整畫面的 (x, y) 裁切並縮放 scale 倍而來，None 表示完整畫面
+Frame = namedtuple('Frame', ['image', 'index', 'timestamp', 'region'], defaults=(None,))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv')
+
+
+class FrameSource:
+    """影格來源的基底類別
+
+    子類別只需實作 _grab()：回傳 (image, timestamp) 或 (image, timestamp, region)，
+    沒有影格時回傳 None；影像應盡量寫入 _next_buffer() 取得的緩衝區。
+
+    為了避免每張影格都配置新記憶體，來源會輪流使用 num_buffers 個緩衝區，
+    因此取得的 Frame.image 在之後第 num_buffers 次讀取時會被覆寫；需要長期
+    保存時請自行 copy()。
+    """
+
+    def __init__(self, num_buffers=2):
+        self.num_buffers = max(1, num_buffers)
+        self._buffers = [None] * self.num_buffers
+        self._slot = 0
+        self._index = 0
+
+    def _next_buffer(self, shape, dtype=np.uint8):
+        """取得下一個可重複使用的緩衝區，尺寸改變時才重新配置"""
+        buf = self._buffers[self._slot]
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[self._slot] = buf
+        self._slot = (self._slot + 1) % self.num_buffers
+        return buf
+
+    def reserve_buffers(self, n):
+        """確保至少有 n 個輪替緩衝區，供會暫存多張影格的管線使用"""
+        if n > self.num_buffers:
+            self._buffers.extend([None] * (n - self.num_buffers))
+            self.num_buffers = n
+
+    def _grab(self):
+        raise NotImplementedError
+
+    def read(self):
+        """讀取下一張影格，來源結束時回傳 None"""
+        with metrics.span('read'):
+            grabbed = self._grab()
+        if grabbed is None:
+            return None
+        frame = Frame(grabbed[0], self._index, *grabbed[1:])
+        self._index += 1
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_image(path):
+    """讀取圖片（支援含中文的路徑）"""
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def list_images(directory, recursive=False):
+    """依檔名排序列出資料夾中的圖片"""
+    paths = []
+    if recursive:
+        for root, _, files in os.walk(directory):
+            paths.extend(os.path.join(root, f) for f in files)
+    else:
+        paths = [os.path.join(directory, f) for f in os.listdir(directory)]
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class ImageDirSource(FrameSource):
+    """依序讀取資料夾中的圖片，時間戳以 index / fps 計算"""
+
+    def __init__(self, directory, recursive=False, fps=30.0, loop=False, num_buffers=2):
+        super().__init__(num_buffers)
+        self.paths = list_images(directory, recursive)
+        self.fps = fps
+        self.loop = loop
+        self._pos = 0
+
+    def _grab(self):
+        while self.paths:
+            if self._pos >= len(self.paths):
+                if not self.loop:
+                    return None
+                self._pos = 0
+            path = self.paths[self._pos]
+            self._pos += 1
+            image = read_image(path)
+            if image is None:
+                print(f"無法讀取圖片: {path}")
+                continue
+            # 解碼本身就會配置新陣列，這裡直接交出，不再多複製一次
+            return image, self._index / self.fps
+        return None
+
+
+class VideoSource(FrameSource):
+    """讀取錄影檔（VOD），step > 1 時只解碼每第 step 張影格"""
+
+    def __init__(self, path, step=1, start_frame=0, num_buffers=2):
+        super().__init__(num_buffers)
+        self.path = path
+        self.step = max(1, step)
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"無法開啟影片: {path}")
+        if start_frame:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.position = start_frame
+
+    def _grab(self):
+        # 跳過的影格只 grab() 不解碼
+        for _ in range(self.step - 1):
+            if not self.capture.grab():
+                return None
+            self.position += 1
+        buf = self._next_buffer((self.height, self.width, 3))
+        ok, image = self.capture.read(buf)
+        if not ok:
+            return None
+        timestamp = self.position / self.fps
+        self.position += 1
+        return image, timestamp
+
+    def close(self):
+        self.capture.release()
+
+
+class SyntheticSource(FrameSource):
+    """產生帶有移動方塊的合成影格，用於測試與效能量測"""
+
+    def __init__(self, width=1280, height=720, count=300, fps=60.0, objects=5, seed=0, num_buffers=2):
+        super().__init__(num_buffers)
+        self.width = width
+        self.height = height
+        self.count = count
+        self.fps = fps
+        rng = np.random.default_rng(seed)
+        self._background = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        size = np.array([width, height])
+        self._pos = rng.uniform(0, 1, (objects, 2)) * size
+        self._vel = rng.uniform(-8, 8, (objects, 2))
+        self._size = rng.integers(20, 120, (objects, 2))
+        self._color = rng.integers(128, 256, (objects, 3))
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+
+    def _grab(self):
+        if self.count is not None and self._index >= self.count:
+            return None
+        buf = self._next_buffer((self.height, self.width, 3))
+        np.copyto(buf, self._background)
+        # self.boxes 記錄剛輸出這張影格中各方塊的 xyxy 座標，可當作標註使用
+        xy = self._pos.astype(np.int32)
+        self.boxes = np.concatenate([xy, xy + self._size], axis=1).astype(np.float32)
+        for (x1, y1, x2, y2), color in zip(self.boxes.astype(np.int32), self._color):
+            buf[max(y1, 0):y2, max(x1, 0):x2] = color
+        self._pos += self._vel
+        limit = np.array([self.width, self.height]) - self._size
+        bounced = (self._pos < 0) | (self._pos > limit)
+        self._vel[bounced] *= -1
+        np.clip(self._pos, 0, limit, out=self._pos)
+        return buf, self._index / self.fps
+
+
+class ScreenSource(FrameSource):
+    """擷取指定視窗畫面（僅限 Windows）
+
+    rect 為相對於視窗的 (x, y, w, h)，只擷取該區域；adaptive 為 roi.AdaptiveRegion（True 時依視窗尺寸建立），
+    每張影格依最近的偵測結果決定擷取區域與縮放，Frame.region 記錄換算方式，
+    偵測結果用 roi.to_full() 換回完整畫面座標後再交給 adaptive.update()；視窗尺寸改變時
+    會自動呼叫 adaptive.resize()。擷取結果與其他來源一樣輪流寫入 num_buffers 個緩衝區。
+    """
+
+    def __init__(self, window_title, count=None, rect=None, adaptive=None, num_buffers=2):
+        super().__init__(num_buffers)
+        # 延遲載入，非 Windows 環境仍能使用其他來源
+        from recognition.capture import capture_window, window_rect
+        self._capture_window = capture_window
+        self._window_rect = window_rect
+        self.window_title = window_title
+        self.count = count
+        self.rect = rect
+        if adaptive is True:
+            from recognition.roi import AdaptiveRegion
+            window = window_rect(window_title)
+            adaptive = AdaptiveRegion(window[2], window[3]) if window else None
+        self.adaptive = adaptive
+        self._scratch = None
+        self._start = time.perf_counter()
+
+    def _capture_to_slot(self, rect):
+        """擷取到輪替中的下一個緩衝區；尺寸不同時（視窗縮放）擷取結果取代該緩衝區"""
+        slot = self._slot
+        image = self._capture_window(self.window_title, rect, self._buffers[slot], verbose=False)
+        if image is not None:
+            self._buffers[slot] = image
+            self._slot = (slot + 1) % self.num_buffers
+        return image
+
+    def _grab(self):
+        if self.count is not None and self._index >= self.count:
+            return None
+        if self.adaptive is None:
+            image = self._capture_to_slot(self.rect)
+            if image is None:
+                return None
+            x, y = self.rect[:2] if self.rect else (0, 0)
+            return image, time.perf_counter() - self._start, (x, y, 1.0)
+
+        window = self._window_rect(self.window_title, foreground=False)
+        if window is None:
+            return None
+        self.adaptive.resize(window[2], window[3])
+        x, y, w, h, scale = self.adaptive.plan()
+        if scale == 1.0:
+            image = self._capture_to_slot((x, y, w, h))
+            if image is None:
+                return None
+        else:
+            # 原尺寸的擷取結果只是縮放前的暫存，縮放後才寫入輪替緩衝區
+            image = self._capture_window(self.window_title, (x, y, w, h), self._scratch, verbose=False)
+            if image is None:
+                return None
+            self._scratch = image
+            size = (int(round(image.shape[1] * scale)), int(round(image.shape[0] * scale)))
+            buf = self._next_buffer((size[1], size[0], 3))
+            image = cv2.resize(image, size, dst=buf, interpolation=cv2.INTER_AREA)
+        return image, time.perf_counter() - self._start, (x, y, scale)
+
+
+def open_source(spec, **kwargs):
+    """依字串自動選擇來源：資料夾、影片檔、'synthetic' 或視窗標題"""
+    if spec == 'synthetic':
+        return SyntheticSource(**kwargs)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, **kwargs)
+    if os.path.isfile(spec) and spec.lower().endswith(VIDEO_EXTENSIONS):
+        return VideoSource(spec, **kwargs)
+    return ScreenSource(spec, **kwargs)
@@ -0,0 +1,133 @@
+import cv2
+import numpy as np
+
+from recognition.metrics import metrics
+
+
+def block_signature(image, size=(64, 36)):
+    """縮成小灰階圖（INTER_AREA 等同區塊平均），作為區塊差異的比較基準"""
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return small.astype(np.int16)
+
+
+def dhash(image, hash_size=8):
+    """差異雜湊（dHash）：比較相鄰像素亮度，回傳 hash_size*hash_size 個布林值"""
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return (small[:, 1:] > small[:, :-1]).reshape(-1)
+
+
+class FrameGate:
+    """偵測器前的變化閘門：畫面與上一次實際推論的影格幾乎相同時跳過推論
+
+    method='block'：比較 64x36 灰階縮圖，切成 grid 個區塊取平均絕對差，以變化最大的區塊
+                    與 threshold（灰階值）比較，局部出現的小目標也不會被整張平均稀釋。
+    method='dhash'：比較 64 位元的差異雜湊，以不同的位元數與 threshold 比較，較能容忍亮度變化，
+                    但對局部的小變化不敏感，適合選單、暫停畫面這類整體靜止的判斷。
+    連續跳過 max_skip 張後一定重新推論，避免長時間沿用舊結果。
+    """
+
+    def __init__(self, threshold=None, method='block', grid=(4, 4), max_skip=30):
+        if method not in ('block', 'dhash'):
+            raise ValueError(f"未知的比較方式: {method}")
+        self.method = method
+        self.threshold = threshold if threshold is not None else (3.0 if method == 'block' else 4)
+        self.grid = grid
+        self.max_skip = max_skip
+        self.frames = 0
+        self.skipped = 0
+        self.last_score = None
+        self._reference = None
+        self._since = 0
+
+    def signature(self, image):
+        return block_signature(image) if self.method == 'block' else dhash(image)
+
+    def difference(self, a, b):
+        if self.method == 'dhash':
+            return int(np.count_nonzero(a != b))
+        rows, cols = self.grid
+        h, w = a.shape
+        diff = np.abs(a - b)[:h - h % rows, :w - w % cols]
+        blocks = diff.reshape(rows, diff.shape[0] // rows, cols, diff.shape[1] // cols)
+        return float(blocks.mean(axis=(1, 3)).max())
+
+    def check(self, image):
+        """影像是否需要推論；需要時同時把它設為新的比較基準"""
+        with metrics.span('gate'):
+            signature = self.signature(image)
+            self.frames += 1
+            changed = self._reference is None or self._since >= self.max_skip
+            if not changed:
+                self.last_score = self.difference(signature, self._reference)
+                changed = self.last_score > self.threshold
+            if changed:
+                self._reference = signature
+                self._since = 0
+                metrics.incr('gate_passed')
+            else:
+                self._since += 1
+                self.skipped += 1
+                metrics.incr('gate_skipped')
+            metrics.set_gauge('gate_skip_rate', self.skip_rate)
+        return changed
+
+    def reset(self):
+        """畫面來源改變（換視窗、換影片）時清除比較基準"""
+        self._reference = None
+        self._since = 0
+
+    @property
+    def skip_rate(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {'frames': self.frames, 'skipped': self.skipped, 'skip_rate': round(self.skip_rate, 4)}
+
+
+class GatedEngine:
+    """以 FrameGate 包裝偵測引擎（DetectionEngine、OnnxDetectionEngine），介面相同
+
+    被跳過的影格沿用最近一次推論的結果，Detections.carried_from 記錄來源影格。
+    """
+
+    def __init__(self, engine, gate=None):
+        self.engine = engine
+        self.gate = gate or FrameGate()
+        self.names = engine.names
+        self.batch_size = engine.batch_size
+        self._last = None
+
+    def detect(self, images, frame_indices=None, timestamps=None):
+        frame_indices = range(len(images)) if frame_indices is None else frame_indices
+        timestamps = [0.0] * len(images) if timestamps is None else timestamps
+        passed = [self.gate.check(image) for image in images]
+        if passed and self._last is None:
+            # 還沒有可沿用的結果
+            passed[0] = True
+        inferred = iter(self.engine.detect(
+            [image for image, p in zip(images, passed) if p],
+            [i for i, p in zip(frame_indices, passed) if p],
+            [t for t, p in zip(timestamps, passed) if p],
+        ))
+        outputs = []
+        for p, index, timestamp in zip(passed, frame_indices, timestamps):
+            if p:
+                self._last = next(inferred)
+                outputs.append(self._last)
+            else:
+                outputs.append(self._last.carry(index, timestamp))
+        return outputs
+
+    def detect_frames(self, frames):
+        return self.detect(
+            [f.image for f in frames],
+            [f.index for f in frames],
+            [f.timestamp for f in frames],
+        )
+
+    def detect_one(self, image):
+        return self.detect([image])[0]
@@ -0,0 +1,291 @@
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _PerThread:
+    """每個執行緒各自的累加容器，只有擁有者執行緒會寫入，讀取時再全部加總，不需要鎖
+
+    結束的執行緒留下的容器仍保留，累計值才不會減少。
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self.shards = []
+
+    def get(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._factory()
+            self.shards.append(shard)
+        return shard
+
+
+class RingHistogram:
+    """固定大小的環形緩衝區，保留最近 size 筆耗時（秒）
+
+    寫入不加鎖：每筆以 itertools.count() 取得自己的位置（next() 在 GIL 下是原子操作）後只寫那一格，
+    count 與 sum 記在各執行緒自己的累加容器中，讀取時加總；sum 與 count 為累計值，供 Prometheus 計算平均。
+    """
+
+    def __init__(self, size=2048):
+        self.values = np.zeros(size, dtype=np.float64)
+        self.size = size
+        self._slots = itertools.count()
+        self._totals = _PerThread(lambda: [0, 0.0])
+
+    def observe(self, value):
+        self.values[next(self._slots) % self.size] = value
+        totals = self._totals.get()
+        totals[0] += 1
+        totals[1] += value
+
+    @property
+    def count(self):
+        return sum(totals[0] for totals in list(self._totals.shards))
+
+    @property
+    def sum(self):
+        return sum(totals[1] for totals in list(self._totals.shards))
+
+    def recent(self):
+        return self.values[:min(self.count, self.size)]
+
+    def quantiles(self, qs=QUANTILES):
+        recent = self.recent()
+        if len(recent) == 0:
+            return [0.0] * len(qs)
+        return np.quantile(recent, qs).tolist()
+
+
+class Metrics:
+    """各階段耗時、計數與量表的集合"""
+
+    def __init__(self, prefix='valorbot', size=2048):
+        self.prefix = prefix
+        self.size = size
+        self.histograms = {}
+        # 計數由多個執行緒同時累加（管線各階段、存檔執行緒、推論），各執行緒分開記，讀取時加總
+        self._counters = _PerThread(dict)
+        self.gauges = {}
+        self._create_lock = threading.Lock()
+        self._main_thread_calls = []
+        self.enabled = True
+
+    def histogram(self, name):
+        hist = self.histograms.get(name)
+        if hist is None:
+            # 只有第一次建立時需要加鎖
+            with self._create_lock:
+                hist = self.histograms.setdefault(name, RingHistogram(self.size))
+        return hist
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def call_in_main_thread(self, func):
+        """排入 func，在主執行緒下一次結束 span 時執行（用於只能在主執行緒完成的動作）"""
+        self._main_thread_calls.append(func)
+
+    def _run_main_thread_calls(self):
+        if self._main_thread_calls and threading.current_thread() is threading.main_thread():
+            while self._main_thread_calls:
+                self._main_thread_calls.pop(0)()
+
+    @contextmanager
+    def span(self, name):
+        """量測區塊耗時：with metrics.span('infer'): ..."""
+        if not self.enabled:
+            yield
+            self._run_main_thread_calls()
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe(time.perf_counter() - start)
+            self._run_main_thread_calls()
+
+    def incr(self, name, n=1):
+        counters = self._counters.get()
+        counters[name] = counters.get(name, 0) + n
+
+    @property
+    def counters(self):
+        """各計數在所有執行緒的總和"""
+        totals = {}
+        for counters in list(self._counters.shards):
+            for name, value in list(counters.items()):
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """目前各項數值，毫秒為單位"""
+        stages = {}
+        for name, hist in list(self.histograms.items()):
+            p50, p90, p99 = hist.quantiles()
+            stages[name] = {
+                'count': hist.count,
+                'mean_ms': round(hist.sum / hist.count * 1000, 3) if hist.count else 0.0,
+                'p50_ms': round(p50 * 1000, 3),
+                'p90_ms': round(p90 * 1000, 3),
+                'p99_ms': round(p99 * 1000, 3),
+            }
+        return {'stages': stages, 'counters': self.counters, 'gauges': dict(self.gauges)}
+
+    def prometheus_text(self):
+        """Prometheus 文字格式"""
+        p = self.prefix
+        lines = [f'# TYPE {p}_stage_seconds summary']
+        for name, hist in list(self.histograms.items()):
+            for q, value in zip(QUANTILES, hist.quantiles()):
+                lines.append(f'{p}_stage_seconds{{stage="{name}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {hist.sum:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {hist.count}')
+        for name, value in self.counters.items():
+            lines.append(f'# TYPE {p}_{name}_total counter')
+            lines.append(f'{p}_{name}_total {value}')
+        typed = set()
+        for name, value in sorted(self.gauges.items()):
+            # 名稱可帶標籤，例如 queue_depth{stage="infer"}，TYPE 只需宣告一次
+            base = name.split('{')[0]
+            if base not in typed:
+                lines.append(f'# TYPE {p}_{base} gauge')
+                typed.add(base)
+            lines.append(f'{p}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# 全域共用的 metrics，各模組直接 from recognition.metrics import metrics
+metrics = Metrics()
+
+
+def serve(port=9108, host='127.0.0.1', registry=None):
+    """在背景執行緒啟動 http://host:port/metrics（Prometheus）與 /metrics.json"""
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body = json.dumps(registry.snapshot(), ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json'
+            elif self.path.startswith('/metrics'):
+                body = registry.prometheus_text().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    print(f"效能指標: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_log_reporter(interval=10.0, path=None, registry=None):
+    """每 interval 秒輸出一行 JSON 指標；給定 path 時追加寫入檔案，否則印出"""
+    registry = registry or metrics
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            line = json.dumps({'time': round(time.time(), 3), **registry.snapshot()}, ensure_ascii=False)
+            if path:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            else:
+                print(line)
+
+    threading.Thread(target=run, name='metrics-log', daemon=True).start()
+    return stop
+
+
+def install_profile_signal(seconds=10.0, output_dir='recognition/profiles', mode='cprofile'):
+    """收到訊號（Unix: SIGUSR1，Windows: SIGBREAK / Ctrl+Break）時擷取 seconds 秒的效能剖析
+
+    mode='cprofile' 剖析主執行緒並輸出 .prof；mode='torch' 以 torch.profiler 記錄所有運算並輸出 chrome trace。
+    剖析期間再收到一次訊號會提前結束。時間到時由計時器直接結束剖析，不會對自己送訊號
+    （Windows 上 os.kill 送出 Ctrl 事件以外的訊號會直接終止程序）。Python 3.12 之前的 cProfile
+    只能在主執行緒停止，計時器會把結束動作排到主執行緒下一次結束 metrics.span 時執行。
+    """
+    sig = getattr(signal, 'SIGUSR1', None) or getattr(signal, 'SIGBREAK', None)
+    if sig is None:
+        print("此平台不支援效能剖析訊號")
+        return None
+    state = {'profiler': None, 'path': None, 'timer': None}
+    lock = threading.Lock()
+    # 3.12 起 cProfile 改用 sys.monitoring，對所有執行緒生效，可以從計時器執行緒停止
+    stop_anywhere = mode == 'torch' or sys.version_info >= (3, 12)
+
+    def start():
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        if mode == 'torch':
+            import torch
+            profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            profiler.start()
+            state['path'] = os.path.join(output_dir, f'torch_{stamp}.json')
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            state['path'] = os.path.join(output_dir, f'cprofile_{stamp}.prof')
+        state['profiler'] = profiler
+        state['timer'] = threading.Timer(seconds, timeout, (profiler,))
+        state['timer'].daemon = True
+        state['timer'].start()
+        print(f"開始效能剖析 {seconds} 秒")
+
+    def finish(expected=None):
+        with lock:
+            profiler, path = state['profiler'], state['path']
+            # 已經被提前結束，或已開始下一次剖析
+            if profiler is None or (expected is not None and profiler is not expected):
+                return
+            state['profiler'] = None
+            state['timer'].cancel()
+        if mode == 'torch':
+            profiler.stop()
+            profiler.export_chrome_trace(path)
+        else:
+            profiler.disable()
+            profiler.dump_stats(path)
+        print(f"效能剖析已保存到 '{path}'")
+
+    def timeout(profiler):
+        if stop_anywhere:
+            finish(profiler)
+        else:
+            metrics.call_in_main_thread(lambda: finish(profiler))
+
+    def handler(signum, frame):
+        if state['profiler'] is None:
+            start()
+        else:
+            finish()
+
+    signal.signal(sig, handler)
+    return sig
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import platform
+
+import numpy as np
+
+from recognition.detections import Detections, nms
+from recognition.detector import PAD_VALUE, ROOT_DIR, letterbox, unletterbox
+from recognition.metrics import metrics
+
+# 最佳化後的 session 圖（ORT 格式）快取，第二次啟動直接載入，不必重新最佳化
+CACHE_DIR = os.path.join(ROOT_DIR, 'runs', '.model_cache')
+
+
+def read_export_meta(path):
+    """讀取匯出時一併寫出的 <模型>.json（類別名稱、輸入尺寸、批次大小）"""
+    meta_path = os.path.splitext(path)[0] + '.json'
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"找不到模型資訊檔: {meta_path}，請用 python -m training.export 匯出")
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['names'] = {int(k): v for k, v in meta['names'].items()}
+    return meta
+
+
+def optimized_cache_path(model_path, cache_dir=CACHE_DIR):
+    """模型檔、onnxruntime 版本或 CPU 架構改變時，快取路徑跟著改變"""
+    import onnxruntime as ort
+
+    st = os.stat(model_path)
+    key = f'{os.path.abspath(model_path)}|{st.st_size}|{st.st_mtime_ns}|{ort.__version__}|{platform.machine()}'
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f'{stem}-{hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]}.ort')
+
+
+class OnnxDetectionEngine:
+    """以 ONNX Runtime 執行匯出後模型的偵測引擎，介面與 DetectionEngine 相同
+
+    只依賴 numpy、OpenCV 與 onnxruntime，不會載入 torch / ultralytics，也不會連網。
+    輸入形狀在匯出時就固定（batch x 3 x imgsz x imgsz），輸入與輸出陣列都預先配置，
+    透過 IO binding 直接讓 session 讀寫，不足一個批次時以填充影格補滿。
+    provider 預設使用 CPU；安裝 onnxruntime-openvino 後可指定 'openvino'。
+    CPU 時最佳化後的圖會存到 cache_dir，之後的啟動直接載入（cache_dir=None 停用）。
+    """
+
+    def __init__(self, model_path, conf=0.25, iou=0.45, threads=None, max_det=300, provider=None,
+                 cache_dir=CACHE_DIR):
+        import onnxruntime as ort
+
+        meta = read_export_meta(model_path)
+        self.weights = model_path
+        self.names = meta['names']
+        self.imgsz = meta['imgsz']
+        self.batch_size = meta['batch']
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ['CPUExecutionProvider']
+        if provider == 'openvino':
+            providers.insert(0, 'OpenVINOExecutionProvider')
+
+        cached = optimized_cache_path(model_path, cache_dir) if cache_dir and provider is None else None
+        self.from_cache = bool(cached) and os.path.exists(cached)
+        if self.from_cache:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            self.session = ort.InferenceSession(cached, options, providers=providers)
+        else:
+            if cached:
+                os.makedirs(cache_dir, exist_ok=True)
+                options.optimized_model_filepath = cached + '.tmp'
+                options.add_session_config_entry('session.save_model_format', 'ORT')
+            self.session = ort.InferenceSession(model_path, options, providers=providers)
+            if cached and os.path.exists(cached + '.tmp'):
+                os.replace(cached + '.tmp', cached)
+        self.input_name = self.session.get_inputs()[0].name
+        output = self.session.get_outputs()[0]
+
+        self._staging = np.full((self.batch_size, self.imgsz, self.imgsz, 3), PAD_VALUE, dtype=np.uint8)
+        self._input = np.empty((self.batch_size, 3, self.imgsz, self.imgsz), dtype=np.float32)
+        self._output = np.empty([self.batch_size if isinstance(d, str) else d for d in output.shape], dtype=np.float32)
+        self._binding = self.session.io_binding()
+        self._binding.bind_cpu_input(self.input_name, self._input)
+        self._binding.bind_output(output.name, 'cpu', 0, np.float32, self._output.shape, self._output.ctypes.data)
+
+    def preprocess(self, images):
+        """把最多 batch_size 張影像 letterbox 到暫存區，回傳各張的還原參數"""
+        meta = []
+        with metrics.span('preprocess'):
+            for i, image in enumerate(images):
+                scale, pad_x, pad_y = letterbox(image, self.imgsz, self._staging[i])
+                meta.append((scale, pad_x, pad_y, image.shape[:2]))
+        return meta
+
+    def infer(self, n):
+        """對暫存區前 n 張影像執行一次前向運算"""
+        return self.infer_letterboxed(self._staging[:n])
+
+    def infer_letterboxed(self, images):
+        """對已 letterbox 的影像（NHWC 陣列或 HWC 列表）執行一次前向運算，回傳每張的原始輸出"""
+        n = len(images)
+        with metrics.span('infer'):
+            # HWC BGR uint8 -> CHW RGB float，直接寫入預先配置的輸入陣列
+            for i, image in enumerate(images):
+                np.multiply(image.transpose(2, 0, 1)[::-1], 1 / 255.0, out=self._input[i])
+            self._input[n:] = PAD_VALUE / 255.0
+            self.session.run_with_iobinding(self._binding)
+        metrics.incr('frames_inferred', n)
+        metrics.set_gauge('batch_size', n)
+        return [self._output[i] for i in range(n)]
+
+    def decode(self, output):
+        """把單張的原始輸出（4+nc x anchors）轉成 letterbox 座標的 (boxes, scores, classes)"""
+        pred = output.T
+        class_scores = pred[:, 4:]
+        classes = class_scores.argmax(1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        keep = scores > self.conf
+        pred, scores, classes = pred[keep], scores[keep], classes[keep]
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        boxes[:, :2] = pred[:, :2] - pred[:, 2:4] / 2
+        boxes[:, 2:] = pred[:, :2] + pred[:, 2:4] / 2
+        kept = nms(boxes, scores, self.iou, classes)[:self.max_det]
+        return boxes[kept], scores[kept], classes[kept]
+
+    def postprocess(self, results, meta, frame_indices=None, timestamps=None):
+        """把模型輸出轉成原圖座標的 Detections"""
+        outputs = []
+        with metrics.span('postprocess'):
+            for i, (output, (scale, pad_x, pad_y, shape)) in enumerate(zip(results, meta)):
+                boxes, scores, classes = self.decode(output)
+                unletterbox(boxes, scale, pad_x, pad_y, shape)
+                outputs.append(Detections(
+                    boxes, scores, classes,
+                    frame_indices[i] if frame_indices is not None else i,
+                    timestamps[i] if timestamps is not None else 0.0,
+                ))
+        return outputs
+
+    def detect(self, images, frame_indices=None, timestamps=None):
+        """偵測一串影像，每 batch_size 張合併成一次前向運算，回傳 Detections 列表"""
+        outputs = []
+        for start in range(0, len(images), self.batch_size):
+            end = start + self.batch_size
+            chunk = images[start:end]
+            meta = self.preprocess(chunk)
+            results = self.infer(len(chunk))
+            outputs.extend(self.postprocess(
+                results, meta,
+                range(start, start + len(chunk)) if frame_indices is None else frame_indices[start:end],
+                None if timestamps is None else timestamps[start:end],
+            ))
+        return outputs
+
+    def detect_frames(self, frames):
+        """偵測 frame_source.Frame 列表，結果帶有對應的序號與時間戳"""
+        return self.detect(
+            [f.image for f in frames],
+            [f.index for f in frames],
+            [f.timestamp for f in frames],
+        )
+
+    def detect_one(self, image):
+        """偵測單張影像"""
+        return self.detect([image])[0]
@@ -0,0 +1,259 @@
+import heapq
+import queue
+import threading
+import time
+
+import numpy as np
+
+from recognition.detector import letterbox
+from recognition.metrics import metrics
+
+# 佇列結束標記
+_STOP = object()
+
+# 丟幀策略：block 為無損（佇列滿時等待，適合離線 VOD），latest 為只保留最新影格（適合即時畫面）
+DROP_POLICIES = ('block', 'latest')
+
+
+class StageQueue:
+    """有容量上限的階段間佇列，滿時依策略等待或丟掉最舊的項目"""
+
+    def __init__(self, maxsize, policy='block'):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"未知的丟幀策略: {policy}")
+        self.queue = queue.Queue(maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        if item is _STOP or self.policy == 'block':
+            self.queue.put(item)
+            return
+        with self._lock:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                        metrics.incr('frames_dropped')
+                    except queue.Empty:
+                        pass
+
+    def get(self):
+        return self.queue.get()
+
+    def get_batch(self, n):
+        """阻塞取得一個項目，再把佇列中已就緒的項目最多湊到 n 個"""
+        items = [self.queue.get()]
+        while len(items) < n and items[-1] is not _STOP:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+
+class Stage:
+    """管線中的一個階段
+
+    func 接收一個項目並回傳下一階段的項目；batch_size > 1 時接收與回傳的都是列表。
+    回傳 None 代表丟棄該項目。
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.processed = 0
+        self.busy_time = 0.0
+
+
+class Pipeline:
+    """多階段管線：影格來源 -> stages[0] -> stages[1] -> ... 之間以有界佇列相連
+
+    每個階段各自有 workers 條執行緒，佇列滿時會自然形成背壓；
+    drop_policy 只作用在來源與第一個階段之間的佇列。
+    來源或任一階段發生例外時，管線停止讀取來源，各階段把佇列中剩下的項目丟棄直到收到結束標記
+    （上游不會卡在已滿的佇列上），所有執行緒結束後由 run() 重新拋出第一個例外。
+    """
+
+    def __init__(self, source, stages, queue_size=4, drop_policy='block'):
+        self.source = source
+        self.stages = stages
+        self.queues = [StageQueue(queue_size, drop_policy)]
+        self.queues += [StageQueue(queue_size) for _ in stages[1:]]
+        # 佇列與各階段手上可能同時持有的影格數，來源的輪替緩衝區必須足夠
+        in_flight = queue_size * len(self.queues) + sum(s.workers * s.batch_size for s in stages) + 2
+        if hasattr(source, 'reserve_buffers'):
+            source.reserve_buffers(in_flight)
+        self.frames_read = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, error):
+        """記錄第一個例外並停止讀取來源"""
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _read_source(self):
+        out = self.queues[0]
+        try:
+            for frame in self.source:
+                if self._stop.is_set():
+                    break
+                out.put(frame)
+                self.frames_read += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            out.put(_STOP)
+
+    def _run_stage(self, index, stage, remaining):
+        inq = self.queues[index]
+        outq = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        while True:
+            items = inq.get_batch(stage.batch_size) if stage.batch_size > 1 else [inq.get()]
+            stopped = items[-1] is _STOP
+            if stopped:
+                items.pop()
+            if items and self._error is None:
+                start = time.perf_counter()
+                try:
+                    results = stage.func(items) if stage.batch_size > 1 else [stage.func(items[0])]
+                except Exception as e:
+                    # 之後收到的項目都直接丟棄，只負責把結束標記傳下去
+                    self._fail(e)
+                    results = None
+                stage.busy_time += time.perf_counter() - start
+                stage.processed += len(items)
+                if outq is not None and self._error is None:
+                    for result in results or ():
+                        if result is not None:
+                            outq.put(result)
+                    metrics.set_gauge(f'queue_depth{{stage="{stage.name}"}}', outq.queue.qsize())
+            if stopped:
+                # 讓同階段其他執行緒也能收到結束標記，最後一條結束的執行緒再通知下一階段
+                inq.put(_STOP)
+                with remaining['lock']:
+                    remaining['count'] -= 1
+                    last = remaining['count'] == 0
+                if last and outq is not None:
+                    outq.put(_STOP)
+                return
+
+    def run(self):
+        """執行到來源結束（或呼叫 stop()）為止"""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._read_source, name='source', daemon=True)]
+        for i, stage in enumerate(self.stages):
+            remaining = {'count': stage.workers, 'lock': threading.Lock()}
+            for w in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._run_stage, args=(i, stage, remaining),
+                    name=f'{stage.name}-{w}', daemon=True,
+                ))
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                t.join()
+        finally:
+            self.elapsed = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """各階段處理數量、使用率與丟幀數"""
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            'frames_read': self.frames_read,
+            'dropped': self.queues[0].dropped,
+            'elapsed': self.elapsed,
+            'fps': self.stages[-1].processed / elapsed if self.stages else 0.0,
+            'stages': {
+                s.name: {
+                    'processed': s.processed,
+                    'workers': s.workers,
+                    'utilization': s.busy_time / (elapsed * s.workers),
+                }
+                for s in self.stages
+            },
+        }
+
+
+class _Ordered:
+    """依影格序號重新排序，讓多執行緒輸出階段仍依序交給 sink"""
+
+    def __init__(self, sink, first_index=0):
+        self.sink = sink
+        self.next_index = first_index
+        self.heap = []
+        self.lock = threading.Lock()
+
+    def __call__(self, frame, detections):
+        with self.lock:
+            heapq.heappush(self.heap, (frame.index, id(frame), frame, detections))
+            while self.heap and self.heap[0][0] <= self.next_index:
+                _, _, f, d = heapq.heappop(self.heap)
+                self.sink(f, d)
+                self.next_index = f.index + 1
+
+
+def detection_pipeline(source, engine, sink, queue_size=8, drop_policy='block',
+                       preprocess_workers=2, output_workers=1, ordered=False):
+    """建立 擷取 -> 前處理 -> 推論 -> 輸出 的偵測管線
+
+    sink(frame, detections) 在輸出階段被呼叫（可用來存檔、顯示或寫紀錄）。
+    推論階段只有一條執行緒，會把佇列中已就緒的影格湊成 engine.batch_size 的批次。
+    ordered=True 時即使 output_workers > 1 也會依影格順序呼叫 sink（離線 VOD 建議使用，
+    需搭配 drop_policy='block'）。
+    """
+    size = engine.imgsz
+    # letterbox 緩衝池：前處理寫入、推論複製進模型輸入張量後歸還
+    pool = queue.Queue()
+    for _ in range(queue_size * 2 + preprocess_workers + engine.batch_size + 2):
+        pool.put(np.empty((size, size, 3), dtype=np.uint8))
+
+    def preprocess(frame):
+        buf = pool.get()
+        with metrics.span('preprocess'):
+            meta = letterbox(frame.image, size, buf) + (frame.image.shape[:2],)
+        return frame, buf, meta
+
+    def infer(items):
+        frames = [f for f, _, _ in items]
+        buffers = [b for _, b, _ in items]
+        results = engine.infer_letterboxed(buffers)
+        for b in buffers:
+            pool.put(b)
+        detections = engine.postprocess(
+            results, [m for _, _, m in items],
+            [f.index for f in frames], [f.timestamp for f in frames],
+        )
+        return list(zip(frames, detections))
+
+    output = _Ordered(sink) if ordered else sink
+
+    def emit(item):
+        with metrics.span('output'):
+            output(*item)
+
+    stages = [
+        Stage('preprocess', preprocess, workers=preprocess_workers),
+        Stage('infer', infer, workers=1, batch_size=engine.batch_size),
+        Stage('output', emit, workers=output_workers),
+    ]
+    return Pipeline(source, stages, queue_size=queue_size, drop_policy=drop_policy)
@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+
+from recognition.metrics import metrics
+
+
+class Renderer:
+    """標註繪製器：在重複使用的緩衝區上畫框，標籤文字預先繪成小圖快取後直接貼上
+
+    標籤以 (類別, 信心值區間) 為單位快取，信心值以 1/buckets 為間隔顯示，同一個區間的
+    標籤只需呼叫一次 putText。render() 會把原圖複製到內部緩衝區再繪製，回傳的影像在
+    下一次 render() 時會被覆寫；in_place=True 則直接畫在原圖上。
+    headless=True 時不做任何繪製，render() 直接回傳原圖，用於不需要畫面的批次處理。
+    """
+
+    def __init__(self, names, color=(0, 255, 0), font_scale=0.5, thickness=2, buckets=20, headless=False):
+        self.names = names
+        self.color = color
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.buckets = buckets
+        self.headless = headless
+        self._sprites = {}
+        self._buffer = None
+
+    def label_sprite(self, class_id, score):
+        """取得 (文字影像, 遮罩, 基線左端在影像中的位置)，沒有快取時才繪製"""
+        bucket = int(np.clip(round(float(score) * self.buckets), 0, self.buckets))
+        key = (int(class_id), bucket)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            name = self.names.get(int(class_id), f"Class {int(class_id)}")
+            text = f'{name}: {bucket / self.buckets:.2f}'
+            (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, self.thickness)
+            pad = self.thickness
+            canvas = np.zeros((h + baseline + 2 * pad, w + 2 * pad, 3), dtype=np.uint8)
+            origin = (pad, h + pad)
+            cv2.putText(canvas, text, origin, cv2.FONT_HERSHEY_SIMPLEX, self.font_scale, self.color, self.thickness)
+            sprite = (canvas, canvas.any(axis=2), origin)
+            self._sprites[key] = sprite
+        return sprite
+
+    def _blit(self, image, sprite, x, y):
+        """把文字貼到 image，(x, y) 為文字基線左端，超出影像的部分裁掉"""
+        canvas, mask, (ox, oy) = sprite
+        x0, y0 = x - ox, y - oy
+        h, w = image.shape[:2]
+        sx0, sy0 = max(0, -x0), max(0, -y0)
+        sx1, sy1 = min(canvas.shape[1], w - x0), min(canvas.shape[0], h - y0)
+        if sx1 <= sx0 or sy1 <= sy0:
+            return
+        region = image[y0 + sy0:y0 + sy1, x0 + sx0:x0 + sx1]
+        np.copyto(region, canvas[sy0:sy1, sx0:sx1], where=mask[sy0:sy1, sx0:sx1, None])
+
+    def render(self, image, detections, in_place=False):
+        """回傳畫好標註的影像"""
+        if self.headless:
+            return image
+        with metrics.span('render'):
+            if in_place:
+                out = image
+            else:
+                if self._buffer is None or self._buffer.shape != image.shape:
+                    self._buffer = np.empty_like(image)
+                np.copyto(self._buffer, image)
+                out = self._buffer
+            if len(detections) == 0:
+                return out
+            b = detections.boxes.astype(np.int32)
+            polygons = np.stack([b[:, [0, 1]], b[:, [2, 1]], b[:, [2, 3]], b[:, [0, 3]]], axis=1)
+            cv2.polylines(out, list(polygons), True, self.color, self.thickness)
+            for (x1, y1), c, s in zip(b[:, :2], detections.class_ids, detections.scores):
+                self._blit(out, self.label_sprite(c, s), int(x1), int(y1) - 10)
+        return out
+
+    def annotate(self, image, detections):
+        """延遲繪製：回傳 Annotation，真的取用 .image 時才繪製"""
+        return Annotation(self, image, detections)
+
+
+class Annotation:
+    """延遲繪製的標註結果，第一次讀取 image 時才呼叫 Renderer.render()"""
+
+    __slots__ = ('renderer', 'source', 'detections', '_image')
+
+    def __init__(self, renderer, source, detections):
+        self.renderer = renderer
+        self.source = source
+        self.detections = detections
+        self._image = None
+
+    @property
+    def rendered(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = self.renderer.render(self.source, self.detections)
+        return self._image
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def clip_rect(rect, width, height):
+    """把 (x, y, w, h) 裁切到 width x height 的範圍內，完全在外時回傳 None"""
+    x, y, w, h = rect
+    x0, y0 = max(int(x), 0), max(int(y), 0)
+    x1, y1 = min(int(x + w), width), min(int(y + h), height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def to_full(detections, region):
+    """把在裁切／縮小後影格上的偵測結果換回完整畫面座標，region 為 (x, y, scale)"""
+    if region is None:
+        return detections
+    x, y, scale = region
+    if (x, y, scale) == (0, 0, 1.0):
+        return detections
+    return detections.rescale(1.0 / scale, offset_x=x, offset_y=y)
+
+
+class AdaptiveRegion:
+    """依最近的偵測結果決定下一張影格要擷取的區域與縮放比例
+
+    有目標時只擷取目標聯集框外擴 margin 倍後的區域（至少 min_size），原解析度；
+    連續 hold 張影格沒有偵測到目標，或每隔 full_every 張影格，改成擷取完整畫面並縮小到
+    search_scale 搜尋新目標，避免畫面其他位置出現的目標一直被裁掉。
+
+        region = AdaptiveRegion(1920, 1080)
+        x, y, w, h, scale = region.plan()
+        detections = to_full(engine.detect_one(image), (x, y, scale))
+        region.update(detections)
+    """
+
+    def __init__(self, width, height, margin=0.5, min_size=320, hold=5, search_scale=0.5, full_every=30):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.min_size = min_size
+        self.hold = hold
+        self.search_scale = search_scale
+        self.full_every = full_every
+        self._box = None
+        self._misses = 0
+        self._frames = 0
+        self._last = (0, 0, width, height, 1.0)
+
+    def resize(self, width, height):
+        """畫面尺寸改變（例如視窗被縮放）時重設狀態"""
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self._box = None
+
+    def plan(self):
+        """回傳下一張影格的 (x, y, w, h, scale)，座標相對於完整畫面"""
+        self._frames += 1
+        searching = (
+            self._box is None or self._misses >= self.hold
+            or (self.full_every and self._frames % self.full_every == 0)
+        )
+        if searching:
+            self._last = (0, 0, self.width, self.height, self.search_scale)
+            return self._last
+
+        x0, y0, x1, y1 = self._box
+        w = max((x1 - x0) * (1 + 2 * self.margin), self.min_size)
+        h = max((y1 - y0) * (1 + 2 * self.margin), self.min_size)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        # 區域盡量保持完整尺寸，靠近邊緣時往內移而不是縮小
+        w, h = min(w, self.width), min(h, self.height)
+        x = int(np.clip(cx - w / 2, 0, self.width - w))
+        y = int(np.clip(cy - h / 2, 0, self.height - h))
+        self._last = (x, y, int(w), int(h), 1.0)
+        return self._last
+
+    def update(self, detections):
+        """以完整畫面座標的偵測結果更新狀態"""
+        if len(detections):
+            boxes = detections.boxes
+            self._box = (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+            self._misses = 0
+        else:
+            self._misses += 1
+
+    @property
+    def pixel_ratio(self):
+        """最近一次計畫擷取的像素占完整畫面的比例（含縮放），用於觀察省下多少運算"""
+        _, _, w, h, scale = self._last
+        return (w * scale) * (h * scale) / float(self.width * self.height)
+
@@ -1,10 +1,7 @@
-import pygetwindow as gw
-from recognition.capture import capture_screen
-import cv2
-from capture import capture_screen
-
 def list_windows():
     """列出所有當前打開的視窗標題"""
+    import pygetwindow as gw
+
     windows = gw.getAllTitles()
     print("目前開啟的視窗標題:")
     for i, window in enumerate(windows):
@@ -14,6 +11,10 @@ def list_windows():
 
 def select_window():
     """選擇視窗並擷取截圖"""
+    # 截圖需要 win32 與 OpenCV，只在真的要截圖時才載入
+    import cv2
+    from recognition.capture import capture_screen
+
     windows = list_windows()
     try:
         index = int(input("請選擇一個視窗的序號："))
@@ -0,0 +1,336 @@
+"""本機偵測服務
+
+常駐一個模型，接受多個用戶端送來的影格，把同時到達的請求合併成動態批次推論：
+收到第一個請求後最多再等 max_latency，期間到達的請求（最多 batch_size 個）一起推論。
+
+傳輸使用 localhost TCP 或 Unix socket，每則訊息為 4 位元組長度 + JSON 標頭 + 影像資料。
+影像可以用三種方式傳送：
+    shm  用戶端把影格放在自己建立的共享記憶體中，只傳名稱，伺服器直接映射讀取（不經過 socket）
+    raw  未壓縮的 BGR 位元組，伺服器以 np.frombuffer 直接使用，不另外複製
+    jpg / png  編碼後的影像，適合跨機器或頻寬有限時使用
+
+    python -m recognition.server --port 9200 --max-latency-ms 5
+    valorbot serve --unix /tmp/valorbot.sock
+
+用戶端：
+
+    client = DetectionClient(port=9200)
+    detections = client.detect_one(image)
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from recognition.detections import Detections
+from recognition.metrics import metrics
+
+DEFAULT_PORT = 9200
+_LENGTH = struct.Struct('>I')
+
+
+def _pack(header, payload=b''):
+    data = json.dumps(header).encode('utf-8')
+    return _LENGTH.pack(len(data)) + data + _LENGTH.pack(len(payload)), payload
+
+
+class DetectionServer:
+    """持有單一偵測引擎的 asyncio 服務"""
+
+    def __init__(self, engine, max_latency=0.005, max_queue=256):
+        self.engine = engine
+        self.batch_size = engine.batch_size
+        self.max_latency = max_latency
+        self.max_queue = max_queue
+        self._queue = None
+        self._retired = []  # 已不再使用、但影像可能還在推論批次中而暫時關不掉的共享記憶體
+        # 推論在單一執行緒中進行，事件迴圈可以繼續收請求
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='infer')
+
+    def _attach(self, name, segments):
+        """映射用戶端的共享記憶體，segments 是這個連線目前映射的 {名稱: SharedMemory}
+
+        用戶端同一時間只使用一塊；換了名稱（影格變大而重新建立）時舊的那塊已被用戶端釋放，這裡也跟著關閉。
+        """
+        shm = segments.get(name)
+        if shm is None:
+            self._release(segments)
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                # 共享記憶體由用戶端建立與釋放，伺服器只是使用者（Python 3.13 之前的 resource_tracker 會誤刪）
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+            segments[name] = shm
+        return shm
+
+    def _release(self, segments):
+        """關閉 segments 中的共享記憶體；影像還被推論批次引用時留到之後再關"""
+        self._retired.extend(segments.values())
+        segments.clear()
+        busy = []
+        for shm in self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                busy.append(shm)
+        self._retired = busy
+
+    def _decode(self, header, payload, segments):
+        kind = header['kind']
+        if kind == 'shm':
+            shm = self._attach(header['shm'], segments)
+            return np.ndarray(header['shape'], dtype=np.uint8, buffer=shm.buf, offset=header.get('offset', 0))
+        if kind == 'raw':
+            return np.frombuffer(payload, dtype=np.uint8).reshape(header['shape'])
+        import cv2
+        return cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            deadline = first[2] + self.max_latency
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    # 已經超過延遲預算，只收下已在佇列中的請求
+                    while len(batch) < self.batch_size and not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.perf_counter()
+            for _, _, enqueued, _ in batch:
+                metrics.observe('server_queue', start - enqueued)
+            metrics.set_gauge('server_queue_depth', self._queue.qsize())
+            metrics.set_gauge('server_batch_size', len(batch))
+            metrics.incr('server_batches')
+            metrics.incr('server_batched_frames', len(batch))
+            images = [image for image, _, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.engine.detect, images)
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future, _, _), detections in zip(batch, results):
+                if not future.done():
+                    future.set_result((detections, len(batch), start))
+            # 不再引用影像，共享記憶體才能在連線結束時關閉
+            del first, batch, images
+
+    async def _handle(self, reader, writer):
+        segments = {}
+        try:
+            while True:
+                try:
+                    size = _LENGTH.unpack(await reader.readexactly(4))[0]
+                    header = json.loads(await reader.readexactly(size))
+                    length = _LENGTH.unpack(await reader.readexactly(4))[0]
+                    payload = await reader.readexactly(length) if length else b''
+                except asyncio.IncompleteReadError:
+                    return
+                received = time.perf_counter()
+                if header['kind'] == 'info':
+                    response = {'id': header.get('id'), 'names': {int(k): v for k, v in self.engine.names.items()},
+                                'batch_size': self.batch_size}
+                else:
+                    response = await self._detect(header, payload, received, segments)
+                data, _ = _pack(response)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+            self._release(segments)
+
+    async def _detect(self, header, payload, received, segments):
+        metrics.incr('server_requests')
+        try:
+            image = self._decode(header, payload, segments)
+        except Exception as e:
+            metrics.incr('server_errors')
+            return {'id': header.get('id'), 'error': f"無法讀取影像: {e}"}
+        if image is None or self._queue.qsize() >= self.max_queue:
+            metrics.incr('server_errors')
+            return {'id': header.get('id'), 'error': "無法讀取影像" if image is None else "佇列已滿"}
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, received, header.get('id')))
+        try:
+            detections, batch, started = await future
+        except Exception as e:
+            metrics.incr('server_errors')
+            return {'id': header.get('id'), 'error': str(e)}
+        done = time.perf_counter()
+        metrics.observe('server_request', done - received)
+        return {
+            'id': header.get('id'),
+            'boxes': detections.boxes.tolist(),
+            'scores': detections.scores.tolist(),
+            'classes': detections.class_ids.tolist(),
+            'batch': batch,
+            'queue_ms': round((started - received) * 1000, 3),
+            'total_ms': round((done - received) * 1000, 3),
+        }
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, unix=None, ready=None):
+        self._queue = asyncio.Queue()
+        batcher = asyncio.ensure_future(self._batcher())
+        if unix:
+            if os.path.exists(unix):
+                os.remove(unix)
+            server = await asyncio.start_unix_server(self._handle, unix)
+            where = unix
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            where = f"{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"偵測服務: {where}（批次 {self.batch_size}，延遲上限 {self.max_latency * 1000:.1f} ms）")
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._release({})
+            self._executor.shutdown(wait=False)
+
+
+class DetectionClient:
+    """偵測服務的同步用戶端，介面與 DetectionEngine 的 detect / detect_one 相同
+
+    mode='shm' 時影格寫進用戶端自己的共享記憶體（尺寸不變就重複使用），只傳名稱；
+    伺服器在回覆之前就已讀完，所以下一張影格可以直接覆寫同一塊記憶體。
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unix=None, mode='shm', quality=90):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.mode = mode
+        self.quality = quality
+        self._shm = None
+        self._id = 0
+        info = self._request({'kind': 'info'})
+        self.names = {int(k): v for k, v in info['names'].items()}
+        self.batch_size = info['batch_size']
+
+    def _recv_exactly(self, n):
+        chunks = []
+        while n:
+            chunk = self.sock.recv(n)
+            if not chunk:
+                raise ConnectionError("偵測服務已關閉連線")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def _request(self, header, payload=b''):
+        self._id += 1
+        header['id'] = self._id
+        data, payload = _pack(header, payload)
+        self.sock.sendall(data)
+        if payload:
+            self.sock.sendall(payload)
+        size = _LENGTH.unpack(self._recv_exactly(4))[0]
+        response = json.loads(self._recv_exactly(size))
+        self._recv_exactly(4)  # 回覆沒有影像資料
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def _encode(self, image):
+        image = np.ascontiguousarray(image)
+        if self.mode == 'shm':
+            if self._shm is None or self._shm.size < image.nbytes:
+                self._release()
+                self._shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+            np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf)[:] = image
+            return {'kind': 'shm', 'shm': self._shm.name, 'shape': list(image.shape)}, b''
+        if self.mode == 'raw':
+            return {'kind': 'raw', 'shape': list(image.shape)}, memoryview(image).cast('B')
+        import cv2
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality] if self.mode == 'jpg' else []
+        ok, encoded = cv2.imencode(f'.{self.mode}', image, params)
+        return {'kind': self.mode}, encoded.tobytes()
+
+    def detect_one(self, image, frame_index=0, timestamp=0.0):
+        header, payload = self._encode(image)
+        response = self._request(header, payload)
+        self.last_response = response
+        return Detections(response['boxes'], response['scores'], response['classes'], frame_index, timestamp)
+
+    def detect(self, images, frame_indices=None, timestamps=None):
+        """逐張送出；要讓伺服器合併批次，請由多個用戶端（或執行緒各自的用戶端）同時送出"""
+        frame_indices = range(len(images)) if frame_indices is None else frame_indices
+        timestamps = [0.0] * len(images) if timestamps is None else timestamps
+        return [self.detect_one(image, i, t) for image, i, t in zip(images, frame_indices, timestamps)]
+
+    def detect_frames(self, frames):
+        return self.detect([f.image for f in frames], [f.index for f in frames], [f.timestamp for f in frames])
+
+    def _release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self._release()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本機偵測服務（動態批次）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', default=None, help='改用 Unix socket 路徑')
+    parser.add_argument('--weights', default=None)
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnx'], default='auto')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-latency-ms', type=float, default=5.0, help='第一個請求最多等待多久湊批次')
+    parser.add_argument('--metrics-port', type=int, default=9108, help='0 表示不啟動 /metrics')
+    args = parser.parse_args(argv)
+
+    from recognition.detector import load_engine
+    try:
+        engine = load_engine(args.weights, backend=args.backend, batch_size=args.batch_size)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    if args.metrics_port:
+        from recognition.metrics import serve
+        serve(args.metrics_port)
+    server = DetectionServer(engine, args.max_latency_ms / 1000)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
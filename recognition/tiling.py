@@ -0,0 +1,178 @@
+import numpy as np
+
+from recognition.detections import Detections, box_iou, nms
+from recognition.metrics import metrics
+
+
+def tile_grid(width, height, tile, overlap=0.2):
+    """以 tile x tile 的重疊方塊覆蓋整張影像，回傳 Tx4 的 xyxy（最後一列/行貼齊影像邊緣）"""
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(size):
+        if size <= tile:
+            return np.zeros(1, dtype=np.int32)
+        s = np.arange(0, size - tile, stride, dtype=np.int32)
+        return np.append(s, size - tile)
+
+    xs, ys = starts(width), starts(height)
+    x, y = np.meshgrid(xs, ys)
+    x, y = x.reshape(-1), y.reshape(-1)
+    return np.stack([x, y, np.minimum(x + tile, width), np.minimum(y + tile, height)], axis=1)
+
+
+def weighted_boxes_fusion(boxes, scores, classes, iou_threshold=0.55):
+    """加權框融合：以 NMS 保留的框為群組代表，每個框併入同類別中 IoU 最高的代表，座標以信心值加權平均
+
+    回傳 (boxes, scores, classes)，群組信心值取群組內最高值。
+    """
+    if len(boxes) == 0:
+        return boxes, scores, classes
+    heads = nms(boxes, scores, iou_threshold, classes)
+    ious = box_iou(boxes[heads], boxes)
+    ious[classes[heads][:, None] != classes[None, :]] = 0.0
+    ious[np.arange(len(heads)), heads] = 2.0
+    cluster = ious.argmax(axis=0)
+    weights = scores.astype(np.float64)
+    fused = np.zeros((len(heads), 4))
+    np.add.at(fused, cluster, boxes * weights[:, None])
+    fused /= np.bincount(cluster, weights, len(heads))[:, None]
+    fused_scores = np.zeros(len(heads), dtype=np.float32)
+    np.maximum.at(fused_scores, cluster, scores)
+    return fused.astype(np.float32), fused_scores, classes[heads]
+
+
+def contains(outer, inner):
+    """outer（Tx4）是否完整包住 inner（Nx4），回傳 NxT 布林矩陣"""
+    return ((outer[None, :, 0] <= inner[:, None, 0]) & (outer[None, :, 1] <= inner[:, None, 1])
+            & (outer[None, :, 2] >= inner[:, None, 2]) & (outer[None, :, 3] >= inner[:, None, 3]))
+
+
+class TiledEngine:
+    """分塊推論：高解析度畫面切成重疊的方塊，以原始解析度偵測遠處的小目標
+
+    每張影格先做一次整張縮小的粗略推論，再依結果挑選值得細看的方塊，所有方塊合併成批次推論：
+      - 粗略結果中有小框（高度 < small 像素）或低信心框（< refine_conf）所在的方塊
+      - 最近 hold 張影格內在方塊中找到目標的方塊
+      - 其餘方塊輪流掃描，每張影格 scan 個，確保整個畫面定期被細看
+    每張影格最多 max_tiles 個方塊（預設為引擎的 batch_size，即一次前向運算）。
+    ONNX 引擎的批次大小固定，沒用滿的位置也會計算，可以設 scan=None 讓輪流掃描補滿批次。
+
+    方塊內碰到方塊內側邊界、又被另一個有推論的方塊完整包住的框視為被切到的半個目標而捨棄，
+    其餘結果與粗略結果以 NMS 或加權框融合（merge='wbf'）合併。tile 為方塊邊長（原圖像素），
+    預設與引擎輸入尺寸相同，方塊內不縮放。
+    """
+
+    def __init__(self, engine, tile=None, overlap=0.2, merge='nms', iou=0.5, small=48, refine_conf=0.5,
+                 hold=5, scan=1, max_tiles=None):
+        if merge not in ('nms', 'wbf'):
+            raise ValueError(f"未知的合併方式: {merge}")
+        self.engine = engine
+        self.names = engine.names
+        self.batch_size = engine.batch_size
+        self.tile = tile or engine.imgsz
+        self.overlap = overlap
+        self.merge = merge
+        self.iou = iou
+        self.small = small
+        self.refine_conf = refine_conf
+        self.hold = hold
+        self.scan = scan
+        self.max_tiles = max_tiles or engine.batch_size
+        self._grids = {}
+        self._hot = {}      # 影像尺寸 -> 各方塊剩餘的保留影格數
+        self._cursor = {}   # 影像尺寸 -> 輪流掃描的位置
+
+    def grid(self, shape):
+        key = shape[:2]
+        if key not in self._grids:
+            self._grids[key] = tile_grid(shape[1], shape[0], self.tile, self.overlap)
+            self._hot[key] = np.zeros(len(self._grids[key]), dtype=np.int32)
+            self._cursor[key] = 0
+        return self._grids[key]
+
+    def select(self, shape, coarse):
+        """依粗略結果挑選要推論的方塊索引"""
+        tiles = self.grid(shape)
+        if len(tiles) == 1:
+            return np.zeros(0, dtype=np.int64)
+        key = shape[:2]
+        boxes = coarse.boxes
+        interesting = ((boxes[:, 3] - boxes[:, 1]) < self.small) | (coarse.scores < self.refine_conf)
+        centers = (boxes[interesting, :2] + boxes[interesting, 2:]) / 2
+        inside = ((tiles[None, :, 0] <= centers[:, None, 0]) & (centers[:, None, 0] < tiles[None, :, 2])
+                  & (tiles[None, :, 1] <= centers[:, None, 1]) & (centers[:, None, 1] < tiles[None, :, 3]))
+        wanted = list(np.flatnonzero(inside.any(axis=0)))
+        wanted += [i for i in np.flatnonzero(self._hot[key] > 0) if i not in wanted]
+
+        # 輪流掃描剩下的方塊
+        scan = self.max_tiles - len(wanted) if self.scan is None else self.scan
+        cursor = self._cursor[key]
+        for _ in range(len(tiles)):
+            if scan <= 0:
+                break
+            if cursor not in wanted:
+                wanted.append(cursor)
+                scan -= 1
+            cursor = (cursor + 1) % len(tiles)
+        self._cursor[key] = cursor
+        return np.array(wanted[:self.max_tiles], dtype=np.int64)
+
+    def _combine(self, coarse, tiles, results):
+        """把方塊結果換回原圖座標，去掉被切到的框，再與粗略結果合併"""
+        boxes, scores, classes = [coarse.boxes], [coarse.scores], [coarse.class_ids]
+        width, height = tiles[:, 2].max(), tiles[:, 3].max()
+        for j, (tile, detections) in enumerate(zip(tiles, results)):
+            if len(detections) == 0:
+                continue
+            b = detections.boxes + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=np.float32)
+            # 碰到方塊內側邊界（不是影像邊界）的框
+            cut = (((b[:, 0] <= tile[0] + 1) & (tile[0] > 0)) | ((b[:, 1] <= tile[1] + 1) & (tile[1] > 0))
+                   | ((b[:, 2] >= tile[2] - 1) & (tile[2] < width)) | ((b[:, 3] >= tile[3] - 1) & (tile[3] < height)))
+            inside = contains(tiles, b)
+            inside[:, j] = False
+            covered = inside.any(axis=1)
+            keep = ~(cut & covered)
+            boxes.append(b[keep])
+            scores.append(detections.scores[keep])
+            classes.append(detections.class_ids[keep])
+        boxes, scores, classes = np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes)
+        if self.merge == 'wbf':
+            boxes, scores, classes = weighted_boxes_fusion(boxes, scores, classes, self.iou)
+        else:
+            keep = nms(boxes, scores, self.iou, classes)
+            boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+        return Detections(boxes, scores, classes, coarse.frame_index, coarse.timestamp)
+
+    def detect(self, images, frame_indices=None, timestamps=None):
+        frame_indices = range(len(images)) if frame_indices is None else frame_indices
+        timestamps = [0.0] * len(images) if timestamps is None else timestamps
+        coarse = self.engine.detect(images, frame_indices, timestamps)
+        with metrics.span('tiling'):
+            selected = [self.select(image.shape, c) for image, c in zip(images, coarse)]
+            crops = [image[y1:y2, x1:x2]
+                     for image, chosen in zip(images, selected)
+                     for x1, y1, x2, y2 in self.grid(image.shape)[chosen]]
+        results = iter(self.engine.detect(crops) if crops else [])
+        outputs = []
+        with metrics.span('tiling'):
+            for image, c, chosen in zip(images, coarse, selected):
+                key = image.shape[:2]
+                tiles = self.grid(image.shape)[chosen]
+                tile_results = [next(results) for _ in chosen]
+                hot = self._hot[key]
+                hot[hot > 0] -= 1
+                hot[chosen[[len(r) > 0 for r in tile_results]]] = self.hold
+                outputs.append(self._combine(c, tiles, tile_results) if len(chosen) else c)
+                metrics.incr('tiles_inferred', len(chosen))
+                metrics.set_gauge('tiles_per_frame', len(chosen))
+        return outputs
+
+    def detect_frames(self, frames):
+        return self.detect(
+            [f.image for f in frames],
+            [f.index for f in frames],
+            [f.timestamp for f in frames],
+        )
+
+    def detect_one(self, image):
+        return self.detect([image])[0]
@@ -0,0 +1,105 @@
+import numpy as np
+
+from recognition.detections import Detections, box_iou
+
+
+class IoUTracker:
+    """以 IoU 配對加上固定增益卡爾曼（alpha-beta）濾波的輕量追蹤器
+
+    在兩次偵測之間只呼叫 predict(dt) 以等速模型外推框的位置，
+    有新的偵測時呼叫 update() 依 IoU 配對並修正位置與速度。
+    所有追蹤目標的狀態都存在陣列中，一次更新全部。
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=1.0, alpha=0.6, beta=0.2, min_hits=1):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age  # 秒，超過這麼久沒被配對到就移除
+        self.alpha = alpha
+        self.beta = beta
+        self.min_hits = min_hits
+        self.next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.velocity = np.zeros((0, 4), dtype=np.float32)  # 每秒位移
+        self.class_ids = np.zeros(0, dtype=np.int32)
+        self.scores = np.zeros(0, dtype=np.float32)
+        self.since_update = np.zeros(0, dtype=np.float32)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.timestamp = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self, timestamp):
+        """把所有目標外推到 timestamp"""
+        if self.timestamp is not None:
+            dt = max(timestamp - self.timestamp, 0.0)
+            self.boxes += self.velocity * dt
+            self.since_update += dt
+        self.timestamp = timestamp
+
+    def update(self, detections):
+        """以新的偵測結果修正追蹤目標，回傳目前的追蹤結果 (Detections, ids)"""
+        self.predict(detections.timestamp)
+        matched_tracks, matched_dets = self._match(detections)
+
+        if len(matched_tracks):
+            residual = detections.boxes[matched_dets] - self.boxes[matched_tracks]
+            dt = np.maximum(self.since_update[matched_tracks], 1e-3)[:, None]
+            self.boxes[matched_tracks] += self.alpha * residual
+            self.velocity[matched_tracks] += self.beta * residual / dt
+            self.scores[matched_tracks] = detections.scores[matched_dets]
+            self.class_ids[matched_tracks] = detections.class_ids[matched_dets]
+            self.since_update[matched_tracks] = 0.0
+            self.hits[matched_tracks] += 1
+
+        new = np.setdiff1d(np.arange(len(detections)), matched_dets)
+        if len(new):
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+            self.next_id += len(new)
+            self.boxes = np.concatenate([self.boxes, detections.boxes[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new), 4), dtype=np.float32)])
+            self.class_ids = np.concatenate([self.class_ids, detections.class_ids[new]])
+            self.scores = np.concatenate([self.scores, detections.scores[new]])
+            self.since_update = np.concatenate([self.since_update, np.zeros(len(new), dtype=np.float32)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), dtype=np.int32)])
+
+        self._prune()
+        return self.current(detections.frame_index)
+
+    def _match(self, detections):
+        """同類別間依 IoU 由大到小貪婪配對"""
+        if len(self.ids) == 0 or len(detections) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        ious = box_iou(self.boxes, detections.boxes)
+        ious[self.class_ids[:, None] != detections.class_ids[None, :]] = 0
+        tracks, dets = np.nonzero(ious > self.iou_threshold)
+        order = np.argsort(-ious[tracks, dets], kind='stable')
+        used_t, used_d, out_t, out_d = set(), set(), [], []
+        for t, d in zip(tracks[order], dets[order]):
+            if t not in used_t and d not in used_d:
+                used_t.add(t)
+                used_d.add(d)
+                out_t.append(t)
+                out_d.append(d)
+        return np.array(out_t, dtype=np.int64), np.array(out_d, dtype=np.int64)
+
+    def _prune(self):
+        keep = self.since_update <= self.max_age
+        for name in ('ids', 'boxes', 'velocity', 'class_ids', 'scores', 'since_update', 'hits'):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def current(self, frame_index=0):
+        """目前已確認的追蹤目標 (Detections, ids)"""
+        confirmed = self.hits >= self.min_hits
+        detections = Detections(
+            self.boxes[confirmed], self.scores[confirmed], self.class_ids[confirmed],
+            frame_index, self.timestamp or 0.0,
+        )
+        return detections, self.ids[confirmed]
+
+    def step(self, frame_index, timestamp):
+        """沒有偵測的影格：只外推位置並回傳目前的追蹤結果"""
+        self.predict(timestamp)
+        self._prune()
+        return self.current(frame_index)
@@ -0,0 +1,184 @@
+import itertools
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+import cv2
+
+from recognition.metrics import metrics
+
+# 各格式的 OpenCV 編碼參數；PNG 的 quality 代表壓縮等級 0-9（越低越快）
+_ENCODE_PARAMS = {
+    'png': lambda q: [cv2.IMWRITE_PNG_COMPRESSION, 1 if q is None else int(q)],
+    'jpg': lambda q: [cv2.IMWRITE_JPEG_QUALITY, 90 if q is None else int(q)],
+    'webp': lambda q: [cv2.IMWRITE_WEBP_QUALITY, 90 if q is None else int(q)],
+}
+
+_counter = itertools.count()
+_counter_lock = threading.Lock()
+
+
+def unique_name(prefix='screenshot', ext='png'):
+    """產生不會重複的檔名：微秒時間戳加上程序內遞增序號"""
+    with _counter_lock:
+        n = next(_counter)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return f'{prefix}_{timestamp}_{os.getpid()}_{n:06d}.{ext}'
+
+
+def encode_image(image, fmt='png', quality=None):
+    """把影像編碼成指定格式的位元組"""
+    fmt = 'jpg' if fmt == 'jpeg' else fmt
+    if fmt not in _ENCODE_PARAMS:
+        raise ValueError(f"不支援的圖片格式: {fmt}")
+    ok, data = cv2.imencode(f'.{fmt}', image, _ENCODE_PARAMS[fmt](quality))
+    if not ok:
+        raise RuntimeError(f"圖片編碼失敗: {fmt}")
+    return data
+
+
+class AsyncWriter:
+    """背景存檔器：編碼與寫檔都在背景執行緒完成，呼叫端不會等待磁碟
+
+    佇列滿時 block=True 會等待（確保不遺漏），block=False 則丟棄並計數。
+    """
+
+    def __init__(self, directory='recognition/img', fmt='png', quality=None, workers=1,
+                 maxsize=64, block=False, prefix='screenshot'):
+        self.directory = directory
+        self.fmt = 'jpg' if fmt == 'jpeg' else fmt
+        self.quality = quality
+        self.block = block
+        self.prefix = prefix
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize)
+        self._threads = [
+            threading.Thread(target=self._run, name=f'writer-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, image, name=None, copy=True):
+        """排入一張待存的影像，回傳預定的檔案路徑；被丟棄時回傳 None
+
+        來源影格的緩衝區會被重複使用，預設會先複製一份。
+        """
+        path = os.path.join(self.directory, name or unique_name(self.prefix, self.fmt))
+        item = (image.copy() if copy else image, path)
+        try:
+            self._queue.put(item, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr('saves_dropped')
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            image, path = item
+            try:
+                fmt = os.path.splitext(path)[1][1:].lower() or self.fmt
+                # tofile 可處理含中文的路徑
+                with metrics.span('save'):
+                    encode_image(image, fmt, self.quality).tofile(path)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"保存圖片時發生錯誤：{e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待目前排隊中的影像全部寫完"""
+        self._queue.join()
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DetectionLog:
+    """只追加的偵測紀錄（JSON Lines），每行一張影格，由背景執行緒批次寫入"""
+
+    def __init__(self, path, names=None, maxsize=1024, flush_every=64):
+        self.path = path
+        self.names = names
+        self.flush_every = flush_every
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name='detection-log', daemon=True)
+        self._thread.start()
+
+    def append(self, detections, **extra):
+        """記錄一張影格的 Detections，extra 可附加其他欄位（例如存檔路徑）"""
+        record = {
+            'frame': int(detections.frame_index),
+            'timestamp': round(float(detections.timestamp), 4),
+            'boxes': detections.boxes.round(1).tolist(),
+            'scores': detections.scores.round(4).tolist(),
+            'classes': detections.class_ids.tolist(),
+        }
+        if self.names is not None:
+            record['labels'] = [self.names.get(int(c), str(int(c))) for c in detections.class_ids]
+        if detections.carried_from is not None:
+            record['carried_from'] = int(detections.carried_from)
+        record.update(extra)
+        self._queue.put(record)
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            pending = 0
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                # extra 欄位可能有 numpy 數值或路徑物件，無法序列化的一律轉成字串；
+                # 寫入執行緒中斷的話 append 會永遠卡在已滿的佇列上，所以個別記錄的錯誤只印出來
+                try:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                except (TypeError, ValueError) as e:
+                    print(f"無法寫入偵測紀錄（影格 {record.get('frame')}）：{e}")
+                    continue
+                pending += 1
+                # 佇列空了或累積夠多筆時才 flush，減少系統呼叫
+                if pending >= self.flush_every or self._queue.empty():
+                    f.flush()
+                    pending = 0
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_detection_log(path):
+    """逐行讀回偵測紀錄"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
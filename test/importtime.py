@@ -0,0 +1,52 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# 這些套件只能在執行對應指令時才載入
+HEAVY_MODULES = ('cv2', 'numpy', 'torch', 'ultralytics', 'onnxruntime', 'win32gui', 'pyautogui', 'pygetwindow')
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import recognition.cli
+recognition.cli.build_parser()
+elapsed = (time.perf_counter() - start) * 1000
+print(elapsed)
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+
+def measure(repeat):
+    """每次都在新的直譯器中量測 import recognition.cli（含建立 argparse）的時間，回傳 (最佳毫秒, 被載入的重套件)"""
+    best, loaded = None, set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES)],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.split('\n')
+        elapsed = float(output[0])
+        best = elapsed if best is None else min(best, elapsed)
+        loaded.update(m for m in output[1].split(',') if m)
+    return best, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='檢查命令列入口的匯入時間預算')
+    parser.add_argument('--budget-ms', type=float, default=50.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    elapsed, loaded = measure(args.repeat)
+    print(f"import recognition.cli: {elapsed:.1f} ms（預算 {args.budget_ms:.0f} ms）")
+    if loaded:
+        print(f"不應在匯入時載入: {', '.join(loaded)}")
+    ok = elapsed <= args.budget_ms and not loaded
+    print("通過" if ok else "未通過")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from recognition.detections import box_iou
+from recognition.detector import DetectionEngine, resolve_weights
+from recognition.frame_source import list_images, read_image
+from recognition.onnx_backend import OnnxDetectionEngine
+
+VAL_DIR = os.path.join(os.path.dirname(__file__), '..', 'dataset', 'images', 'val')
+
+
+def match(reference, candidate, min_iou):
+    """依分數由高到低，將 candidate 的框配對到同類別且 IoU 最高的 reference 框，回傳 (配對, IoU, 分數差)"""
+    if len(reference) == 0 or len(candidate) == 0:
+        return [], np.zeros(0), np.zeros(0)
+    ious = box_iou(reference.boxes, candidate.boxes)
+    ious[reference.class_ids[:, None] != candidate.class_ids[None, :]] = 0
+    pairs, used = [], set()
+    for i in np.argsort(-reference.scores):
+        order = [j for j in np.argsort(-ious[i]) if j not in used and ious[i, j] >= min_iou]
+        if order:
+            used.add(order[0])
+            pairs.append((i, order[0]))
+    iou = np.array([ious[i, j] for i, j in pairs])
+    score_diff = np.array([abs(reference.scores[i] - candidate.scores[j]) for i, j in pairs])
+    return pairs, iou, score_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比對 ONNX 與 PyTorch 模型在驗證集上的輸出')
+    parser.add_argument('--weights', default=None)
+    parser.add_argument('--onnx', default=None, help='預設為權重旁的 best.onnx')
+    parser.add_argument('--images', default=VAL_DIR)
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--min-iou', type=float, default=0.9, help='配對框的最低 IoU')
+    parser.add_argument('--score-tol', type=float, default=0.02, help='FP32 允許的分數差（INT8 請放寬）')
+    parser.add_argument('--match-rate', type=float, default=0.98, help='至少要配對成功的框比例')
+    args = parser.parse_args()
+
+    weights = resolve_weights(args.weights)
+    onnx_path = args.onnx or os.path.splitext(weights)[0] + '.onnx'
+    onnx_engine = OnnxDetectionEngine(onnx_path)
+    torch_engine = DetectionEngine(weights, imgsz=onnx_engine.imgsz, batch_size=onnx_engine.batch_size, device='cpu')
+
+    paths = list_images(args.images, recursive=True)[:args.limit]
+    if not paths:
+        print(f"找不到驗證集影像: {args.images}")
+        return 1
+
+    total_ref = total_onnx = matched = 0
+    ious, diffs = [], []
+    for path in paths:
+        image = read_image(path)
+        if image is None:
+            continue
+        reference = torch_engine.detect_one(image)
+        candidate = onnx_engine.detect_one(image)
+        pairs, iou, score_diff = match(reference, candidate, args.min_iou)
+        total_ref += len(reference)
+        total_onnx += len(candidate)
+        matched += len(pairs)
+        ious.append(iou)
+        diffs.append(score_diff)
+        if len(pairs) != max(len(reference), len(candidate)):
+            print(f"{os.path.basename(path)}: PyTorch {len(reference)} 框、ONNX {len(candidate)} 框、配對 {len(pairs)}")
+
+    ious = np.concatenate(ious) if ious else np.zeros(0)
+    diffs = np.concatenate(diffs) if diffs else np.zeros(0)
+    rate = matched / max(total_ref, total_onnx, 1)
+    print(f"影像 {len(paths)} 張，PyTorch {total_ref} 框，ONNX {total_onnx} 框，配對 {matched}（{rate:.1%}）")
+    if matched:
+        print(f"IoU 最小 {ious.min():.4f} 平均 {ious.mean():.4f}，分數差最大 {diffs.max():.4f} 平均 {diffs.mean():.4f}")
+
+    ok = rate >= args.match_rate and (not matched or diffs.max() <= args.score_tol)
+    print("通過" if ok else "未通過")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
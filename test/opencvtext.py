@@ -64,7 +64,8 @@ def load_model():
     model_path = os.path.join(script_dir, '..', 'yolov5', 'runs', 'train', 'exp2', 'weights', 'best.pt')
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"模型權重檔案不存在: {model_path}，請確認路徑是否正確。")
-    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, force_reload=True)
+    # 使用本機快取的 yolov5 程式碼，不要每次啟動都重新下載
+    model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path, force_reload=False, skip_validation=True)
     model = model.to(torch.device('cuda' if torch.cuda.is_available() else 'cpu'))
     return model
 
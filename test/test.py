@@ -1,14 +1,19 @@
 import cv2
-import torch
 import os
+import sys
 import numpy as np
 import time
-from ultralytics import YOLO
 import win32gui
 import win32ui
 import win32con
 import win32api
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from recognition.detector import load_engine
+from recognition.gate import GatedEngine
+from recognition.render import Renderer
+from recognition.metrics import install_profile_signal, metrics, serve
+
 def get_window_rect(window_name):
     hwnd = win32gui.FindWindow(None, window_name)
     if hwnd:
@@ -54,55 +59,21 @@ def list_windows():
     win32gui.EnumWindows(enum_handler, windows)
     return windows
 
-def perform_detection(model, image):
-    # 將圖像轉換為 (batch, channel, height, width)
-    image_resized = cv2.resize(image, (640, 640))  # 確保圖像大小一致
-    image_tensor = torch.from_numpy(image_resized).permute(2, 0, 1).unsqueeze(0).float() / 255.0  # 歸一化到 0.0 到 1.0
-
-    # 將圖像轉移到 GPU（如果可用）
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    image_tensor = image_tensor.to(device)
-
-    # 執行檢測
-    results = model(image_tensor)
-
-    # 獲取帶有邊界框的圖像
-    annotated_image = image.copy()
-
-    # 檢查是否有檢測到物體
-    if len(results) > 0:
-        for result in results:  # 迭代每個檢測到的物體
-            if result.boxes.xyxy.shape[0] > 0:  # 檢查是否有檢測到的框
-                x1, y1, x2, y2, conf, cls = result.boxes.xyxy[0].tolist() + result.boxes.conf[0].tolist() + result.boxes.cls[0].tolist()
-                x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
-                cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 255, 0), 2)  # 畫出邊界框
+def perform_detection(engine, renderer, image):
+    # 前處理、推論與座標還原都交給常駐的 DetectionEngine
+    with metrics.span('detect'):
+        detections = engine.detect_one(image)
 
-                # 確保類別索引存在於 model.names 中
-                if int(cls) in model.names:
-                    label = f'{model.names[int(cls)]}: {conf:.2f}'
-                else:
-                    label = f'Class {int(cls)}: {conf:.2f}'
-
-                cv2.putText(annotated_image, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-    return annotated_image
+    # 標註延遲到真的要顯示時才畫，畫在重複使用的緩衝區上
+    return renderer.annotate(image, detections)
 
 def load_model():
-    # 定義和初始化 YOLOv8 模型
-    model_path = r'\..\yolov8\runs\detect\train\weights\best.pt'  # 更新為你的模型權重文件的正確路徑
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"{model_path} does not exist")
-    model = YOLO(model_path)  # 使用 YOLOv8n 模型，你可以根據需要選擇其他版本
-    return model
+    # 模型只在啟動時載入一次，權重由訓練登錄表決定（python -m training.registry promote）
+    # 權重旁有匯出的 best.onnx（python -m training.export）時改用 ONNX Runtime
+    # 選單、暫停等畫面沒有變化時沿用上一次的結果，跳過比例可從 /metrics 的 gate_skip_rate 查看
+    return GatedEngine(load_engine(batch_size=1))
 
 def main():
-    # 加載模型
-    try:
-        model = load_model()
-    except FileNotFoundError as e:
-        print(e)
-        return
-
     # 列出所有可選擇的應用程式窗口
     windows = list_windows()
     print("可選擇的應用程式窗口:")
@@ -113,6 +84,18 @@ def main():
     window_index = int(input("請輸入應用程式編號: ")) - 1
     window_name = windows[window_index]
 
+    # 加載模型（在選擇視窗之後，列出視窗時不必等待模型載入）
+    try:
+        model = load_model()
+    except FileNotFoundError as e:
+        print(e)
+        return
+    renderer = Renderer(model.names)
+
+    # 各階段耗時可從 /metrics 查看，送出 SIGBREAK (Ctrl+Break) 可擷取效能剖析
+    serve()
+    install_profile_signal()
+
     while True:
         start_time = time.time()
 
@@ -120,10 +103,11 @@ def main():
         screenshot = capture_window(window_name)
 
         # 執行檢測
-        annotated_image = perform_detection(model, screenshot)
+        annotation = perform_detection(model, renderer, screenshot)
 
         # 顯示結果
-        cv2.imshow('YOLOv8 Detection', annotated_image)
+        with metrics.span('display'):
+            cv2.imshow('YOLOv8 Detection', annotation.image)
 
         # 計算並顯示 FPS
         end_time = time.time()
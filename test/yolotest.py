@@ -1,50 +1,30 @@
 import cv2
-import torch
 import os
+import sys
 import pyautogui
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
 import time
-from ultralytics import YOLO
 
-def perform_detection(model, image, output_dir):
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from recognition.detector import load_engine
+from recognition.metrics import install_profile_signal, metrics, serve
+from recognition.frame_source import FrameSource
+from recognition.pipeline import detection_pipeline
+from recognition.render import Renderer
+from recognition.writer import AsyncWriter, DetectionLog, unique_name
+
+def perform_detection(engine, renderer, image, output_dir):
     # 記錄開始時間
     start_time = time.time()
 
-    # 將圖像轉換為 (batch, channel, height, width)
+    # 前處理、推論與座標還原都交給常駐的 DetectionEngine
     image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    image_resized = cv2.resize(image, (640, 640))  # 確保圖像大小一致
-    image_tensor = torch.from_numpy(image_resized).permute(2, 0, 1).unsqueeze(0).float() / 255.0  # 歸一化到 0.0 到 1.0
-
-    # 將圖像轉移到 GPU（如果可用）
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    image_tensor = image_tensor.to(device)
-
-    # 執行檢測
-    results = model(image_tensor)
-
-    # 獲取帶有邊界框的圖像
-    annotated_image = image.copy()
-    person_detected = False
-
-    # 檢查是否有檢測到物體
-    if len(results) > 0:
-        for result in results:  # 迭代每個檢測到的物體
-            if result.boxes.xyxy.shape[0] > 0:  # 檢查是否有檢測到的框
-                x1, y1, x2, y2, conf, cls = result.boxes.xyxy[0].tolist() + result.boxes.conf[0].tolist() + result.boxes.cls[0].tolist()
-                x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
-                cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 255, 0), 2)  # 畫出邊界框
-
-                # 確保類別索引存在於 model.names 中
-                if int(cls) in model.names:
-                    label = f'{model.names[int(cls)]}: {conf:.2f}'
-                    if model.names[int(cls)] == 'person':
-                        person_detected = True
-                else:
-                    label = f'Class {int(cls)}: {conf:.2f}'
-
-                cv2.putText(annotated_image, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    with metrics.span('detect'):
+        detections = engine.detect_one(image)
+
+    # 標註延遲到真的需要（存檔或顯示）時才畫
+    annotation = renderer.annotate(image, detections)
+    person_detected = detections.has_class(engine.names, 'person')
 
     # 計算處理時間
     end_time = time.time()
@@ -53,18 +33,23 @@ def perform_detection(model, image, output_dir):
 
     # 如果檢測到人物，保存結果
     if person_detected:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(output_dir, f'screenshot_{timestamp}.png')
-        cv2.imwrite(output_file, annotated_image)
+        output_file = os.path.join(output_dir, unique_name())
+        cv2.imwrite(output_file, annotation.image)
         print(f"檢測結果已保存到 '{output_file}'")
 
-    return annotated_image
+    return annotation
 
 def load_model():
-    # 定義和初始化 YOLOv8 模型
-    model_path = r'..\yolov8\runs\detect\train\weights\best.pt'  # 使用原始字符串來避免轉義字符問題
-    model = YOLO(model_path)  # 使用 YOLOv8n 模型，你可以根據需要選擇其他版本
-    return model
+    # 模型只在啟動時載入一次，權重由訓練登錄表決定（python -m training.registry promote）
+    # 權重旁有匯出的 best.onnx（python -m training.export）時改用 ONNX Runtime
+    return load_engine(batch_size=1)
+
+class DesktopSource(FrameSource):
+    """以 pyautogui 擷取整個螢幕"""
+
+    def _grab(self):
+        image = cv2.cvtColor(np.array(pyautogui.screenshot()), cv2.COLOR_RGB2BGR)
+        return image, time.time()
 
 def main():
     # 確認輸出資料夾存在
@@ -72,27 +57,36 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     # 加載模型
-    model = load_model()
-
-    # 使用多執行緒進行檢測
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        while True:
-            start_time = time.time()
-
-            # 截圖螢幕
-            screenshot = pyautogui.screenshot()
-
-            # 提交檢測任務
-            future = executor.submit(perform_detection, model, screenshot, output_dir)
-            annotated_image = future.result()
-
-            # 計算並顯示 FPS
-            end_time = time.time()
-            fps = 1 / (end_time - start_time)
-            print(f"FPS: {fps:.2f}")
-
-            # 確保至少 1000 FPS
-            time.sleep(max(0, 1/1000 - (end_time - start_time)))
+    engine = load_model()
+
+    # 各階段耗時可從 /metrics 查看，送出 SIGUSR1 / SIGBREAK 可擷取效能剖析
+    serve()
+    install_profile_signal()
+
+    # 存檔與紀錄都在背景執行緒進行，推論不會等待磁碟
+    writer = AsyncWriter(output_dir, fmt='jpg', quality=90)
+    log = DetectionLog(os.path.join(output_dir, 'detections.jsonl'), engine.names)
+    renderer = Renderer(engine.names)
+
+    def save_if_person(frame, detections):
+        log.append(detections)
+        # 如果檢測到人物，保存結果
+        if detections.has_class(engine.names, 'person'):
+            # 畫在 renderer 的緩衝區上，submit 時複製一份交給背景執行緒
+            output_file = writer.submit(renderer.render(frame.image, detections))
+            print(f"檢測結果已排入存檔 '{output_file}'")
+
+    # 擷取、前處理、推論、存檔分別在不同執行緒同時進行；即時畫面只保留最新影格
+    pipeline = detection_pipeline(DesktopSource(), engine, save_if_person, drop_policy='latest')
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    finally:
+        writer.close()
+        log.close()
+    stats = pipeline.stats()
+    print(f"FPS: {stats['fps']:.2f}，丟棄影格: {stats['dropped']}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
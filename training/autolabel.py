@@ -0,0 +1,244 @@
+"""以模型協助標註新的角色圖片
+
+找出 dataset/images 底下還沒有標註（沒有 .txt 或 .txt 是空的）的圖片，以目前選定的模型
+（或 recognition/deal_with.py 的 HOG 人形偵測）批次推論，把候選標註寫到 dataset/proposals：
+
+    proposals/labels/<同 images 的相對路徑>.txt   每行 cls x y w h conf（YOLO 格式加上信心值）
+    proposals/review.txt                         需要人工確認的圖片，依最低信心值由低到高排列
+    proposals/duplicates.txt                     與其他圖片幾乎相同而略過的圖片 -> 保留的那張
+    proposals/report.json                        統計
+
+近似重複以 64 位元 dHash 判斷（漢明距離 <= --dedup），已經有標註的圖片也會列入比較，
+同一個畫面不會被標兩次。--accept 會把所有框信心值都不低於門檻的候選標註（去掉信心值欄位）
+直接寫進 dataset/labels，其餘留給人工確認。
+
+    python -m training.autolabel
+    python -m training.autolabel --detector hog --review-below 0.6
+    python -m training.autolabel --accept 0.8
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from recognition.frame_source import read_image
+from recognition.gate import dhash
+from training.dataset_index import DATASET_DIR, IMAGE_EXTENSIONS, label_path_for
+
+PROPOSALS_DIR = os.path.join(DATASET_DIR, 'proposals')
+
+
+def has_label(root, image_rel):
+    path = os.path.join(root, 'labels', label_path_for(image_rel))
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def list_dataset_images(root=DATASET_DIR):
+    """dataset/images 底下所有圖片的相對路徑（不含 images/ 前綴）"""
+    base = os.path.join(root, 'images')
+    found = []
+    for dirpath, _, filenames in os.walk(base):
+        for name in filenames:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), base).replace(os.sep, '/'))
+    return sorted(found)
+
+
+def image_hash(path):
+    """64 位元 dHash，以 uint64 表示；無法讀取時回傳 None"""
+    image = read_image(path)
+    if image is None:
+        return None
+    return int(np.packbits(dhash(image)).view('>u8')[0])
+
+
+def hamming(value, values):
+    """value 與陣列中每個 uint64 的漢明距離"""
+    xor = np.bitwise_xor(values, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class HashIndex:
+    """近似重複查詢：保留下來的雜湊存在可成長的 uint64 陣列中，一次比較全部"""
+
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._names = []
+
+    def find(self, value):
+        n = len(self._names)
+        if n == 0:
+            return None
+        distances = hamming(value, self._hashes[:n])
+        best = int(distances.argmin())
+        return self._names[best] if distances[best] <= self.max_distance else None
+
+    def add(self, value, name):
+        n = len(self._names)
+        if n == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros(n, dtype=np.uint64)])
+        self._hashes[n] = value
+        self._names.append(name)
+
+
+def dedup(root, labeled, unlabeled, max_distance, workers=8):
+    """回傳 (要推論的圖片, {重複的圖片: 保留的圖片})；已標註的圖片優先保留"""
+    paths = [os.path.join(root, 'images', rel) for rel in labeled + unlabeled]
+    with ThreadPoolExecutor(workers) as pool:
+        hashes = list(pool.map(image_hash, paths))
+    index = HashIndex(max_distance)
+    keep, duplicates = [], {}
+    for i, (rel, value) in enumerate(zip(labeled + unlabeled, hashes)):
+        if value is None:
+            continue
+        original = index.find(value)
+        if original is not None and i >= len(labeled):
+            duplicates[rel] = original
+            continue
+        index.add(value, rel)
+        if i >= len(labeled):
+            keep.append(rel)
+    return keep, duplicates
+
+
+def make_detector(kind, weights=None, batch_size=8, conf=0.1):
+    """回傳 (detect(images) -> [Detections], names, batch_size, close())"""
+    if kind == 'hog':
+        from recognition.deal_with import HOG_NAMES, HogPersonDetector
+        detector = HogPersonDetector(scale=0.5)
+        return lambda images: detector.detect_batch(images), HOG_NAMES, batch_size * 4, detector.close
+    from recognition.detector import load_engine
+    # 信心門檻放低，低信心的框也要列出來給人工確認
+    engine = load_engine(weights, batch_size=batch_size, conf=conf)
+    return engine.detect, engine.names, engine.batch_size, lambda: None
+
+
+def write_proposal(path, detections, width, height):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    boxes = detections.boxes
+    with open(path, 'w', encoding='utf-8') as f:
+        for (x1, y1, x2, y2), score, c in zip(boxes, detections.scores, detections.class_ids):
+            x, y = (x1 + x2) / 2 / width, (y1 + y2) / 2 / height
+            w, h = (x2 - x1) / width, (y2 - y1) / height
+            f.write(f'{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f} {score:.4f}\n')
+
+
+def read_proposal_scores(path):
+    with open(path, encoding='utf-8') as f:
+        return np.array([float(line.split()[5]) for line in f if len(line.split()) == 6], dtype=np.float32)
+
+
+def accept_proposal(proposal, label):
+    """把候選標註（去掉信心值）寫成正式標註"""
+    os.makedirs(os.path.dirname(label), exist_ok=True)
+    with open(proposal, encoding='utf-8') as f, open(label, 'w', encoding='utf-8') as out:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 6:
+                out.write(' '.join(parts[:5]) + '\n')
+
+
+def autolabel(root=DATASET_DIR, out=PROPOSALS_DIR, detector='yolo', weights=None, batch_size=8,
+              min_conf=0.1, review_below=0.5, accept=None, max_distance=4, rebuild=False):
+    """對未標註的圖片產生候選標註，回傳報告"""
+    images = list_dataset_images(root)
+    labeled = [rel for rel in images if has_label(root, rel)]
+    unlabeled = [rel for rel in images if not has_label(root, rel)]
+    kept, duplicates = dedup(root, labeled, unlabeled, max_distance)
+    todo = kept
+
+    def proposal_path(rel):
+        return os.path.join(out, 'labels', label_path_for(rel))
+
+    if not rebuild:
+        # 已有候選標註且比圖片新的不再推論
+        todo = [rel for rel in todo if not (
+            os.path.exists(proposal_path(rel))
+            and os.path.getmtime(proposal_path(rel)) >= os.path.getmtime(os.path.join(root, 'images', rel))
+        )]
+
+    report = {'images': len(images), 'labeled': len(labeled), 'unlabeled': len(unlabeled),
+              'duplicates': len(duplicates), 'inferred': 0, 'proposed_boxes': 0, 'accepted': 0}
+    if todo:
+        detect, names, batch, close = make_detector(detector, weights, batch_size, min_conf)
+        report['names'] = {int(k): v for k, v in names.items()}
+        try:
+            for start in range(0, len(todo), batch):
+                chunk = todo[start:start + batch]
+                loaded = [(rel, read_image(os.path.join(root, 'images', rel))) for rel in chunk]
+                loaded = [(rel, image) for rel, image in loaded if image is not None]
+                if not loaded:
+                    continue
+                for (rel, image), detections in zip(loaded, detect([image for _, image in loaded])):
+                    detections = detections.filter(min_score=min_conf)
+                    h, w = image.shape[:2]
+                    write_proposal(proposal_path(rel), detections, w, h)
+                    report['inferred'] += 1
+                    report['proposed_boxes'] += len(detections)
+                print(f"\r已推論 {report['inferred']}/{len(todo)}", end='')
+        finally:
+            close()
+        print()
+
+    # 審核清單包含這次與先前產生、仍未標註的所有候選標註
+    review = []
+    for rel in kept:
+        path = proposal_path(rel)
+        if not os.path.exists(path):
+            continue
+        scores = read_proposal_scores(path)
+        lowest = float(scores.min()) if len(scores) else 0.0
+        if lowest < review_below:
+            review.append((lowest, rel, len(scores)))
+        elif accept is not None and lowest >= accept:
+            accept_proposal(path, os.path.join(root, 'labels', label_path_for(rel)))
+            report['accepted'] += 1
+
+    os.makedirs(out, exist_ok=True)
+    review.sort()
+    with open(os.path.join(out, 'review.txt'), 'w', encoding='utf-8') as f:
+        for lowest, rel, n in review:
+            f.write(f'{lowest:.4f}\t{n}\timages/{rel}\n')
+    with open(os.path.join(out, 'duplicates.txt'), 'w', encoding='utf-8') as f:
+        for rel, original in sorted(duplicates.items()):
+            f.write(f'images/{rel}\timages/{original}\n')
+    report['review'] = len(review)
+    with open(os.path.join(out, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以模型協助標註新的角色圖片')
+    parser.add_argument('--root', default=DATASET_DIR)
+    parser.add_argument('--out', default=PROPOSALS_DIR)
+    parser.add_argument('--detector', choices=['yolo', 'hog'], default='yolo')
+    parser.add_argument('--weights', default=None, help='預設為登錄表選定的模型')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--min-conf', type=float, default=0.1, help='低於此信心值的框不列入候選')
+    parser.add_argument('--review-below', type=float, default=0.5, help='最低信心值低於此值（或沒有框）的圖片需要人工確認')
+    parser.add_argument('--accept', type=float, default=None, help='所有框都不低於此信心值時直接寫入 dataset/labels')
+    parser.add_argument('--dedup', type=int, default=4, help='dHash 漢明距離不超過此值視為重複')
+    parser.add_argument('--rebuild', action='store_true', help='忽略已有的候選標註，全部重新推論')
+    args = parser.parse_args()
+
+    try:
+        report = autolabel(args.root, args.out, args.detector, args.weights, args.batch_size,
+                           args.min_conf, args.review_below, args.accept, args.dedup, args.rebuild)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    print(f"圖片 {report['images']} 張，已標註 {report['labeled']}，未標註 {report['unlabeled']}，"
+          f"重複略過 {report['duplicates']}")
+    print(f"推論 {report['inferred']} 張，候選框 {report['proposed_boxes']} 個，"
+          f"待確認 {report['review']} 張，直接採用 {report['accepted']} 張")
+    print(f"結果在 '{args.out}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
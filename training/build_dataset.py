@@ -0,0 +1,240 @@
+"""由角色資料夾建立多類別 YOLO 資料集
+
+dataset/images/<split>/<角色>/ 的資料夾名稱就是類別名稱。每個角色資料夾中的標註框
+一律改寫成該角色的類別編號，圖片以硬連結（不行時用符號連結，再不行才複製）放到
+dataset/build/ 底下的單一 YOLO 結構，並產生使用相對路徑的 data.yaml。
+
+train/val 依「角色/檔名」的雜湊值排序後按比例切分，每個類別各自切分，結果固定不變。
+類別編號與各資料夾的檔案指紋記錄在 build/state.json，只有內容變動的角色資料夾會重新處理，
+新增的角色會接在既有類別之後，不會改變舊類別的編號。
+
+    python -m training.build_dataset
+    python -m training.build_dataset --val-ratio 0.2 --write-yaml yolov8/data.yaml
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from training.dataset_index import DATASET_DIR, IMAGE_EXTENSIONS, LABEL_METADATA, parse_label
+
+BUILD_DIR = os.path.join(DATASET_DIR, 'build')
+SPLITS = ('train', 'val')
+# 輸出檔名規則的版本，改變時所有類別都要重新處理
+LAYOUT_VERSION = 2
+
+
+def discover_classes(root=DATASET_DIR, previous=None):
+    """由 images/<split>/ 底下的資料夾決定類別；已存在的類別保留原編號，新類別依名稱排序接在後面"""
+    found = set()
+    for split in SPLITS:
+        split_dir = os.path.join(root, 'images', split)
+        if os.path.isdir(split_dir):
+            found.update(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    names = [n for n in (previous or []) if n in found]
+    names += sorted(found - set(names))
+    # 保留已消失類別的位置會讓編號出現空洞，這裡只保留仍存在的類別
+    return names
+
+
+def collect(root, name):
+    """列出某角色在所有 split 中的 (圖片相對路徑, 標註相對路徑或 None)，以及指紋"""
+    items, fingerprint = [], []
+    for split in SPLITS:
+        image_dir = os.path.join(root, 'images', split, name)
+        label_dir = os.path.join(root, 'labels', split, name)
+        if not os.path.isdir(image_dir):
+            continue
+        labels = {}
+        if os.path.isdir(label_dir):
+            for entry in os.scandir(label_dir):
+                if entry.name.endswith('.txt') and entry.name not in LABEL_METADATA:
+                    labels[os.path.splitext(entry.name)[0]] = entry
+        for entry in sorted(os.scandir(image_dir), key=lambda e: e.name):
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            st = entry.stat()
+            label = labels.get(os.path.splitext(entry.name)[0])
+            label_st = label.stat() if label else None
+            image_rel = f'images/{split}/{name}/{entry.name}'
+            label_rel = f'labels/{split}/{name}/{label.name}' if label else None
+            items.append((image_rel, label_rel))
+            fingerprint.append([image_rel, st.st_size, st.st_mtime_ns,
+                                label_st.st_size if label_st else None, label_st.st_mtime_ns if label_st else None])
+    return items, fingerprint
+
+
+def split_items(name, items, val_ratio):
+    """同一類別內依雜湊排序後取前 val_ratio 做驗證集，結果與檔案列出順序無關"""
+    def key(item):
+        return hashlib.sha1(f'{name}/{os.path.basename(item[0])}'.encode('utf-8')).hexdigest()
+    ordered = sorted(items, key=key)
+    n_val = int(round(len(ordered) * val_ratio))
+    if len(ordered) >= 2:
+        n_val = min(max(n_val, 1), len(ordered) - 1)
+    return {'val': ordered[:n_val], 'train': ordered[n_val:]}
+
+
+def link_or_copy(src, dst):
+    """硬連結 -> 符號連結 -> 複製"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def output_stem(name, image_rel, used=None):
+    """輸出檔名：<角色>__<原 split>__<原檔名>，空白換成底線避免工具處理路徑出錯
+
+    給定 used（已使用的小寫檔名集合）時，撞名（例如 'bot (1)' 與 'bot_(1)'、或 a.jpg 與 a.png）
+    會在後面加上原路徑的雜湊值，並把結果加進 used。
+    """
+    source_split = image_rel.split('/')[1]
+    stem = f"{name}__{source_split}__{os.path.splitext(os.path.basename(image_rel))[0].replace(' ', '_')}"
+    if used is not None:
+        if stem.lower() in used:
+            stem += '_' + hashlib.sha1(image_rel.encode('utf-8')).hexdigest()[:8]
+        used.add(stem.lower())
+    return stem
+
+
+def build_class(root, out, name, class_id, items, val_ratio):
+    """處理單一角色資料夾，回傳 (輸出檔案列表, 統計, 錯誤)"""
+    outputs, errors = [], {}
+    stats = {'train': 0, 'val': 0, 'unlabeled': 0, 'boxes': 0, 'links': {}}
+    labeled = [item for item in items if item[1] is not None]
+    stats['unlabeled'] = len(items) - len(labeled)
+    used = set()
+    for split, chosen in split_items(name, labeled, val_ratio).items():
+        for image_rel, label_rel in chosen:
+            # 原本是單一類別標註，框一律屬於這個角色；類別編號只檢查格式，不檢查範圍
+            boxes, label_errors = parse_label(os.path.join(root, label_rel), nc=1 << 16)
+            if label_errors:
+                errors[label_rel] = label_errors
+            if len(boxes) == 0:
+                stats['unlabeled'] += 1
+                continue
+            stem = output_stem(name, image_rel, used)
+            ext = os.path.splitext(image_rel)[1].lower()
+            image_out = os.path.join(out, 'images', split, stem + ext)
+            label_out = os.path.join(out, 'labels', split, stem + '.txt')
+            method = link_or_copy(os.path.join(root, image_rel), image_out)
+            stats['links'][method] = stats['links'].get(method, 0) + 1
+            with open(label_out, 'w', encoding='utf-8') as f:
+                for _, x, y, w, h in boxes:
+                    f.write(f'{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n')
+            outputs += [os.path.relpath(image_out, out), os.path.relpath(label_out, out)]
+            stats[split] += 1
+            stats['boxes'] += len(boxes)
+    return outputs, stats, errors
+
+
+def write_data_yaml(path, names, dataset_dir):
+    """寫出使用相對路徑的 data.yaml（不設定 path，ultralytics 會以 yaml 所在資料夾為基準）"""
+    base = os.path.relpath(dataset_dir, os.path.dirname(os.path.abspath(path))).replace(os.sep, '/')
+    prefix = '' if base == '.' else base + '/'
+    lines = [
+        f'train: {prefix}images/train',
+        f'val: {prefix}images/val',
+        '',
+        f'nc: {len(names)}',
+        'names: [' + ', '.join(f"'{n}'" for n in names) + ']',
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def build(root=DATASET_DIR, out=BUILD_DIR, val_ratio=0.2, workers=8, rebuild=False):
+    """建立（或增量更新）多類別資料集，回傳報告"""
+    state_path = os.path.join(out, 'state.json')
+    state = {'names': [], 'classes': {}, 'val_ratio': val_ratio}
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    old_classes = state['classes']
+    names = discover_classes(root, [] if rebuild else state['names'])
+    # 強制重建、切分比例或檔名規則改變，或有類別被移除（編號必須重排）時，所有類別都要重新處理
+    reset = (rebuild or state.get('val_ratio') != val_ratio or state.get('layout') != LAYOUT_VERSION
+             or names[:len(state['names'])] != state['names'])
+    reusable = {} if reset else old_classes
+    state['names'] = names
+    state['val_ratio'] = val_ratio
+    state['layout'] = LAYOUT_VERSION
+
+    for split in SPLITS:
+        os.makedirs(os.path.join(out, 'images', split), exist_ok=True)
+        os.makedirs(os.path.join(out, 'labels', split), exist_ok=True)
+
+    def process(class_id, name):
+        items, fingerprint = collect(root, name)
+        previous = reusable.get(name)
+        if previous and previous['fingerprint'] == fingerprint and previous['class_id'] == class_id:
+            return name, previous, {}, False
+        for rel in old_classes.get(name, {}).get('outputs', []):
+            path = os.path.join(out, rel)
+            if os.path.lexists(path):
+                os.remove(path)
+        outputs, stats, errors = build_class(root, out, name, class_id, items, val_ratio)
+        return name, {'class_id': class_id, 'fingerprint': fingerprint, 'outputs': outputs, 'stats': stats}, errors, True
+
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(lambda args: process(*args), enumerate(names)))
+
+    # 已不存在的類別，清掉它的輸出
+    for name in set(old_classes) - set(names):
+        for rel in old_classes[name].get('outputs', []):
+            path = os.path.join(out, rel)
+            if os.path.lexists(path):
+                os.remove(path)
+
+    state['classes'] = {name: entry for name, entry, _, _ in results}
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    write_data_yaml(os.path.join(out, 'data.yaml'), names, out)
+
+    return {
+        'names': names,
+        'rebuilt': [name for name, _, _, changed in results if changed],
+        'classes': {name: entry['stats'] for name, entry, _, _ in results},
+        'errors': {k: v for _, _, errors, _ in results for k, v in errors.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='由角色資料夾建立多類別 YOLO 資料集')
+    parser.add_argument('--root', default=DATASET_DIR)
+    parser.add_argument('--out', default=BUILD_DIR)
+    parser.add_argument('--val-ratio', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rebuild', action='store_true', help='忽略先前狀態，全部重建')
+    parser.add_argument('--write-yaml', default=None, help='另外寫一份指向 build 資料集的 data.yaml（例如 yolov8/data.yaml）')
+    args = parser.parse_args()
+
+    report = build(args.root, args.out, args.val_ratio, args.workers, args.rebuild)
+    if args.write_yaml:
+        write_data_yaml(args.write_yaml, report['names'], args.out)
+        print(f"data.yaml 已寫入 '{args.write_yaml}'")
+    print(f"類別 ({len(report['names'])}): {', '.join(report['names'])}")
+    print(f"重新處理: {', '.join(report['rebuilt']) or '無'}")
+    for name, stats in report['classes'].items():
+        print(f"  {name:<10} train {stats['train']:>4}  val {stats['val']:>4}  未標註 {stats['unlabeled']:>4}  框 {stats['boxes']}")
+    for rel, errors in report['errors'].items():
+        for error in errors:
+            print(f"標註錯誤 {rel}: {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""預先解碼的 memory-map 訓練快取
+
+每張圖只解碼與 letterbox 一次（與 ultralytics 相同使用 INTER_LINEAR 縮放），寫進一個 uint8 memmap 檔（N x imgsz x imgsz x 3），
+另外保存原圖尺寸、縮放參數與標註索引。讀取端各個 worker 以 mmap 開啟同一個檔案，
+資料直接來自作業系統的 page cache，不會在每個 worker 各複製一份。
+
+    python -m training.cache build --data dataset/build/data.yaml --imgsz 640
+    python -m training.cache train --data dataset/build/data.yaml --epochs 500 --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from recognition.detector import PAD_VALUE, letterbox
+from recognition.frame_source import list_images, read_image
+from training.dataset_index import DATASET_DIR, load_data_yaml, parse_label
+
+CACHE_DIR = os.path.join(DATASET_DIR, '.cache')
+CACHE_VERSION = 2
+
+
+def split_images(data_yaml, split):
+    """依 data.yaml 取得某個 split 的圖片列表（路徑相對於 yaml 所在資料夾）"""
+    data = load_data_yaml(data_yaml)
+    base = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), data.get('path', ''))
+    entries = data.get(split) or []
+    paths = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        path = os.path.join(base, entry)
+        if os.path.isdir(path):
+            paths.extend(list_images(path, recursive=True))
+        elif os.path.isfile(path):
+            # 圖片清單檔，每行一個路徑
+            with open(path, encoding='utf-8') as f:
+                paths.extend(os.path.join(os.path.dirname(path), line.strip()) for line in f if line.strip())
+    return sorted(os.path.abspath(p) for p in paths), int(data.get('nc', 1))
+
+
+def label_file(image_path):
+    """YOLO 慣例：把路徑中最後一個 images 換成 labels，副檔名改成 .txt"""
+    head, sep, tail = image_path.replace(os.sep, '/').rpartition('/images/')
+    return os.path.splitext(f'{head}/labels/{tail}' if sep else image_path)[0] + '.txt'
+
+
+def _fingerprint(paths):
+    result = []
+    for path in paths:
+        st = os.stat(path)
+        label = label_file(path)
+        label_mtime = os.stat(label).st_mtime_ns if os.path.exists(label) else None
+        result.append([path, st.st_size, st.st_mtime_ns, label_mtime])
+    return result
+
+
+def cache_dir_for(data_yaml, split, imgsz, root=CACHE_DIR):
+    name = os.path.splitext(os.path.basename(os.path.dirname(os.path.abspath(data_yaml))))[0]
+    return os.path.join(root, f'{name}_{split}_{imgsz}')
+
+
+def build_cache(data_yaml, split='train', imgsz=640, out=None, workers=8, rebuild=False):
+    """建立快取，圖片與標註都沒變動時直接沿用，回傳快取資料夾"""
+    out = out or cache_dir_for(data_yaml, split, imgsz)
+    paths, nc = split_images(data_yaml, split)
+    fingerprint = _fingerprint(paths)
+    meta_path = os.path.join(out, 'meta.json')
+    if not rebuild and os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') == CACHE_VERSION and meta.get('imgsz') == imgsz and meta.get('fingerprint') == fingerprint:
+            return out
+
+    os.makedirs(out, exist_ok=True)
+    n = len(paths)
+    images = np.lib.format.open_memmap(
+        os.path.join(out, 'images.npy'), mode='w+', dtype=np.uint8, shape=(max(n, 1), imgsz, imgsz, 3),
+    )
+    shapes = np.zeros((n, 2), dtype=np.int32)       # 原圖 (h, w)
+    resized = np.zeros((n, 2), dtype=np.int32)      # 縮放後、未填充的 (h, w)
+    transforms = np.zeros((n, 3), dtype=np.float32)  # scale, pad_x, pad_y
+    labels = [None] * n
+
+    def process(i):
+        image = read_image(paths[i])
+        if image is None:
+            images[i] = PAD_VALUE
+            labels[i] = np.zeros((0, 5), dtype=np.float32)
+            return paths[i]
+        # 直接寫進 memmap 的對應位置
+        scale, pad_x, pad_y = letterbox(image, imgsz, images[i], cv2.INTER_LINEAR)
+        h, w = image.shape[:2]
+        shapes[i] = (h, w)
+        resized[i] = (int(round(h * scale)), int(round(w * scale)))
+        transforms[i] = (scale, pad_x, pad_y)
+        label = label_file(paths[i])
+        labels[i] = parse_label(label, nc)[0] if os.path.exists(label) else np.zeros((0, 5), dtype=np.float32)
+        return None
+
+    with ThreadPoolExecutor(workers) as pool:
+        failed = [p for p in pool.map(process, range(n)) if p]
+    images.flush()
+    del images
+
+    counts = np.array([len(l) for l in labels], dtype=np.int64)
+    np.savez(
+        os.path.join(out, 'index.npz'),
+        shapes=shapes, resized=resized, transforms=transforms,
+        offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        labels=np.concatenate(labels) if n else np.zeros((0, 5), dtype=np.float32),
+    )
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'imgsz': imgsz, 'nc': nc, 'paths': paths,
+                   'fingerprint': fingerprint, 'failed': failed}, f, ensure_ascii=False)
+    for path in failed:
+        print(f"無法讀取圖片: {path}")
+    return out
+
+
+class CachedDataset:
+    """讀取 build_cache() 產生的快取
+
+    memmap 在第一次存取時才開啟，序列化（spawn 模式的 DataLoader worker）時不會帶著資料，
+    每個 worker 各自 mmap 同一個檔案。__getitem__ 回傳的影像是唯讀的零複製 view。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.imgsz = meta['imgsz']
+        self.paths = meta['paths']
+        index = np.load(os.path.join(directory, 'index.npz'))
+        self.shapes = index['shapes']
+        self.resized = index['resized']
+        self.transforms = index['transforms']
+        self.offsets = index['offsets']
+        self.labels = index['labels']
+        self._images = None
+        self._lookup = {os.path.normcase(p): i for i, p in enumerate(self.paths)}
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.load(os.path.join(self.directory, 'images.npy'), mmap_mode='r')
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.paths)
+
+    def index_of(self, path):
+        return self._lookup.get(os.path.normcase(os.path.abspath(path)))
+
+    def letterboxed_labels(self, i):
+        """第 i 張圖的標註，座標換算成 letterbox 後影像的正規化 [cls, x, y, w, h]"""
+        labels = self.labels[self.offsets[i]:self.offsets[i + 1]].copy()
+        (h0, w0), (scale, pad_x, pad_y) = self.shapes[i], self.transforms[i]
+        labels[:, 1] = (labels[:, 1] * w0 * scale + pad_x) / self.imgsz
+        labels[:, 2] = (labels[:, 2] * h0 * scale + pad_y) / self.imgsz
+        labels[:, 3] *= w0 * scale / self.imgsz
+        labels[:, 4] *= h0 * scale / self.imgsz
+        return labels
+
+    def unpadded(self, i):
+        """去掉填充的區域（等同長邊縮放到 imgsz 的圖），仍是 memmap 的 view"""
+        h, w = self.resized[i]
+        _, pad_x, pad_y = self.transforms[i].astype(int)
+        return self.images[i, pad_y:pad_y + h, pad_x:pad_x + w]
+
+    def __getitem__(self, i):
+        return self.images[i], self.letterboxed_labels(i)
+
+
+_lazy_classes = {}
+
+
+def _cached_dataset_class():
+    """建立從快取讀圖的 YOLODataset 子類別（延遲載入 ultralytics）"""
+    if 'dataset' not in _lazy_classes:
+        from ultralytics.data import YOLODataset
+
+        class CachedYOLODataset(YOLODataset):
+            def __init__(self, *args, caches=(), **kwargs):
+                self.caches = caches
+                super().__init__(*args, **kwargs)
+
+            def load_image(self, i, rect_mode=True):
+                if self.ims[i] is not None:
+                    return self.ims[i], self.im_hw0[i], self.im_hw[i]
+                for cache in self.caches:
+                    j = cache.index_of(self.im_files[i])
+                    if j is None:
+                        continue
+                    # ultralytics 的增強會就地修改影像，這裡必須複製一份（只是 memcpy，不再解碼）
+                    image = np.array(cache.unpadded(j))
+                    if not rect_mode and image.shape[:2] != (self.imgsz, self.imgsz):
+                        image = cv2.resize(image, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+                    hw0 = tuple(int(v) for v in cache.shapes[j])
+                    if self.augment:
+                        # 與 BaseDataset.load_image 相同的記錄：Mosaic 等增強從 buffer 挑選其他影像
+                        self.ims[i], self.im_hw0[i], self.im_hw[i] = image, hw0, image.shape[:2]
+                        self.buffer.append(i)
+                        if 1 < len(self.buffer) >= self.max_buffer_length:
+                            k = self.buffer.pop(0)
+                            if self.cache != 'ram':
+                                self.ims[k], self.im_hw0[k], self.im_hw[k] = None, None, None
+                    return image, hw0, image.shape[:2]
+                return super().load_image(i, rect_mode)
+
+        # 讓 spawn 模式的 DataLoader worker 能以 training.cache.CachedYOLODataset 找回這個類別
+        CachedYOLODataset.__module__ = __name__
+        CachedYOLODataset.__qualname__ = 'CachedYOLODataset'
+        _lazy_classes['dataset'] = CachedYOLODataset
+    return _lazy_classes['dataset']
+
+
+def __getattr__(name):
+    if name == 'CachedYOLODataset':
+        return _cached_dataset_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def cached_trainer(data_yaml, imgsz, workers=8):
+    """回傳會從快取讀圖的 ultralytics DetectionTrainer 子類別"""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import colorstr
+
+    caches = tuple(CachedDataset(build_cache(data_yaml, split, imgsz, workers=workers)) for split in ('train', 'val'))
+    dataset_class = _cached_dataset_class()
+
+    class CachedDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode='train', batch=None):
+            # 參數與 ultralytics.data.build_yolo_dataset 相同，只是換成從快取讀圖的類別
+            model = getattr(self.model, 'module', self.model)
+            stride = max(int(model.stride.max() if model else 0), 32)
+            cfg = self.args
+            return dataset_class(
+                img_path=img_path, imgsz=cfg.imgsz, batch_size=batch, augment=mode == 'train', hyp=cfg,
+                rect=cfg.rect or mode == 'val', cache=cfg.cache or None, single_cls=cfg.single_cls or False,
+                stride=stride, pad=0.0 if mode == 'train' else 0.5, prefix=colorstr(f'{mode}: '), task=cfg.task,
+                classes=cfg.classes, data=self.data, fraction=cfg.fraction if mode == 'train' else 1.0,
+                caches=caches,
+            )
+
+    return CachedDetectionTrainer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='預先解碼的 memory-map 訓練快取')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('build', 'train'):
+        p = sub.add_parser(name)
+        p.add_argument('--data', default=os.path.join(DATASET_DIR, 'build', 'data.yaml'))
+        p.add_argument('--imgsz', type=int, default=640)
+        p.add_argument('--workers', type=int, default=8)
+    sub.choices['build'].add_argument('--rebuild', action='store_true')
+    train = sub.choices['train']
+    train.add_argument('--model', default='yolov8n.pt')
+    train.add_argument('--epochs', type=int, default=500)
+    train.add_argument('--batch', type=int, default=16)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for split in ('train', 'val'):
+            directory = build_cache(args.data, split, args.imgsz, workers=args.workers, rebuild=args.rebuild)
+            print(f"{split}: {len(CachedDataset(directory))} 張 -> '{directory}'")
+        return 0
+
+    trainer_class = cached_trainer(args.data, args.imgsz, args.workers)
+    trainer = trainer_class(overrides=dict(
+        model=args.model, data=args.data, imgsz=args.imgsz, epochs=args.epochs,
+        batch=args.batch, workers=args.workers, cache=False,
+    ))
+    trainer.train()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""資料集索引與完整性檢查
+
+平行掃描 dataset/images 與 dataset/labels，檢查每一行 YOLO 標註（類別編號是否小於 nc、
+座標是否在 0~1 之間），列出沒有標註的圖片、沒有圖片的標註與其他雜項檔案，
+並把圖片尺寸與所有框寫成可 memory-map 的快取清單（dataset/.manifest）。
+檔案的大小與 mtime 沒變時直接沿用快取，只重新解析有變動的檔案。
+
+    python -m training.dataset_index
+    python -m training.dataset_index --rebuild --data yolov8/data.yaml
+"""
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DATASET_DIR = os.path.join(ROOT_DIR, 'dataset')
+DATA_YAML = os.path.join(ROOT_DIR, 'yolov8', 'data.yaml')
+MANIFEST_DIRNAME = '.manifest'
+MANIFEST_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+# labelImg 產生的類別清單，不是標註檔
+LABEL_METADATA = ('classes.txt',)
+
+
+def load_data_yaml(path=DATA_YAML):
+    """讀取 data.yaml，回傳 dict"""
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def image_size(path):
+    """只讀檔頭取得圖片 (寬, 高)，不解碼整張圖；無法辨識或檔案被截斷時回傳 None"""
+    try:
+        return _read_image_size(path)
+    except struct.error:
+        # 檔頭不完整，交給呼叫端當作無法讀取的圖片
+        return None
+
+
+def _read_image_size(path):
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM'):
+            w, h = struct.unpack('<ii', head[18:26])
+            return w, abs(h)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return None  # WebP 有多種變體，交給 OpenCV
+        if head.startswith(b'\xff\xd8'):
+            # 依序找 SOF 區段
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if length < 2:
+                    return None
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack('>xHH', f.read(5))
+                    return w, h
+                f.seek(length - 2, 1)
+    return None
+
+
+def _image_size_fallback(path):
+    size = image_size(path)
+    if size is None:
+        import cv2
+        image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None
+        size = (image.shape[1], image.shape[0])
+    return size
+
+
+def parse_label(path, nc):
+    """解析一個 YOLO 標註檔，回傳 (Nx5 float32 陣列 [cls, x, y, w, h], 錯誤列表)"""
+    rows, errors = [], []
+    with open(path, encoding='utf-8') as f:
+        for lineno, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                errors.append(f"第 {lineno} 行欄位數為 {len(parts)}，應為 5")
+                continue
+            try:
+                values = [float(p) for p in parts]
+            except ValueError:
+                errors.append(f"第 {lineno} 行含有非數字內容")
+                continue
+            if not all(math.isfinite(v) for v in values):
+                errors.append(f"第 {lineno} 行數值無效")
+                continue
+            cls, x, y, w, h = values
+            if cls != int(cls) or not 0 <= cls < nc:
+                errors.append(f"第 {lineno} 行類別 {parts[0]} 超出範圍 0~{nc - 1}")
+                continue
+            if not (0 <= x <= 1 and 0 <= y <= 1 and 0 < w <= 1 and 0 < h <= 1):
+                errors.append(f"第 {lineno} 行座標未正規化到 0~1")
+                continue
+            if x - w / 2 < -1e-3 or x + w / 2 > 1 + 1e-3 or y - h / 2 < -1e-3 or y + h / 2 > 1 + 1e-3:
+                errors.append(f"第 {lineno} 行框超出圖片範圍")
+            rows.append(values)
+    return np.array(rows, dtype=np.float32).reshape(-1, 5), errors
+
+
+def _walk(top):
+    """回傳 top 底下所有檔案的 (相對路徑, size, mtime_ns)"""
+    found = []
+    if not os.path.isdir(top):
+        return found
+    stack = [top]
+    while stack:
+        for entry in os.scandir(stack.pop()):
+            if entry.is_dir():
+                if entry.name != MANIFEST_DIRNAME:
+                    stack.append(entry.path)
+            else:
+                st = entry.stat()
+                found.append((os.path.relpath(entry.path, top).replace(os.sep, '/'), st.st_size, st.st_mtime_ns))
+    return found
+
+
+def scan(root=DATASET_DIR, workers=8):
+    """平行列出 images/ 與 labels/ 底下所有檔案"""
+    tops = []
+    for kind in ('images', 'labels'):
+        base = os.path.join(root, kind)
+        if os.path.isdir(base):
+            # 以第一層子資料夾（train/val）與第二層（角色資料夾）為單位平行掃描
+            for split in sorted(os.listdir(base)):
+                split_dir = os.path.join(base, split)
+                if os.path.isdir(split_dir):
+                    tops.extend((kind, os.path.join(split_dir, d)) for d in sorted(os.listdir(split_dir)))
+                else:
+                    tops.append((kind, split_dir))
+    files = {'images': [], 'labels': []}
+    with ThreadPoolExecutor(workers) as pool:
+        results = pool.map(lambda t: (t[0], t[1], _walk(t[1]) if os.path.isdir(t[1]) else None), tops)
+        for kind, top, found in results:
+            base = os.path.join(root, kind)
+            if found is None:
+                st = os.stat(top)
+                files[kind].append((os.path.relpath(top, base).replace(os.sep, '/'), st.st_size, st.st_mtime_ns))
+            else:
+                prefix = os.path.relpath(top, base).replace(os.sep, '/')
+                files[kind].extend((f'{prefix}/{rel}', size, mtime) for rel, size, mtime in found)
+    return files
+
+
+class Manifest:
+    """快取清單：圖片路徑、尺寸與標註框，陣列以 memory-map 方式讀取
+
+    paths[i]                      圖片相對於 dataset/images 的路徑
+    splits[i]                     train / val
+    sizes[i]                      (寬, 高)
+    boxes[offsets[i]:offsets[i+1]]  第 i 張圖的標註 [cls, x, y, w, h]
+    """
+
+    def __init__(self, directory, meta, sizes, offsets, boxes):
+        self.directory = directory
+        self.meta = meta
+        self.paths = meta['paths']
+        self.splits = meta['splits']
+        self.sizes = sizes
+        self.offsets = offsets
+        self.boxes = boxes
+
+    def __len__(self):
+        return len(self.paths)
+
+    def labels(self, i):
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    def image_path(self, i, root=DATASET_DIR):
+        return os.path.join(root, 'images', self.paths[i])
+
+    def split_indices(self, split):
+        return [i for i, s in enumerate(self.splits) if s == split]
+
+    @classmethod
+    def load(cls, root=DATASET_DIR):
+        directory = os.path.join(root, MANIFEST_DIRNAME)
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != MANIFEST_VERSION:
+            raise ValueError("快取清單版本不符，請重新建立")
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ('sizes', 'offsets', 'boxes')]
+        return cls(directory, meta, *arrays)
+
+
+def label_path_for(image_rel):
+    """圖片相對路徑對應的標註相對路徑（YOLO 慣例：副檔名換成 .txt）"""
+    return os.path.splitext(image_rel)[0] + '.txt'
+
+
+def _fingerprint(files):
+    return {rel: [size, mtime] for rel, size, mtime in files}
+
+
+def _scan_fingerprint(root, nc, workers):
+    """掃描圖片與標註資料夾，回傳 (scan 結果, 指紋)"""
+    files = scan(root, workers)
+    image_files = [f for f in files['images'] if f[0].lower().endswith(IMAGE_EXTENSIONS)]
+    label_files = [
+        f for f in files['labels']
+        if f[0].endswith('.txt') and os.path.basename(f[0]) not in LABEL_METADATA
+    ]
+    return files, {'images': _fingerprint(image_files), 'labels': _fingerprint(label_files), 'nc': nc}
+
+
+def build_manifest(root=DATASET_DIR, nc=None, workers=8, rebuild=False):
+    """建立或更新快取清單，回傳 (Manifest, 檢查報告)"""
+    if nc is None:
+        nc = int(load_data_yaml().get('nc', 1))
+    directory = os.path.join(root, MANIFEST_DIRNAME)
+    files, fingerprint = _scan_fingerprint(root, nc, workers)
+
+    # 讀取舊快取，沒變動的檔案直接沿用（全部複製出來，之後會覆寫同一批 .npy）
+    previous = {}
+    if not rebuild:
+        try:
+            old = Manifest.load(root)
+            if old.meta['fingerprint']['nc'] == nc:
+                for i, rel in enumerate(old.paths):
+                    previous[rel] = (old.meta['fingerprint']['images'].get(rel),
+                                     old.meta['fingerprint']['labels'].get(label_path_for(rel)),
+                                     tuple(int(v) for v in old.sizes[i]), np.array(old.labels(i)),
+                                     old.meta['errors'].get(rel, []))
+            # 關閉 memory-map，否則 Windows 上無法覆寫這些檔案
+            del old
+        except (OSError, ValueError, KeyError):
+            previous = {}
+    label_set = set(fingerprint['labels'])
+
+    def process(rel):
+        label_rel = label_path_for(rel)
+        cached = previous.get(rel)
+        if cached and cached[0] == fingerprint['images'][rel] and cached[1] == fingerprint['labels'].get(label_rel):
+            return rel, cached[2], cached[3], cached[4], True
+        size = _image_size_fallback(os.path.join(root, 'images', rel)) or (0, 0)
+        errors = [] if size != (0, 0) else ["無法讀取圖片"]
+        boxes = np.zeros((0, 5), dtype=np.float32)
+        if label_rel in label_set:
+            boxes, label_errors = parse_label(os.path.join(root, 'labels', label_rel), nc)
+            errors += label_errors
+        return rel, size, boxes, errors, False
+
+    image_rels = sorted(fingerprint['images'])
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(process, image_rels))
+
+    sizes = np.array([r[1] for r in results], dtype=np.int32).reshape(-1, 2)
+    counts = np.array([len(r[2]) for r in results], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    boxes = np.concatenate([r[2] for r in results]) if results else np.zeros((0, 5), dtype=np.float32)
+    errors = {r[0]: r[3] for r in results if r[3]}
+
+    image_labels = {label_path_for(rel) for rel in image_rels}
+    report = {
+        'images': len(image_rels),
+        'labeled': int((counts > 0).sum()),
+        'boxes': int(counts.sum()),
+        'reused': sum(1 for r in results if r[4]),
+        'class_counts': np.bincount(boxes[:, 0].astype(np.int64), minlength=nc).tolist() if len(boxes) else [0] * nc,
+        'orphan_images': [rel for rel in image_rels if label_path_for(rel) not in label_set],
+        'orphan_labels': sorted(rel for rel in label_set if rel not in image_labels),
+        'stray_files': sorted(
+            [f'images/{f[0]}' for f in files['images'] if not f[0].lower().endswith(IMAGE_EXTENSIONS)]
+            + [f'labels/{f[0]}' for f in files['labels'] if not f[0].endswith('.txt')]
+        ),
+        'errors': errors,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    meta = {
+        'version': MANIFEST_VERSION,
+        'paths': image_rels,
+        'splits': [rel.split('/', 1)[0] for rel in image_rels],
+        'fingerprint': fingerprint,
+        'errors': errors,
+    }
+    # 先寫暫存檔再換名，中途中斷也不會留下新舊混雜的快取
+    for name, array in (('sizes', sizes), ('offsets', offsets), ('boxes', boxes)):
+        path = os.path.join(directory, f'{name}.npy')
+        np.save(path + '.tmp.npy', array)
+        os.replace(path + '.tmp.npy', path)
+    path = os.path.join(directory, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return Manifest.load(root), report
+
+
+def load_manifest(root=DATASET_DIR, nc=None, workers=8):
+    """取得最新的快取清單，只有檔案變動時才會重新解析"""
+    if nc is None:
+        nc = int(load_data_yaml().get('nc', 1))
+    try:
+        manifest = Manifest.load(root)
+        if manifest.meta['fingerprint'] == _scan_fingerprint(root, nc, workers)[1]:
+            return manifest
+        del manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_manifest(root, nc, workers)[0]
+
+
+def check_data_yaml(path=DATA_YAML):
+    """檢查 data.yaml 中的路徑是否存在於這台電腦"""
+    problems = []
+    data = load_data_yaml(path)
+    base = os.path.dirname(path)
+    for key in ('train', 'val', 'test'):
+        value = data.get(key)
+        if value and not os.path.isdir(os.path.join(base, data.get('path', ''), value)):
+            problems.append(f"{key}: '{value}' 不存在")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='資料集索引與完整性檢查')
+    parser.add_argument('--root', default=DATASET_DIR)
+    parser.add_argument('--data', default=DATA_YAML, help='讀取 nc 的 data.yaml')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rebuild', action='store_true', help='忽略快取，全部重新解析')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出完整報告')
+    args = parser.parse_args()
+
+    nc = int(load_data_yaml(args.data).get('nc', 1))
+    _, report = build_manifest(args.root, nc, args.workers, args.rebuild)
+    report['data_yaml'] = check_data_yaml(args.data)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"圖片 {report['images']} 張，已標註 {report['labeled']} 張，共 {report['boxes']} 個框"
+              f"（沿用快取 {report['reused']} 張）")
+        print(f"各類別框數: {report['class_counts']}")
+        for title, key in (('沒有標註的圖片', 'orphan_images'), ('沒有圖片的標註', 'orphan_labels'),
+                           ('其他雜項檔案', 'stray_files'), ('data.yaml 問題', 'data_yaml')):
+            if report[key]:
+                print(f"{title} ({len(report[key])}):")
+                for item in report[key][:20]:
+                    print(f"  {item}")
+        for rel, errors in report['errors'].items():
+            for error in errors:
+                print(f"標註錯誤 {rel}: {error}")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""評估模型在驗證集上的準確度
+
+對 dataset/images/val 推論一次，原始預測（低信心門檻、寬鬆 NMS）存進 runs/eval/predictions.sqlite，
+以模型檔雜湊與圖片內容雜湊為鍵；之後換信心門檻或 NMS 門檻重新計分只讀快取，不再推論。
+
+計算 mAP@0.5、mAP@0.5:0.95（COCO 101 點內插，同 ultralytics）、各類別在指定信心門檻下的
+precision / recall，以及每張圖片的錯誤清單（誤判、漏判、類別錯誤、定位不準）。
+
+    python -m training.evaluate
+    python -m training.evaluate --weights runs/detect/train3/weights/best.pt --conf 0.1 0.25 0.5
+    python -m training.evaluate --iou 0.6 --out runs/eval/iou06
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from recognition.detections import box_iou, nms
+from recognition.frame_source import list_images, read_image
+from training.cache import label_file
+from training.dataset_index import DATASET_DIR, ROOT_DIR, parse_label
+from training.registry import file_sha256
+
+EVAL_DIR = os.path.join(ROOT_DIR, 'runs', 'eval')
+PREDICTIONS_PATH = os.path.join(EVAL_DIR, 'predictions.sqlite')
+VAL_DIR = os.path.join(DATASET_DIR, 'images', 'val')
+
+# 快取的預測使用與 ultralytics val 相同的寬鬆門檻，較嚴格的門檻可以直接從快取算出
+CACHE_CONF = 0.001
+CACHE_IOU = 0.7
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS models (
+    model TEXT PRIMARY KEY,
+    path TEXT,
+    backend TEXT,
+    imgsz INTEGER,
+    names TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    model TEXT,
+    image TEXT,
+    width INTEGER,
+    height INTEGER,
+    data BLOB,
+    PRIMARY KEY (model, image)
+);
+'''
+
+
+def connect(path=PREDICTIONS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def model_key(path, backend, imgsz):
+    """模型快取鍵：檔案內容雜湊；PyTorch 模型另外加上輸入尺寸（ONNX 的尺寸在匯出時已固定）"""
+    digest = file_sha256(path)[:16]
+    return digest if backend == 'onnx' else f'{digest}@{imgsz}'
+
+
+def image_hashes(paths, workers=8):
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda p: file_sha256(p)[:16], paths))
+
+
+def predict(db, key, paths, hashes, make_engine, batch_size=8):
+    """推論快取中還沒有的圖片；make_engine 只在真的需要推論時才呼叫，回傳推論的張數"""
+    cached = {row['image'] for row in db.execute('SELECT image FROM predictions WHERE model = ?', (key,))}
+    todo = [(p, h) for p, h in zip(paths, hashes) if h not in cached]
+    # 內容相同的圖片只推論一次
+    todo = list({h: (p, h) for p, h in todo}.values())
+    if not todo:
+        return 0
+    engine = make_engine()
+    db.execute('INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?)',
+               (key, engine.weights, 'onnx' if engine.weights.endswith('.onnx') else 'torch', engine.imgsz,
+                json.dumps({int(k): v for k, v in engine.names.items()}, ensure_ascii=False), time.time()))
+    done = 0
+    for start in range(0, len(todo), batch_size):
+        chunk = [(p, h, read_image(p)) for p, h in todo[start:start + batch_size]]
+        chunk = [(p, h, image) for p, h, image in chunk if image is not None]
+        rows = []
+        for (_, h, image), d in zip(chunk, engine.detect([image for _, _, image in chunk])):
+            order = np.argsort(-d.scores, kind='stable')
+            data = np.column_stack([d.boxes, d.scores, d.class_ids]).astype(np.float32)[order]
+            rows.append((key, h, image.shape[1], image.shape[0], data.tobytes()))
+        with db:
+            db.executemany('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)', rows)
+        done += len(chunk)
+        print(f"\r已推論 {done}/{len(todo)}", end='')
+    print()
+    return done
+
+
+def model_names(db, key):
+    row = db.execute('SELECT names FROM models WHERE model = ?', (key,)).fetchone()
+    return {int(k): v for k, v in json.loads(row['names']).items()} if row else {}
+
+
+def load_samples(db, key, paths, hashes, nc):
+    """讀取快取的預測與對應的標註（像素座標），回傳 Sample 列表"""
+    rows = {row['image']: row for row in db.execute(
+        'SELECT image, width, height, data FROM predictions WHERE model = ?', (key,))}
+    samples = []
+    for path, h in zip(paths, hashes):
+        row = rows.get(h)
+        if row is None:
+            continue
+        label = label_file(path)
+        gt = parse_label(label, nc)[0] if os.path.exists(label) else np.zeros((0, 5), dtype=np.float32)
+        w, hgt = row['width'], row['height']
+        gt_boxes = np.empty((len(gt), 4), dtype=np.float32)
+        gt_boxes[:, 0] = (gt[:, 1] - gt[:, 3] / 2) * w
+        gt_boxes[:, 1] = (gt[:, 2] - gt[:, 4] / 2) * hgt
+        gt_boxes[:, 2] = (gt[:, 1] + gt[:, 3] / 2) * w
+        gt_boxes[:, 3] = (gt[:, 2] + gt[:, 4] / 2) * hgt
+        pred = np.frombuffer(row['data'], dtype=np.float32).reshape(-1, 6)
+        samples.append(Sample(path, pred, gt_boxes, gt[:, 0].astype(np.int32)))
+    return samples
+
+
+class Sample:
+    """一張圖片的快取預測（依信心值由高到低）與標註；預測與標註的 IoU 矩陣只算一次"""
+
+    __slots__ = ('path', 'boxes', 'scores', 'classes', 'gt_boxes', 'gt_classes', 'iou')
+
+    def __init__(self, path, pred, gt_boxes, gt_classes):
+        self.path = path
+        self.boxes = pred[:, :4]
+        self.scores = pred[:, 4]
+        self.classes = pred[:, 5].astype(np.int32)
+        self.gt_boxes = gt_boxes
+        self.gt_classes = gt_classes
+        self.iou = box_iou(self.boxes, gt_boxes) if len(pred) and len(gt_boxes) else \
+            np.zeros((len(pred), len(gt_boxes)), dtype=np.float32)
+
+    def select(self, conf, iou):
+        """信心值不低於 conf、再以 iou 做 NMS 後保留的預測索引（依信心值排序）"""
+        keep = np.arange(np.searchsorted(-self.scores, -conf, side='right'))
+        if iou < CACHE_IOU and len(keep) > 1:
+            keep = np.sort(nms(self.boxes[keep], self.scores[keep], iou, self.classes[keep]))
+        return keep
+
+
+def match(iou, pred_classes, gt_classes, thresholds=IOU_THRESHOLDS):
+    """把預測對應到標註（同 ultralytics：依 IoU 由高到低一對一配對），回傳 (tp, 配對到的標註索引)
+
+    tp 為 N x len(thresholds) 的布林陣列；配對索引對應第一個門檻，沒配對到為 -1。
+    """
+    n = len(pred_classes)
+    tp = np.zeros((n, len(thresholds)), dtype=bool)
+    matched = np.full(n, -1, dtype=np.int64)
+    if n == 0 or len(gt_classes) == 0:
+        return tp, matched
+    iou = np.where(pred_classes[:, None] == gt_classes[None, :], iou, 0.0)
+    for t, threshold in enumerate(thresholds):
+        p, g = np.nonzero(iou >= threshold)
+        if len(p) == 0:
+            continue
+        order = np.argsort(-iou[p, g], kind='stable')
+        p, g = p[order], g[order]
+        _, first = np.unique(p, return_index=True)
+        p, g = p[first], g[first]
+        order = np.argsort(-iou[p, g], kind='stable')
+        p, g = p[order], g[order]
+        _, first = np.unique(g, return_index=True)
+        tp[p[first], t] = True
+        if t == 0:
+            matched[p[first]] = g[first]
+    return tp, matched
+
+
+def average_precision(tp, scores, pred_classes, gt_counts):
+    """各類別各 IoU 門檻的 AP（nc x T），以 101 點內插的 precision-recall 曲線面積計算"""
+    nc, steps = len(gt_counts), tp.shape[1]
+    ap = np.zeros((nc, steps))
+    order = np.argsort(-scores, kind='stable')
+    tp, pred_classes = tp[order], pred_classes[order]
+    x = np.linspace(0, 1, 101)
+    for c in range(nc):
+        hits = tp[pred_classes == c]
+        if gt_counts[c] == 0 or len(hits) == 0:
+            continue
+        tpc = np.cumsum(hits, axis=0)
+        fpc = np.cumsum(~hits, axis=0)
+        recall = tpc / gt_counts[c]
+        precision = tpc / (tpc + fpc)
+        # 補上曲線兩端後取 precision 的右側最大值包絡
+        recall = np.vstack([np.zeros(steps), recall, np.ones(steps)])
+        precision = np.vstack([np.ones(steps), precision, np.zeros(steps)])
+        precision = np.flip(np.maximum.accumulate(np.flip(precision, 0), axis=0), 0)
+        for t in range(steps):
+            y = np.interp(x, recall[:, t], precision[:, t])
+            ap[c, t] = np.sum((y[1:] + y[:-1]) / 2 * np.diff(x))
+    return ap
+
+
+def classify_errors(sample, keep, tp50, matched):
+    """把未配對的預測分成類別錯誤 / 重複框 / 定位不準 / 背景誤判，並列出漏判的標註"""
+    errors = []
+    iou = sample.iou[keep]
+    for i in np.flatnonzero(~tp50):
+        row = iou[i]
+        c = int(sample.classes[keep[i]])
+        same = row[sample.gt_classes == c]
+        other = row[sample.gt_classes != c]
+        if len(other) and other.max() >= 0.5:
+            kind = 'class'
+        elif len(same) and same.max() >= 0.5:
+            kind = 'duplicate'
+        elif len(same) and same.max() >= 0.1:
+            kind = 'localization'
+        else:
+            kind = 'background'
+        errors.append({'type': kind, 'class': c, 'score': round(float(sample.scores[keep[i]]), 4),
+                       'box': [round(float(v), 1) for v in sample.boxes[keep[i]]]})
+    found = np.zeros(len(sample.gt_classes), dtype=bool)
+    found[matched[matched >= 0]] = True
+    for g in np.flatnonzero(~found):
+        errors.append({'type': 'missed', 'class': int(sample.gt_classes[g]),
+                       'box': [round(float(v), 1) for v in sample.gt_boxes[g]]})
+    return errors
+
+
+def score(samples, nc, conf=0.25, iou=0.45):
+    """從快取的預測計分：mAP 使用所有候選框，precision / recall 與錯誤清單使用 conf 門檻"""
+    all_tp, all_scores, all_classes, gt_classes = [], [], [], []
+    tp_at, pred_at = np.zeros(nc, dtype=np.int64), np.zeros(nc, dtype=np.int64)
+    images = []
+    for sample in samples:
+        keep = sample.select(CACHE_CONF, iou)
+        tp, _ = match(sample.iou[keep], sample.classes[keep], sample.gt_classes)
+        all_tp.append(tp)
+        all_scores.append(sample.scores[keep])
+        all_classes.append(sample.classes[keep])
+        gt_classes.append(sample.gt_classes)
+
+        # 指定信心門檻下重新配對（低信心的框可能搶走高信心框的配對）
+        keep = keep[sample.scores[keep] >= conf]
+        tp50, matched = match(sample.iou[keep], sample.classes[keep], sample.gt_classes, IOU_THRESHOLDS[:1])
+        tp50 = tp50[:, 0]
+        tp_at += np.bincount(sample.classes[keep][tp50], minlength=nc)[:nc]
+        pred_at += np.bincount(sample.classes[keep], minlength=nc)[:nc]
+        errors = classify_errors(sample, keep, tp50, matched)
+        if errors:
+            images.append({'image': sample.path, 'errors': errors})
+
+    gt_counts = np.bincount(np.concatenate(gt_classes), minlength=nc)[:nc] if samples else np.zeros(nc, np.int64)
+    ap = average_precision(np.concatenate(all_tp), np.concatenate(all_scores), np.concatenate(all_classes),
+                           gt_counts) if samples else np.zeros((nc, len(IOU_THRESHOLDS)))
+    present = gt_counts > 0
+    precision = tp_at / np.maximum(pred_at, 1)
+    recall = tp_at / np.maximum(gt_counts, 1)
+    images.sort(key=lambda item: -len(item['errors']))
+    return {
+        'conf': conf,
+        'iou': iou,
+        'images': len(samples),
+        'instances': int(gt_counts.sum()),
+        'precision': float(tp_at.sum() / max(pred_at.sum(), 1)),
+        'recall': float(tp_at.sum() / max(gt_counts.sum(), 1)),
+        'map50': float(ap[present, 0].mean()) if present.any() else 0.0,
+        'map50_95': float(ap[present].mean()) if present.any() else 0.0,
+        'classes': [
+            {'class': c, 'instances': int(gt_counts[c]), 'predictions': int(pred_at[c]),
+             'precision': float(precision[c]), 'recall': float(recall[c]),
+             'map50': float(ap[c, 0]), 'map50_95': float(ap[c].mean())}
+            for c in range(nc)
+        ],
+        'errors': images,
+    }
+
+
+def evaluate(weights=None, backend=None, imgsz=None, images=VAL_DIR, conf=(0.25,), iou=0.45,
+             batch_size=8, db_path=PREDICTIONS_PATH, rebuild=False, **engine_kwargs):
+    """推論（只限快取中沒有的圖片）後以每個 conf 計分，回傳 (模型快取鍵, names, 報告列表)
+
+    沒有指定權重時與 load_engine 相同，會套用建議設定檔（見 recognition.detector.resolve_settings）。
+    """
+    from recognition.detector import load_engine, resolve_settings
+
+    path, backend, imgsz, threads = resolve_settings(weights, backend, imgsz)
+    if threads:
+        engine_kwargs.setdefault('threads', threads)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"模型權重檔案不存在: {path}")
+    paths = list_images(images, recursive=True)
+    if not paths:
+        raise FileNotFoundError(f"找不到驗證圖片: {images}")
+    key = model_key(path, backend, imgsz or 640)
+    hashes = image_hashes(paths)
+    db = connect(db_path)
+    try:
+        if rebuild:
+            with db:
+                db.execute('DELETE FROM predictions WHERE model = ?', (key,))
+
+        def make_engine():
+            return load_engine(path, backend=backend, imgsz=imgsz, batch_size=batch_size,
+                               conf=CACHE_CONF, iou=CACHE_IOU, **engine_kwargs)
+
+        predict(db, key, paths, hashes, make_engine, batch_size)
+        names = model_names(db, key)
+        start = time.perf_counter()
+        samples = load_samples(db, key, paths, hashes, len(names))
+    finally:
+        db.close()
+    reports = [score(samples, len(names), c, iou) for c in conf]
+    print(f"計分 {len(conf)} 組門檻耗時 {(time.perf_counter() - start) * 1000:.1f} ms（不含推論）")
+    return key, names, reports
+
+
+def write_report(out, key, names, report):
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(report, model=key, names=names), f, ensure_ascii=False, indent=1)
+    with open(os.path.join(out, 'errors.txt'), 'w', encoding='utf-8') as f:
+        for item in report['errors']:
+            counts = {}
+            for error in item['errors']:
+                counts[error['type']] = counts.get(error['type'], 0) + 1
+            summary = ' '.join(f'{k}={v}' for k, v in sorted(counts.items()))
+            f.write(f"{os.path.relpath(item['image'], ROOT_DIR)}\t{summary}\n")
+
+
+def print_report(report, names):
+    print(f"conf {report['conf']:.3f}  iou {report['iou']:.2f}  圖片 {report['images']}  標註 {report['instances']}")
+    print(f"{'類別':<16}{'標註':>6}{'P':>8}{'R':>8}{'mAP50':>8}{'mAP50-95':>10}")
+    for row in report['classes']:
+        print(f"{names.get(row['class'], row['class'])!s:<16}{row['instances']:>6}{row['precision']:>8.3f}"
+              f"{row['recall']:>8.3f}{row['map50']:>8.3f}{row['map50_95']:>10.3f}")
+    print(f"{'all':<16}{report['instances']:>6}{report['precision']:>8.3f}{report['recall']:>8.3f}"
+          f"{report['map50']:>8.3f}{report['map50_95']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='評估模型在驗證集上的準確度（預測結果會快取）')
+    parser.add_argument('--weights', default=None, help='預設為登錄表選定的模型')
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnx'], default=None)
+    parser.add_argument('--imgsz', type=int, default=None, help='預設 640，或建議設定檔中的尺寸')
+    parser.add_argument('--images', default=VAL_DIR)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--conf', type=float, nargs='+', default=[0.25],
+                        help='precision / recall 與錯誤清單的信心門檻，可給多個；報告以第一個為準')
+    parser.add_argument('--iou', type=float, default=0.45, help=f'NMS 門檻（不可高於快取的 {CACHE_IOU}）')
+    parser.add_argument('--out', default=None, help='報告資料夾，預設為 runs/eval/<模型快取鍵>')
+    parser.add_argument('--rebuild', action='store_true', help='捨棄這個模型的快取預測並重新推論')
+    args = parser.parse_args()
+
+    if args.iou > CACHE_IOU:
+        print(f"NMS 門檻不可高於 {CACHE_IOU}")
+        return 1
+    try:
+        key, names, reports = evaluate(args.weights, args.backend, args.imgsz, args.images, args.conf, args.iou,
+                                       args.batch_size, rebuild=args.rebuild)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    for report in reports:
+        print_report(report, names)
+    out = args.out or os.path.join(EVAL_DIR, key.replace('@', '_'))
+    write_report(out, key, names, reports[0])
+    print(f"報告與錯誤清單在 '{out}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
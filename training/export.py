@@ -0,0 +1,134 @@
+"""把訓練好的 best.pt 匯出成 ONNX，給 recognition.onnx_backend 使用
+
+輸入形狀固定為 batch x 3 x imgsz x imgsz，輸出為未做 NMS 的原始預測（4+nc x anchors），
+NMS 與座標還原在 OnnxDetectionEngine 中以 numpy 處理。匯出直接呼叫 torch.onnx.export，
+不經過 ultralytics 的 exporter（它會在缺套件時自動 pip 安裝），整個流程不會連網。
+另外寫出同名的 .json 記錄類別名稱、輸入尺寸與批次大小。
+
+--int8 會再用 onnxruntime 做靜態 INT8 量化，校正影像取自 dataset/images/val。
+
+    python -m training.export
+    python -m training.export --weights runs/detect/train4/weights/best.pt --batch 4 --int8
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from recognition.detector import PAD_VALUE, letterbox, resolve_weights
+from recognition.frame_source import list_images, read_image
+from training.dataset_index import DATASET_DIR
+
+CALIBRATION_DIR = os.path.join(DATASET_DIR, 'images', 'val')
+OPSET = 12
+
+
+def write_meta(onnx_path, names, imgsz, batch, source, int8=False):
+    meta = {'names': {int(k): v for k, v in names.items()}, 'imgsz': imgsz, 'batch': batch,
+            'source': os.path.abspath(source), 'int8': int8}
+    with open(os.path.splitext(onnx_path)[0] + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+
+
+def export_onnx(weights=None, out=None, imgsz=640, batch=1):
+    """匯出 FP32 ONNX 模型，回傳輸出路徑"""
+    import torch
+    from ultralytics import YOLO
+
+    weights = resolve_weights(weights)
+    if not os.path.exists(weights):
+        raise FileNotFoundError(f"模型權重檔案不存在: {weights}")
+    out = out or os.path.splitext(weights)[0] + '.onnx'
+
+    yolo = YOLO(weights)
+    model = yolo.model.float().fuse().eval()
+    # 讓偵測頭只輸出拼接好的原始預測（與 ultralytics 的 ONNX 匯出相同）
+    for module in model.modules():
+        if hasattr(module, 'export'):
+            module.export = True
+            module.format = 'onnx'
+    dummy = torch.zeros((batch, 3, imgsz, imgsz), dtype=torch.float32)
+    with torch.inference_mode():
+        model(dummy)
+    torch.onnx.export(
+        model, dummy, out, opset_version=OPSET, do_constant_folding=True,
+        input_names=['images'], output_names=['output0'],
+    )
+    write_meta(out, yolo.names, imgsz, batch, weights)
+    return out
+
+
+class _CalibrationReader:
+    """以驗證集影像（與推論相同的 letterbox 與正規化）提供 INT8 校正資料"""
+
+    def __init__(self, paths, imgsz, batch):
+        self.paths = paths
+        self.imgsz = imgsz
+        self.batch = batch
+        self.position = 0
+        self._staging = np.full((batch, imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+
+    def get_next(self):
+        if self.position >= len(self.paths):
+            return None
+        chunk = self.paths[self.position:self.position + self.batch]
+        self.position += self.batch
+        self._staging[:] = PAD_VALUE
+        for i, path in enumerate(chunk):
+            image = read_image(path)
+            if image is not None:
+                letterbox(image, self.imgsz, self._staging[i])
+        batch = self._staging.transpose(0, 3, 1, 2)[:, ::-1].astype(np.float32) / 255.0
+        return {'images': np.ascontiguousarray(batch)}
+
+    def rewind(self):
+        self.position = 0
+
+
+def quantize_int8(onnx_path, out=None, calibration_dir=CALIBRATION_DIR, max_images=200):
+    """靜態 INT8 量化（QDQ 格式，per-channel 權重）；沒有校正影像時退回動態量化"""
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    with open(os.path.splitext(onnx_path)[0] + '.json', encoding='utf-8') as f:
+        meta = json.load(f)
+    out = out or os.path.splitext(onnx_path)[0] + '.int8.onnx'
+    paths = list_images(calibration_dir, recursive=True)[:max_images] if os.path.isdir(calibration_dir) else []
+    if paths:
+        quantize_static(
+            onnx_path, out, _CalibrationReader(paths, meta['imgsz'], meta['batch']),
+            quant_format=QuantFormat.QDQ, per_channel=True,
+            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+    else:
+        print(f"找不到校正影像 '{calibration_dir}'，改用動態量化")
+        quantize_dynamic(onnx_path, out, weight_type=QuantType.QInt8)
+    write_meta(out, meta['names'], meta['imgsz'], meta['batch'], meta['source'], int8=True)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯出 ONNX 模型')
+    parser.add_argument('--weights', default=None, help='預設為登錄表選定的模型或 DEFAULT_WEIGHTS')
+    parser.add_argument('--out', default=None, help='預設為權重旁的 best.onnx')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=1, help='固定的批次大小')
+    parser.add_argument('--int8', action='store_true', help='另外輸出 INT8 量化模型')
+    parser.add_argument('--calibration', default=CALIBRATION_DIR)
+    args = parser.parse_args()
+
+    try:
+        path = export_onnx(args.weights, args.out, args.imgsz, args.batch)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    print(f"ONNX 模型已匯出到 '{path}'")
+    if args.int8:
+        print(f"INT8 模型已匯出到 '{quantize_int8(path, calibration_dir=args.calibration)}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
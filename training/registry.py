@@ -0,0 +1,273 @@
+"""訓練紀錄登錄表
+
+把 runs/detect/* 與 yolov8/runs/detect/* 的每次訓練整理進本機 SQLite（runs/registry.sqlite）：
+訓練參數、最後的 mAP / precision / recall、權重檔雜湊、當時資料集清單的雜湊，
+以及（選擇性）固定測試集上的推論延遲。可以比較兩次訓練，並把其中一個設為目前使用的模型，
+偵測程式會透過 current_weights() 取得權重路徑。
+
+    python -m training.registry index --bench
+    python -m training.registry list
+    python -m training.registry compare runs/detect/train runs/detect/train4
+    python -m training.registry promote yolov8/runs/detect/train
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+REGISTRY_PATH = os.path.join(ROOT_DIR, 'runs', 'registry.sqlite')
+RUN_PATTERNS = ('runs/detect/*', 'yolov8/runs/detect/*')
+
+METRIC_COLUMNS = {
+    'precision': 'metrics/precision(B)',
+    'recall': 'metrics/recall(B)',
+    'map50': 'metrics/mAP50(B)',
+    'map50_95': 'metrics/mAP50-95(B)',
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    args TEXT NOT NULL,
+    epochs_done INTEGER,
+    best_epoch INTEGER,
+    precision REAL,
+    recall REAL,
+    map50 REAL,
+    map50_95 REAL,
+    weights TEXT,
+    weights_sha256 TEXT,
+    dataset_hash TEXT,
+    latency_ms REAL,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS current (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    name TEXT NOT NULL,
+    promoted_at REAL
+);
+'''
+
+
+def connect(path=REGISTRY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def file_sha256(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_results(path):
+    """讀取 results.csv，回傳以 fitness（0.1*mAP50 + 0.9*mAP50-95，同 ultralytics）最佳的 epoch"""
+    with open(path, encoding='utf-8') as f:
+        rows = [{k.strip(): v.strip() for k, v in row.items()} for row in csv.DictReader(f)]
+    if not rows:
+        return None
+
+    def metric(row, key):
+        try:
+            return float(row.get(METRIC_COLUMNS[key], 'nan'))
+        except ValueError:
+            return float('nan')
+
+    def fitness(row):
+        value = 0.1 * metric(row, 'map50') + 0.9 * metric(row, 'map50_95')
+        return value if value == value else -1.0
+
+    best = max(rows, key=fitness)
+    result = {key: metric(best, key) for key in METRIC_COLUMNS}
+    result['best_epoch'] = int(float(best.get('epoch', 0)))
+    result['epochs_done'] = len(rows)
+    return result
+
+
+def dataset_hash():
+    """目前資料集快取清單（training.dataset_index）的指紋雜湊；沒有清單時回傳 None"""
+    path = os.path.join(ROOT_DIR, 'dataset', '.manifest', 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        fingerprint = json.load(f).get('fingerprint', {})
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def bench_latency(weights, images=32, imgsz=640):
+    """以固定的合成影格量測單張推論延遲（毫秒，中位數）"""
+    from recognition.detector import DetectionEngine
+    from recognition.frame_source import SyntheticSource
+
+    engine = DetectionEngine(weights, imgsz=imgsz, batch_size=1)
+    frames = [f.image.copy() for f in SyntheticSource(1920, 1080, count=images, num_buffers=1)]
+    engine.detect(frames[:2])
+    samples = []
+    for frame in frames:
+        start = time.perf_counter()
+        engine.detect_one(frame)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def discover_runs(root=ROOT_DIR):
+    runs = []
+    for pattern in RUN_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            if os.path.isfile(os.path.join(path, 'args.yaml')):
+                runs.append(os.path.relpath(path, root).replace(os.sep, '/'))
+    return runs
+
+
+def index_runs(db, root=ROOT_DIR, bench=False):
+    """掃描所有訓練資料夾並更新登錄表"""
+    import yaml
+
+    current_dataset = dataset_hash()
+    indexed = []
+    for name in discover_runs(root):
+        run_dir = os.path.join(root, name)
+        with open(os.path.join(run_dir, 'args.yaml'), encoding='utf-8') as f:
+            args = yaml.safe_load(f) or {}
+        results_path = os.path.join(run_dir, 'results.csv')
+        results = read_results(results_path) if os.path.exists(results_path) else None
+        weights = os.path.join(run_dir, 'weights', 'best.pt')
+        weights_rel = os.path.relpath(weights, root).replace(os.sep, '/') if os.path.exists(weights) else None
+        sha = file_sha256(weights) if weights_rel else None
+
+        previous = db.execute('SELECT weights_sha256, latency_ms, dataset_hash FROM runs WHERE name = ?', (name,)).fetchone()
+        latency = previous['latency_ms'] if previous and previous['weights_sha256'] == sha else None
+        if bench and weights_rel and latency is None:
+            latency = bench_latency(weights, imgsz=int(args.get('imgsz', 640)))
+        # 資料集雜湊記錄「第一次登錄時」的資料集，權重沒變就不覆寫
+        data = previous['dataset_hash'] if previous and previous['weights_sha256'] == sha else current_dataset
+
+        db.execute('''
+            INSERT OR REPLACE INTO runs
+            (name, args, epochs_done, best_epoch, precision, recall, map50, map50_95,
+             weights, weights_sha256, dataset_hash, latency_ms, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            name, json.dumps(args, sort_keys=True, default=str),
+            results and results['epochs_done'], results and results['best_epoch'],
+            results and results['precision'], results and results['recall'],
+            results and results['map50'], results and results['map50_95'],
+            weights_rel, sha, data, latency, time.time(),
+        ))
+        indexed.append(name)
+    db.commit()
+    return indexed
+
+
+def diff_args(a, b):
+    """兩組訓練參數中不同的欄位"""
+    keys = sorted(set(a) | set(b))
+    return {k: (a.get(k), b.get(k)) for k in keys if a.get(k) != b.get(k)}
+
+
+def get_run(db, name):
+    row = db.execute('SELECT * FROM runs WHERE name = ?', (name.rstrip('/'),)).fetchone()
+    if row is None:
+        raise KeyError(f"登錄表中沒有 '{name}'，請先執行 index")
+    return row
+
+
+def promote(db, name):
+    row = get_run(db, name)
+    if not row['weights']:
+        raise FileNotFoundError(f"'{name}' 沒有 weights/best.pt")
+    db.execute('INSERT OR REPLACE INTO current (id, name, promoted_at) VALUES (1, ?, ?)', (row['name'], time.time()))
+    db.commit()
+    return row
+
+
+def current_weights(path=REGISTRY_PATH, root=ROOT_DIR):
+    """目前選定模型的權重絕對路徑；沒有登錄表或沒有選定模型時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    db = sqlite3.connect(path)
+    try:
+        row = db.execute('SELECT runs.weights FROM current JOIN runs ON runs.name = current.name').fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        db.close()
+    if row is None or row[0] is None:
+        return None
+    weights = os.path.join(root, row[0])
+    return weights if os.path.exists(weights) else None
+
+
+def _fmt(value, digits=4):
+    return '-' if value is None else f'{value:.{digits}f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='訓練紀錄登錄表')
+    sub = parser.add_subparsers(dest='command', required=True)
+    index = sub.add_parser('index', help='掃描訓練資料夾')
+    index.add_argument('--bench', action='store_true', help='同時量測推論延遲（需要 torch 與 ultralytics）')
+    sub.add_parser('list', help='列出所有訓練')
+    compare = sub.add_parser('compare', help='比較兩次訓練')
+    compare.add_argument('a')
+    compare.add_argument('b')
+    promote_cmd = sub.add_parser('promote', help='設為目前使用的模型')
+    promote_cmd.add_argument('name')
+    sub.add_parser('current', help='顯示目前使用的模型')
+    parser.add_argument('--db', default=REGISTRY_PATH)
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    try:
+        if args.command == 'index':
+            for name in index_runs(db, bench=args.bench):
+                print(f"已登錄 {name}")
+        elif args.command == 'list':
+            current = db.execute('SELECT name FROM current').fetchone()
+            print(f"{'':2}{'name':<28}{'epochs':>7}{'mAP50':>8}{'mAP50-95':>10}{'P':>8}{'R':>8}{'ms':>8}  weights")
+            for row in db.execute('SELECT * FROM runs ORDER BY map50_95 DESC NULLS LAST, name'):
+                mark = '* ' if current and current['name'] == row['name'] else '  '
+                print(f"{mark}{row['name']:<28}{row['epochs_done'] or '-':>7}{_fmt(row['map50']):>8}"
+                      f"{_fmt(row['map50_95']):>10}{_fmt(row['precision']):>8}{_fmt(row['recall']):>8}"
+                      f"{_fmt(row['latency_ms'], 1):>8}  {(row['weights_sha256'] or '-')[:12]}")
+        elif args.command == 'compare':
+            a, b = get_run(db, args.a), get_run(db, args.b)
+            print(f"{'':<14}{a['name']:>30}{b['name']:>30}")
+            for key in ('epochs_done', 'best_epoch', 'precision', 'recall', 'map50', 'map50_95', 'latency_ms',
+                        'dataset_hash', 'weights_sha256'):
+                va, vb = a[key], b[key]
+                if isinstance(va, float) or isinstance(vb, float):
+                    va, vb = _fmt(va), _fmt(vb)
+                print(f"{key:<14}{str(va)[:28]:>30}{str(vb)[:28]:>30}")
+            changed = diff_args(json.loads(a['args']), json.loads(b['args']))
+            print("參數差異:" if changed else "參數相同")
+            for key, (va, vb) in changed.items():
+                print(f"  {key}: {va} -> {vb}")
+        elif args.command == 'promote':
+            row = promote(db, args.name)
+            print(f"目前模型: {row['name']} ({row['weights']})")
+        elif args.command == 'current':
+            row = db.execute('SELECT * FROM current').fetchone()
+            print(f"目前模型: {row['name']}" if row else "尚未選定模型")
+    except (KeyError, FileNotFoundError) as e:
+        print(e.args[0] if e.args else e)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""速度 / 準確度取捨掃描
+
+對每個模型（--weights 可給多個訓練好的變體）、輸入尺寸、精度（FP32 / INT8）與執行緒數的組合，
+在驗證集上量測準確度（training.evaluate，預測會快取）與單張 CPU 延遲（1920x1080 合成影格），
+列出 Pareto 前緣（沒有其他組合同時更快又更準），並選出建議設定：
+
+    有 --budget-ms 時：延遲不超過預算中 mAP50-95 最高的組合
+    否則：mAP50-95 與最佳值差距不超過 --max-drop 的組合中最快的
+
+每個尺寸會匯出一個 batch 1 的 ONNX 模型到 runs/sweep/models（已存在且比權重新就沿用），
+INT8 再以驗證集做靜態量化。準確度與執行緒數無關，同一個模型只評估一次。
+結果寫到 runs/sweep：results.json、report.txt 與 detect_config.json；
+--apply 會把建議設定複製到 runs/detect_config.json，之後沒有指定權重的 load_engine() 都會使用它。
+
+    python -m training.sweep
+    python -m training.sweep --imgsz 640 480 416 --precision fp32 int8 --threads 2 4 8
+    python -m training.sweep --weights runs/detect/n/weights/best.pt runs/detect/s/weights/best.pt --budget-ms 15 --apply
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from recognition.detector import DETECT_CONFIG, resolve_weights
+from training.dataset_index import ROOT_DIR
+from training.evaluate import VAL_DIR, evaluate
+from training.registry import file_sha256
+
+SWEEP_DIR = os.path.join(ROOT_DIR, 'runs', 'sweep')
+
+
+def model_files(weights, imgsz, precisions, backend, out_dir):
+    """回傳 {精度: (模型檔, 後端)}，需要時匯出 ONNX 與 INT8"""
+    if backend == 'torch':
+        if 'int8' in precisions:
+            print("PyTorch 後端只支援 FP32，略過 INT8")
+        return {'fp32': (weights, 'torch')} if 'fp32' in precisions else {}
+
+    from training.export import export_onnx, quantize_int8
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f'{file_sha256(weights)[:8]}_{imgsz}')
+    fp32 = base + '.onnx'
+    if not os.path.exists(fp32) or os.path.getmtime(fp32) < os.path.getmtime(weights):
+        print(f"匯出 {os.path.relpath(weights, ROOT_DIR)} @ {imgsz}")
+        export_onnx(weights, fp32, imgsz, batch=1)
+    files = {}
+    if 'fp32' in precisions:
+        files['fp32'] = (fp32, 'onnx')
+    if 'int8' in precisions:
+        int8 = base + '.int8.onnx'
+        if not os.path.exists(int8) or os.path.getmtime(int8) < os.path.getmtime(fp32):
+            print(f"INT8 量化 {os.path.basename(fp32)}")
+            quantize_int8(fp32, int8)
+        files['int8'] = (int8, 'onnx')
+    return files
+
+
+def measure_latency(path, backend, imgsz, threads, frames):
+    """單張推論延遲（毫秒），回傳 (中位數, p90)"""
+    from recognition.detector import load_engine
+
+    engine = load_engine(path, backend=backend, imgsz=imgsz, batch_size=1, threads=threads)
+    for frame in frames[:3]:
+        engine.detect_one(frame)
+    samples = np.empty(len(frames))
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        engine.detect_one(frame)
+        samples[i] = (time.perf_counter() - start) * 1000
+    return float(np.median(samples)), float(np.percentile(samples, 90))
+
+
+def pareto_front(latency, accuracy):
+    """延遲越低越好、準確度越高越好；回傳位於前緣上的布林遮罩"""
+    order = np.lexsort((-accuracy, latency))
+    best_before = np.maximum.accumulate(np.concatenate([[-np.inf], accuracy[order][:-1]]))
+    front = np.zeros(len(latency), dtype=bool)
+    front[order] = accuracy[order] > best_before
+    return front
+
+
+def recommend(rows, front, budget_ms=None, max_drop=0.01):
+    """從前緣上選出建議的組合，回傳索引；預算內沒有組合時回傳 None"""
+    candidates = list(np.flatnonzero(front))
+    if budget_ms is not None:
+        within = [i for i in candidates if rows[i]['latency_ms'] <= budget_ms]
+        return max(within, key=lambda i: rows[i]['map50_95']) if within else None
+    best = max(rows[i]['map50_95'] for i in candidates)
+    good = [i for i in candidates if rows[i]['map50_95'] >= best - max_drop]
+    return min(good, key=lambda i: rows[i]['latency_ms'])
+
+
+def sweep(weights_list, imgsz_list, precisions, threads_list, backend='onnx', images=VAL_DIR, conf=0.25,
+          iou=0.45, frames=50, out=SWEEP_DIR):
+    """量測所有組合，回傳結果列表"""
+    from recognition.frame_source import SyntheticSource
+
+    synthetic = [f.image.copy() for f in SyntheticSource(1920, 1080, count=frames, num_buffers=1)]
+    rows = []
+    for weights in weights_list:
+        if not os.path.exists(weights):
+            raise FileNotFoundError(f"模型權重檔案不存在: {weights}")
+        for imgsz in imgsz_list:
+            for precision, (path, model_backend) in model_files(
+                    weights, imgsz, precisions, backend, os.path.join(out, 'models')).items():
+                _, _, (report,) = evaluate(path, model_backend, imgsz, images, (conf,), iou)
+                for threads in threads_list:
+                    latency, p90 = measure_latency(path, model_backend, imgsz, threads, synthetic)
+                    row = {
+                        'variant': os.path.relpath(weights, ROOT_DIR).replace(os.sep, '/'),
+                        'source': os.path.abspath(weights), 'weights': os.path.abspath(path),
+                        'backend': model_backend, 'imgsz': imgsz, 'precision': precision, 'threads': threads,
+                        'map50_95': report['map50_95'], 'map50': report['map50'],
+                        'precision_at_conf': report['precision'], 'recall_at_conf': report['recall'],
+                        'latency_ms': latency, 'p90_ms': p90,
+                    }
+                    rows.append(row)
+                    print(f"{row['variant']} {imgsz} {precision} x{threads}: "
+                          f"mAP50-95 {row['map50_95']:.4f}  {latency:.1f} ms")
+    return rows
+
+
+def write_results(out, rows, front, chosen):
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, 'results.json'), 'w', encoding='utf-8') as f:
+        json.dump([dict(row, pareto=bool(front[i])) for i, row in enumerate(rows)], f, ensure_ascii=False, indent=1)
+    lines = [f"{'':2}{'模型':<40}{'尺寸':>6}{'精度':>6}{'執行緒':>6}{'mAP50-95':>10}{'mAP50':>8}{'ms':>8}{'p90':>8}"]
+    for i in sorted(range(len(rows)), key=lambda i: rows[i]['latency_ms']):
+        row = rows[i]
+        mark = '>>' if i == chosen else ('* ' if front[i] else '  ')
+        lines.append(f"{mark}{row['variant']:<40}{row['imgsz']:>6}{row['precision']:>6}{row['threads']:>6}"
+                     f"{row['map50_95']:>10.4f}{row['map50']:>8.4f}{row['latency_ms']:>8.1f}{row['p90_ms']:>8.1f}")
+    lines.append('* Pareto 前緣  >> 建議設定')
+    with open(os.path.join(out, 'report.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    print('\n'.join(lines))
+    if chosen is None:
+        return None
+    row = rows[chosen]
+    config = {key: row[key] for key in ('weights', 'backend', 'imgsz', 'threads', 'precision', 'source',
+                                        'map50_95', 'latency_ms')}
+    config['created'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    path = os.path.join(out, 'detect_config.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=1)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='輸入尺寸、模型、精度與執行緒數的速度 / 準確度掃描')
+    parser.add_argument('--weights', nargs='+', default=None, help='要比較的 .pt，預設為登錄表選定的模型')
+    parser.add_argument('--imgsz', type=int, nargs='+', default=[640, 512, 480, 416, 320])
+    parser.add_argument('--precision', nargs='+', choices=['fp32', 'int8'], default=['fp32', 'int8'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[os.cpu_count() or 4])
+    parser.add_argument('--backend', choices=['onnx', 'torch'], default='onnx')
+    parser.add_argument('--images', default=VAL_DIR)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--frames', type=int, default=50, help='每個組合量測延遲的影格數')
+    parser.add_argument('--budget-ms', type=float, default=None, help='延遲預算（中位數）')
+    parser.add_argument('--max-drop', type=float, default=0.01, help='沒有預算時可接受的 mAP50-95 下降')
+    parser.add_argument('--out', default=SWEEP_DIR)
+    parser.add_argument('--apply', action='store_true', help=f'把建議設定寫到 {os.path.relpath(DETECT_CONFIG, ROOT_DIR)}')
+    args = parser.parse_args()
+
+    weights = args.weights or [resolve_weights()]
+    try:
+        rows = sweep(weights, args.imgsz, args.precision, args.threads, args.backend, args.images,
+                     args.conf, frames=args.frames, out=args.out)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    if not rows:
+        print("沒有可量測的組合")
+        return 1
+    front = pareto_front(np.array([r['latency_ms'] for r in rows]), np.array([r['map50_95'] for r in rows]))
+    chosen = recommend(rows, front, args.budget_ms, args.max_drop)
+    path = write_results(args.out, rows, front, chosen)
+    if path is None:
+        print(f"沒有組合的延遲在 {args.budget_ms} ms 以內")
+        return 1
+    print(f"建議設定已寫到 '{path}'")
+    if args.apply:
+        os.makedirs(os.path.dirname(DETECT_CONFIG), exist_ok=True)
+        shutil.copyfile(path, DETECT_CONFIG)
+        print(f"已套用到 '{DETECT_CONFIG}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
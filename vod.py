@@ -0,0 +1,183 @@
+"""離線 VOD 分析
+
+每 k 張影格（或畫面切換時）才執行一次偵測，中間的影格以追蹤器外推，
+輸出逐影格的角色出現時間軸（JSON Lines）與各類別出現秒數統計。
+
+    python vod.py match.mp4 --every 10 --output recognition/img/match_timeline.jsonl
+    python vod.py match.mp4 --detector hog
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from recognition.frame_source import VideoSource
+from recognition.gate import FrameGate
+from recognition.render import Renderer
+from recognition.tracker import IoUTracker
+from recognition.writer import AsyncWriter, DetectionLog
+
+
+def thumbnail(image, size=(32, 18)):
+    """縮成小灰階圖，用來判斷畫面切換"""
+    gray = cv2.cvtColor(cv2.resize(image, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return gray.astype(np.int16)
+
+
+class Detector:
+    """把 YOLO 引擎或 HOG 偵測器包成相同的批次介面"""
+
+    def __init__(self, kind, weights=None, batch_size=8, imgsz=None, tile=None):
+        if kind == 'hog':
+            from recognition.deal_with import HogPersonDetector
+            self.hog = HogPersonDetector(scale=0.5)
+            self.names = self.hog.names
+            self.batch_size = batch_size
+        else:
+            from recognition.detector import load_engine
+            self.hog = None
+            self.engine = load_engine(weights, imgsz=imgsz, batch_size=batch_size)
+            if tile:
+                from recognition.tiling import TiledEngine
+                self.engine = TiledEngine(self.engine, tile)
+            self.names = self.engine.names
+            self.batch_size = self.engine.batch_size
+
+    def detect(self, images, frame_indices, timestamps):
+        if self.hog is not None:
+            return [self.hog.detect(image, i, t) for image, i, t in zip(images, frame_indices, timestamps)]
+        return self.engine.detect(images, frame_indices, timestamps)
+
+
+def analyze(path, detector, every=10, scene_threshold=12.0, step=1, output=None, max_age=1.0, gate=None,
+            annotate_dir=None):
+    """分析一段影片，回傳統計結果
+
+    影格先暫存到湊滿一個批次的關鍵影格，批次偵測後再依序交給追蹤器，
+    非關鍵影格只保留序號與時間戳，不保留影像。給定 gate (gate.FrameGate) 時，
+    定期的關鍵影格若與上次推論的影格幾乎相同就不推論，改把上次推論的結果沿用到這張影格交給追蹤器
+    （畫面沒變，目標也還在，追蹤不會因為超過 max_age 而被移除）；畫面切換一定推論。
+    預設完全不繪製標註；給定 annotate_dir 時才把有目標的關鍵影格畫好標註後存檔。
+    """
+    source = VideoSource(path, step=step)
+    tracker = IoUTracker(max_age=max_age)
+    log = DetectionLog(output, detector.names) if output else None
+    renderer = writer = None
+    if annotate_dir:
+        renderer = Renderer(detector.names)
+        writer = AsyncWriter(annotate_dir, fmt='jpg', quality=90)
+
+    pending = []        # (index, timestamp, 是否為關鍵影格, 是否因畫面沒變而略過推論)
+    key_images = []     # 關鍵影格的影像複本
+    last = [None]       # 上次推論的結果
+    last_thumb = None
+    since_key = every
+    stats = {'frames': 0, 'inferred': 0, 'scene_changes': 0, 'gated': 0}
+    presence = {}       # 類別 -> 出現秒數
+    frame_time = step / source.fps
+
+    def flush():
+        keys = [(i, t) for i, t, key, _ in pending if key]
+        results = iter(detector.detect(key_images, [i for i, _ in keys], [t for _, t in keys])) if keys else iter(())
+        images = iter(key_images)
+        for index, timestamp, key, gated in pending:
+            if key:
+                last[0] = next(results)
+                tracks, ids = tracker.update(last[0])
+                image = next(images)
+                if writer is not None and len(tracks):
+                    writer.submit(renderer.render(image, tracks, in_place=True), f'{index:08d}.jpg', copy=False)
+            elif gated and last[0] is not None:
+                tracks, ids = tracker.update(last[0].carry(index, timestamp))
+            else:
+                tracks, ids = tracker.step(index, timestamp)
+            for c in np.unique(tracks.class_ids):
+                name = detector.names.get(int(c), str(int(c)))
+                presence[name] = presence.get(name, 0.0) + frame_time
+            if log is not None:
+                log.append(tracks, track_ids=ids.tolist(), keyframe=key)
+        stats['inferred'] += len(keys)
+        pending.clear()
+        key_images.clear()
+
+    start = time.perf_counter()
+    try:
+        for frame in source:
+            stats['frames'] += 1
+            thumb = thumbnail(frame.image)
+            scene_change = last_thumb is not None and bool(np.abs(thumb - last_thumb).mean() > scene_threshold)
+            last_thumb = thumb
+            stats['scene_changes'] += int(scene_change)
+            due = since_key >= every or scene_change
+            key = due
+            gated = False
+            if due and gate is not None:
+                if scene_change:
+                    # 畫面切換一定推論，同時成為新的比較基準
+                    gate.reset()
+                if not gate.check(frame.image):
+                    key = False
+                    gated = True
+                    stats['gated'] += 1
+            # 關鍵影格本身算第 1 張，--every 10 才會剛好每 10 張推論一次
+            since_key = 1 if due else since_key + 1
+            pending.append((frame.index, frame.timestamp, key, gated))
+            if key:
+                key_images.append(frame.image.copy())
+                if len(key_images) >= detector.batch_size:
+                    flush()
+        flush()
+    finally:
+        source.close()
+        if log is not None:
+            log.close()
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    stats['elapsed'] = round(elapsed, 2)
+    stats['fps'] = round(stats['frames'] / max(elapsed, 1e-9), 1)
+    stats['inference_ratio'] = round(stats['inferred'] / max(stats['frames'], 1), 4)
+    stats['presence_seconds'] = {k: round(v, 2) for k, v in sorted(presence.items())}
+    stats['tracks'] = tracker.next_id - 1
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='離線 VOD 角色出現分析')
+    parser.add_argument('video')
+    parser.add_argument('--every', type=int, default=10, help='每幾張影格執行一次偵測')
+    parser.add_argument('--scene-threshold', type=float, default=12.0, help='縮圖平均灰階差超過此值視為畫面切換')
+    parser.add_argument('--step', type=int, default=1, help='每幾張影格解碼一張')
+    parser.add_argument('--detector', choices=['yolo', 'hog'], default='yolo')
+    parser.add_argument('--weights', default=None)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--imgsz', type=int, default=None, help='預設 640，或建議設定檔中的尺寸')
+    parser.add_argument('--tile', type=int, default=None, metavar='SIZE',
+                        help='分塊推論的方塊邊長（原圖像素，例如 640），遠處的小目標較不會漏掉')
+    parser.add_argument('--gate', type=float, default=None, metavar='THRESHOLD',
+                        help='關鍵影格與上次推論影格的區塊灰階差低於此值時跳過推論（例如 3）')
+    parser.add_argument('--max-age', type=float, default=1.0, help='追蹤目標多久沒被偵測到就移除（秒）')
+    parser.add_argument('--output', default=None, help='時間軸輸出路徑，預設為影片旁的 <名稱>_timeline.jsonl')
+    parser.add_argument('--annotate', default=None, metavar='DIR', help='把有目標的關鍵影格畫上標註存到此資料夾')
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.video):
+        print(f"找不到影片: {args.video}")
+        return 1
+    output = args.output or os.path.splitext(args.video)[0] + '_timeline.jsonl'
+    detector = Detector(args.detector, args.weights, args.batch_size, args.imgsz, args.tile)
+    gate = FrameGate(args.gate) if args.gate is not None else None
+    stats = analyze(args.video, detector, args.every, args.scene_threshold, args.step, output, args.max_age, gate,
+                     args.annotate)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    print(f"時間軸已保存到 '{output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())